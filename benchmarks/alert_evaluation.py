@@ -0,0 +1,106 @@
+"""
+Бенчмарк проверки сделок по правилам оповещений.
+
+Сравнивает движок на отсортированных списках с линейным перебором правил
+при разном количестве порогов пересечения цены на одну пару.
+
+Запуск:
+    python -m benchmarks.alert_evaluation --rules 1000 10000 100000
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from benchmarks.report import write_result  # noqa: E402
+from crypto_stream.services.alerts import AlertEngine, Rule  # noqa: E402
+
+
+def random_walk(trades, start=50000.0):
+    """Цены сделок со случайным блужданием"""
+    prices = []
+    price = start
+    for _ in range(trades):
+        price *= 1 + random.gauss(0, 0.0002)
+        prices.append(price)
+    return prices
+
+
+def make_rules(count, start=50000.0):
+    """Пороги пересечения цены в пределах ±20% от начальной цены"""
+    return [
+        Rule(i, 'btcusdt', 'price_cross', random.choice(('above', 'below')),
+             start * random.uniform(0.8, 1.2), 60, True)
+        for i in range(count)
+    ]
+
+
+def linear_scan(rules, prices):
+    """Проверка всех правил на каждой сделке"""
+    fired = 0
+    last = None
+    for price in prices:
+        if last is not None:
+            for rule in rules:
+                if rule.direction == 'above' and last < rule.value <= price:
+                    fired += 1
+                elif rule.direction == 'below' and price <= rule.value < last:
+                    fired += 1
+        last = price
+    return fired
+
+
+def sorted_engine(rules, prices):
+    """Проверка через AlertEngine"""
+    engine = AlertEngine()
+    for rule in rules:
+        engine.add(rule)
+    fired = 0
+    for timestamp, price in enumerate(prices):
+        fired += len(engine.evaluate('btcusdt', timestamp, price, 0.01))
+    return fired
+
+
+def measure(func, rules, prices):
+    started = time.perf_counter()
+    fired = func(rules, prices)
+    return (time.perf_counter() - started) / len(prices), fired
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rules', type=int, nargs='+', default=[100, 1000, 10000, 100000])
+    parser.add_argument('--trades', type=int, default=2000)
+    parser.add_argument('--save', action='store_true', help='Сохранение результатов в benchmarks/results/')
+    args = parser.parse_args()
+
+    random.seed(1)
+    prices = random_walk(args.trades)
+    results = {}
+    for count in args.rules:
+        rules = make_rules(count)
+        engine_time, engine_fired = measure(sorted_engine, rules, prices)
+        scan_time, scan_fired = measure(linear_scan, rules, prices)
+        assert engine_fired == scan_fired
+        results[str(count)] = {
+            'engine_us_per_trade': round(engine_time * 1e6, 2),
+            'linear_us_per_trade': round(scan_time * 1e6, 2),
+            'alerts_fired': engine_fired,
+        }
+
+    if args.save:
+        write_result('alert_evaluation', {'rules': args.rules, 'trades': args.trades}, results)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+Проверка кластерного режима на одной машине: несколько процессов run_ingestor и фейковый Binance.
+
+Запускает локальный сервер Binance (benchmarks/fake_binance.py) и `--nodes` процессов
+инжестора с CLUSTER_ENABLED=true, использующих PostgreSQL и Redis из настроек проекта.
+После распределения пар первый узел завершается через SIGKILL, затем запускается
+снова. Измеряется время перехода его пар к оставшимся узлам и время перебалансировки
+при возвращении, а после остановки — пропуски и дубли идентификаторов сделок в БД.
+
+Запуск:
+    python -m benchmarks.cluster_failover --nodes 3 --pairs 12 --rate 200
+"""
+import os
+import sys
+import time
+import json
+import signal
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+import redis.asyncio as redis  # noqa: E402
+from asgiref.sync import sync_to_async  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+from benchmarks.fake_binance import FakeBinanceServer  # noqa: E402
+from benchmarks.report import write_result  # noqa: E402
+from crypto_stream.models import CryptoPair, PriceUpdate  # noqa: E402
+from crypto_stream.services.cluster import HashRing, LEASE_KEY  # noqa: E402
+
+MANAGE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'manage.py')
+
+
+@sync_to_async
+def prepare_pairs(symbols):
+    """Активные пары бенчмарка без сделок от прошлых запусков"""
+    for symbol in symbols:
+        CryptoPair.objects.update_or_create(symbol=symbol, defaults={'is_active': True})
+    PriceUpdate.objects.filter(pair__symbol__in=symbols).delete()
+
+
+@sync_to_async
+def persisted_trade_ids(symbol):
+    return list(PriceUpdate.objects.filter(pair__symbol=symbol).values_list('trade_id', flat=True))
+
+
+async def start_node(node_id, fake, args):
+    env = dict(
+        os.environ,
+        CLUSTER_ENABLED='true',
+        CLUSTER_NODE_ID=node_id,
+        BINANCE_WEBSOCKET_URI=fake.uri,
+        BINANCE_REST_URI=fake.rest_uri,
+        DATA_SAVE_INTERVAL=str(args.flush_interval),
+    )
+    return await asyncio.create_subprocess_exec(
+        sys.executable, MANAGE, 'run_ingestor', env=env,
+        stdout=asyncio.subprocess.DEVNULL, stderr=None if args.verbose else asyncio.subprocess.DEVNULL
+    )
+
+
+async def owners(connection, symbols):
+    """Текущие владельцы аренд пар"""
+    values = await connection.mget([LEASE_KEY.format(symbol) for symbol in symbols])
+    return {symbol: value.decode() if value else None for symbol, value in zip(symbols, values)}
+
+
+async def wait_for(connection, symbols, expected, timeout):
+    """Ожидание распределения пар `expected(symbol, owner)`, возвращает затраченное время"""
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        current = await owners(connection, symbols)
+        if all(expected(symbol, owner) for symbol, owner in current.items()):
+            return round(time.perf_counter() - started, 2)
+        await asyncio.sleep(0.1)
+    return None
+
+
+async def run(args):
+    symbols = [f"cluster{i:03d}usdt" for i in range(args.pairs)]
+    await prepare_pairs(symbols)
+    fake = FakeBinanceServer(rate=args.rate)
+    await fake.start()
+    connection = redis.Redis.from_url(settings.REDIS_URL)
+    node_ids = [f"node-{i}" for i in range(args.nodes)]
+    nodes = {node_id: await start_node(node_id, fake, args) for node_id in node_ids}
+    ring = HashRing(node_ids)
+    results = {}
+
+    try:
+        results['startup_seconds'] = await wait_for(
+            connection, symbols, lambda symbol, owner: owner == ring.owner(symbol), args.timeout)
+        await asyncio.sleep(args.warmup)
+
+        # Падение узла: его пары должны перейти к остальным после истечения аренды
+        victim = node_ids[0]
+        lost = [symbol for symbol in symbols if ring.owner(symbol) == victim]
+        nodes[victim].send_signal(signal.SIGKILL)
+        await nodes[victim].wait()
+        survivors = HashRing(node_ids[1:])
+        results['failed_node_pairs'] = len(lost)
+        results['failover_seconds'] = await wait_for(
+            connection, lost, lambda symbol, owner: owner == survivors.owner(symbol), args.timeout)
+        await asyncio.sleep(args.warmup)
+
+        # Возвращение узла: пары по кольцу снова переходят к нему
+        nodes[victim] = await start_node(victim, fake, args)
+        results['rebalance_seconds'] = await wait_for(
+            connection, symbols, lambda symbol, owner: owner == ring.owner(symbol), args.timeout)
+        await asyncio.sleep(args.warmup)
+    finally:
+        # SIGINT завершает инжестор штатно: остаток буфера записывается в БД
+        for process in nodes.values():
+            if process.returncode is None:
+                process.send_signal(signal.SIGINT)
+        await asyncio.gather(*(process.wait() for process in nodes.values()))
+        await fake.stop()
+        await connection.aclose()
+
+    missing = duplicates = 0
+    for symbol in symbols:
+        history = fake.history[symbol]
+        if not history:
+            continue
+        ids = await persisted_trade_ids(symbol)
+        missing += len(set(range(history[0]['t'], history[-1]['t'] + 1)) - set(ids))
+        duplicates += len(ids) - len(set(ids))
+    results['emitted_trades'] = fake.sent
+    results['missing_trades'] = missing
+    results['duplicate_trades'] = duplicates
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--nodes', type=int, default=3, help='Количество процессов инжестора')
+    parser.add_argument('--pairs', type=int, default=12, help='Количество пар')
+    parser.add_argument('--rate', type=int, default=200, help='Сделок в секунду на соединение с Binance')
+    parser.add_argument('--warmup', type=float, default=5, help='Пауза между этапами, сек')
+    parser.add_argument('--timeout', type=float, default=60, help='Максимальное ожидание этапа, сек')
+    parser.add_argument('--flush-interval', type=float, default=1, help='DATA_SAVE_INTERVAL узлов, сек')
+    parser.add_argument('--verbose', action='store_true', help='Показывать журнал узлов')
+    parser.add_argument('--output', help='Путь к файлу результата (по умолчанию benchmarks/results/)')
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    params = {key: value for key, value in vars(args).items() if key not in ('output', 'verbose')}
+    path = write_result('cluster_failover', params, results, args.output)
+    print(json.dumps(results, indent=2))
+    print(f"Results saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Локальный сервер, имитирующий WebSocket API Binance.
+
+Отдает сделки по потокам из URL подключения (`/ws/<symbol>@trade/...`) с заданной
+суммарной частотой, поддерживает методы SUBSCRIBE/UNSUBSCRIBE. Сделки генерируются
+синтетически или воспроизводятся из файла с записанными кадрами (JSON по строке
+или сегмент FrameRecorder, допускается сжатие gzip); времена событий `E`/`T`
+заменяются текущими. Идентификаторы сделок последовательны для каждой пары,
+недавние сделки отдаются по HTTP `GET /api/v3/historicalTrades` на том же порту
+(BINANCE_REST_URI), что позволяет проверять дозагрузку при смене владельца пары.
+
+Запуск отдельным процессом:
+    python -m benchmarks.fake_binance --port 9443 --rate 5000
+"""
+import gzip
+import json
+import time
+import random
+import asyncio
+import argparse
+import itertools
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+from collections import defaultdict, deque
+
+import websockets
+
+# Период отправки пачки сообщений, сек
+TICK = 0.01
+# Сделок каждой пары, доступных через /api/v3/historicalTrades
+HISTORY_SIZE = 100000
+
+
+def load_frames(path):
+    """Чтение записанных кадров Binance: по одному JSON-объекту на строку"""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt') as f:
+        # Строки сегментов FrameRecorder начинаются со времени получения и табуляции
+        frames = [json.loads(line.rpartition('\t')[2]) for line in f if line.strip()]
+    return [frame.get('data', frame) for frame in frames if 'e' in frame.get('data', frame)]
+
+
+class FakeBinanceServer:
+    """Сервер потоков сделок для нагрузочного тестирования инжестора"""
+
+    def __init__(self, rate=1000, frames=None, host='127.0.0.1', port=0):
+        self.rate = rate
+        self.frames = frames
+        self.host = host
+        self.port = port
+        self.server = None
+        self.sent = 0
+        self.trade_ids = defaultdict(lambda: itertools.count(1))
+        self.order_ids = itertools.count(1)
+        self.history = defaultdict(lambda: deque(maxlen=HISTORY_SIZE))
+        self.prices = {}
+
+    async def start(self):
+        """Запуск сервера, возвращает URI для BINANCE_WEBSOCKET_URI"""
+        self.server = await websockets.serve(self.handle, self.host, self.port, process_request=self.process_request)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.uri
+
+    @property
+    def uri(self):
+        return f"ws://{self.host}:{self.port}/ws"
+
+    @property
+    def rest_uri(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def process_request(self, path, request_headers):
+        """Ответ на HTTP-запрос /api/v3/historicalTrades вместо установки WebSocket-соединения"""
+        url = urlsplit(path)
+        if url.path != '/api/v3/historicalTrades':
+            return None
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        history = self.history[params['symbol'].lower()]
+        from_id = int(params.get('fromId', 1))
+        limit = int(params.get('limit', 500))
+        # Идентификаторы в истории последовательны, поэтому позиция вычисляется по первому
+        start = max(0, from_id - history[0]['t']) if history else 0
+        trades = [
+            {'id': trade['t'], 'price': trade['p'], 'qty': trade['q'], 'time': trade['T'],
+             'isBuyerMaker': trade['m'], 'isBestMatch': True}
+            for trade in itertools.islice(history, start, start + limit)
+        ]
+        return HTTPStatus.OK, [('Content-Type', 'application/json')], json.dumps(trades).encode()
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, websocket, path=None):
+        """Обслуживание одного соединения инжестора"""
+        path = path or websocket.path
+        streams = dict.fromkeys(stream for stream in path.split('/')[2:] if stream)
+        reader = asyncio.ensure_future(self.read_methods(websocket, streams))
+        try:
+            await self.emit(websocket, streams)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            reader.cancel()
+
+    async def read_methods(self, websocket, streams):
+        """Обработка управляющих сообщений SUBSCRIBE/UNSUBSCRIBE"""
+        async for message in websocket:
+            request = json.loads(message)
+            for stream in request.get('params', []):
+                if request['method'] == 'SUBSCRIBE':
+                    streams[stream] = None
+                elif request['method'] == 'UNSUBSCRIBE':
+                    streams.pop(stream, None)
+            await websocket.send(json.dumps({'result': None, 'id': request.get('id')}))
+
+    async def emit(self, websocket, streams):
+        """Отправка сделок с заданной частотой пачками раз в TICK"""
+        frames = itertools.cycle(self.frames) if self.frames else None
+        started = time.perf_counter()
+        sent = 0
+        while True:
+            await asyncio.sleep(TICK)
+            symbols = [stream.split('@')[0] for stream in streams if stream.endswith('@trade')]
+            if not symbols:
+                continue
+            due = int((time.perf_counter() - started) * self.rate) - sent
+            for _ in range(due):
+                event = self.replayed_trade(next(frames)) if frames else self.synthetic_trade(random.choice(symbols))
+                self.history[event['s'].lower()].append(event)
+                # Компактный JSON, как у Binance
+                await websocket.send(json.dumps(event, separators=(',', ':')))
+            sent += due
+            self.sent += due
+
+    def synthetic_trade(self, symbol):
+        """Сделка со случайным блужданием цены"""
+        price = self.prices.get(symbol, 50000.0) * (1 + random.gauss(0, 0.0001))
+        self.prices[symbol] = price
+        now = int(time.time() * 1000)
+        return {
+            'e': 'trade', 'E': now, 's': symbol.upper(), 't': next(self.trade_ids[symbol]),
+            'p': f"{price:.2f}", 'q': f"{random.uniform(0.0001, 1):.5f}",
+            'b': next(self.order_ids), 'a': next(self.order_ids), 'T': now, 'm': random.random() < 0.5,
+        }
+
+    def replayed_trade(self, frame):
+        """Записанная сделка с текущими временем события и идентификатором"""
+        now = int(time.time() * 1000)
+        return dict(frame, E=now, T=now, t=next(self.trade_ids[frame['s'].lower()]))
+
+
+async def serve_forever(args):
+    frames = load_frames(args.frames) if args.frames else None
+    server = FakeBinanceServer(args.rate, frames, args.host, args.port)
+    print(f"Fake Binance server listening on {await server.start()}")
+    await asyncio.Future()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9443)
+    parser.add_argument('--rate', type=int, default=1000, help='Сделок в секунду на соединение')
+    parser.add_argument('--frames', help='Файл с записанными кадрами Binance')
+    asyncio.run(serve_forever(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Бенчмарк затрат CPU на рассылку одной сделки подписчикам.
+
+Сравнивает прежний путь (каждый потребитель копирует событие и вызывает
+json.dumps) с рассылкой заранее сериализованного сообщения.
+
+Запуск:
+    python -m benchmarks.fanout_serialization --subscribers 1 100 1000 10000
+"""
+import os
+import sys
+import time
+import json
+import asyncio
+import argparse
+from decimal import Decimal
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from benchmarks.report import write_result  # noqa: E402
+from crypto_stream.consumers import CryptoConsumer  # noqa: E402
+from crypto_stream.services.encoding import build_price_update, encode_price_update  # noqa: E402
+
+
+class BenchConsumer(CryptoConsumer):
+    """Потребитель без реального соединения: отправка кадра ничего не делает"""
+    last_stream_id = None
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        pass
+
+
+def legacy_event():
+    """Событие в прежнем формате с отдельными полями"""
+    return {
+        "type": "send_price_update",
+        "symbol": "btcusdt",
+        "price": "50000.01000000",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "trade_id": 3120145678,
+        "quantity": "0.00125000"
+    }
+
+
+def pre_encoded_event():
+    """Событие с сообщением, сериализованным один раз на стороне инжестора"""
+    message = build_price_update(
+        'btcusdt', Decimal('50000.01000000'), datetime.now(timezone.utc),
+        3120145678, Decimal('0.00125000')
+    )
+    return encode_price_update(message)
+
+
+async def fan_out(consumers, make_event, trades):
+    """Рассылка `trades` сделок всем потребителям, возвращает CPU-время на сделку"""
+    started = time.process_time()
+    for _ in range(trades):
+        event = make_event()
+        for consumer in consumers:
+            await consumer.send_price_update(event)
+    return (time.process_time() - started) / trades
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--subscribers', type=int, nargs='+', default=[1, 10, 100, 1000, 10000])
+    parser.add_argument('--trades', type=int, default=20)
+    parser.add_argument('--json', action='store_true', help='Вывод результатов в JSON')
+    parser.add_argument('--save', action='store_true', help='Сохранение результатов в benchmarks/results/')
+    args = parser.parse_args()
+
+    results = []
+    for count in args.subscribers:
+        consumers = [BenchConsumer() for _ in range(count)]
+        legacy = asyncio.run(fan_out(consumers, legacy_event, args.trades))
+        encoded = asyncio.run(fan_out(consumers, pre_encoded_event, args.trades))
+        results.append({
+            'subscribers': count,
+            'legacy_cpu_us_per_trade': round(legacy * 1e6, 1),
+            'pre_encoded_cpu_us_per_trade': round(encoded * 1e6, 1),
+            'speedup': round(legacy / encoded, 2) if encoded else None,
+        })
+
+    if args.save:
+        params = {'subscribers': args.subscribers, 'trades': args.trades}
+        write_result('fanout_serialization', params, {str(row['subscribers']): row for row in results})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'subscribers':>12} {'legacy, us':>14} {'pre-encoded, us':>16} {'speedup':>8}")
+    for row in results:
+        print(f"{row['subscribers']:>12} {row['legacy_cpu_us_per_trade']:>14} "
+              f"{row['pre_encoded_cpu_us_per_trade']:>16} {row['speedup']:>8}")
+
+
+if __name__ == '__main__':
+    main()
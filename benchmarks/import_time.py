@@ -0,0 +1,106 @@
+"""
+Время запуска веб-процесса по профилю импорта `python -X importtime`.
+
+В отдельном процессе импортируется точка входа (по умолчанию ASGI-приложение
+и URL-маршруты, которые загружаются при первом HTTP-запросе). Результат: время
+до готовности, суммарное время импорта, самые дорогие модули и пакеты, а также
+загружены ли модули стека инжестора (websockets, aiohttp, NumPy).
+
+Запуск:
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --target config.asgi --repeat 5 --top 20
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.report import write_result  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INGEST_MODULES = ('websockets', 'aiohttp', 'numpy', 'crypto_stream.services.binance_client')
+
+
+def parse_importtime(stderr):
+    """Строки `import time: self | cumulative | module` в список (модуль, собственное, суммарное время в мкс)"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def profile(targets, settings_module):
+    """Один запуск интерпретатора с импортом `targets`, возвращает время и профиль"""
+    code = '; '.join(f"import {target}" for target in targets)
+    pythonpath = os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')]))
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings_module, 'PYTHONPATH': pythonpath}
+    started = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    return time.perf_counter() - started, parse_importtime(process.stderr)
+
+
+def run(args):
+    walls, profiles = [], []
+    for _ in range(args.repeat):
+        wall, rows = profile(args.target, args.settings)
+        walls.append(wall)
+        profiles.append(rows)
+
+    # Профиль медианного по времени запуска
+    rows = profiles[walls.index(sorted(walls)[len(walls) // 2])]
+    loaded = {name for name, _, _ in rows}
+    packages = {}
+    for name, self_us, _ in rows:
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0) + self_us
+
+    return {
+        'startup_seconds': {
+            'median': round(statistics.median(walls), 4),
+            'min': round(min(walls), 4),
+            'max': round(max(walls), 4),
+        },
+        'import_seconds': round(sum(self_us for _, self_us, _ in rows) / 1e6, 4),
+        'modules': len(rows),
+        'ingest_modules_loaded': sorted(module for module in INGEST_MODULES if module in loaded),
+        'top_modules_ms': {
+            name: round(cumulative_us / 1000, 2)
+            for name, _, cumulative_us in sorted(rows, key=lambda row: row[2], reverse=True)[:args.top]
+        },
+        'top_packages_ms': {
+            name: round(self_us / 1000, 2)
+            for name, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--target', nargs='+', default=['config.asgi', 'config.urls'], help='Импортируемые модули')
+    parser.add_argument('--settings', default=os.environ.get('DJANGO_SETTINGS_MODULE', 'config.settings'),
+                        help='Модуль настроек Django')
+    parser.add_argument('--repeat', type=int, default=5, help='Количество запусков')
+    parser.add_argument('--top', type=int, default=15, help='Сколько модулей и пакетов показать')
+    parser.add_argument('--output', help='Путь к файлу результата (по умолчанию benchmarks/results/)')
+    args = parser.parse_args()
+
+    results = run(args)
+    params = {key: value for key, value in vars(args).items() if key != 'output'}
+    path = write_result('import_time', params, results, args.output)
+    print(json.dumps(results, indent=2))
+    print(f"Results saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
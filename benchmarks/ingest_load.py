@@ -0,0 +1,177 @@
+"""
+Нагрузочный тест конвейера: фейковый Binance -> инжестор -> Channels -> WebSocket-клиенты.
+
+Запускает локальный сервер Binance (benchmarks/fake_binance.py), настоящий
+BinanceWebsocketClient с PostgreSQL и Redis из настроек проекта и рой клиентов,
+подключенных к `ws/crypto/<symbol>/` работающего веб-сервера (daphne) в отдельном
+процессе. Веб-сервер должен использовать те же PostgreSQL и Redis.
+
+Результат: устойчивая частота сообщений (отправлено / принято инжестором /
+доставлено клиентам), p50/p99 задержки от времени сделки до клиента, скорость
+записи в БД и потребление памяти инжестором — в формате benchmarks/report.py.
+
+Запуск:
+    daphne -p 8000 config.asgi:application &
+    python -m benchmarks.ingest_load --pairs 10 --rate 2000 --clients 500 --duration 30
+"""
+import os
+import sys
+import time
+import json
+import asyncio
+import argparse
+import resource
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+import websockets  # noqa: E402
+from asgiref.sync import sync_to_async  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+from benchmarks.fake_binance import FakeBinanceServer, load_frames  # noqa: E402
+from benchmarks.report import write_result  # noqa: E402
+from crypto_stream.models import PriceUpdate  # noqa: E402
+from crypto_stream.services.metrics import FRAMES_RECEIVED  # noqa: E402
+
+
+def percentile(values, quantile):
+    """Перцентиль отсортированной выборки"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * quantile / 100))]
+
+
+def rss_mb():
+    """Текущий RSS процесса, МБ"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return round(int(line.split()[1]) / 1024, 1)
+    return None
+
+
+async def run_client(url, stats, measuring):
+    """Клиент WebSocket: учет полученных обновлений и задержки от времени сделки"""
+    try:
+        async with websockets.connect(url, max_queue=None) as websocket:
+            stats['connected'] += 1
+            async for message in websocket:
+                data = json.loads(message)
+                if data.get('type') != 'price_update' or not measuring.is_set():
+                    continue
+                stats['received'] += 1
+                if 'event_time' in data:
+                    stats['latencies'].append(time.time() * 1000 - data['event_time'])
+    except (OSError, websockets.exceptions.WebSocketException):
+        stats['errors'] += 1
+
+
+async def client_swarm(server, symbols, clients, warmup, duration):
+    stats = {'connected': 0, 'received': 0, 'errors': 0, 'latencies': []}
+    measuring = asyncio.Event()
+    tasks = [
+        asyncio.ensure_future(run_client(f"{server}/ws/crypto/{symbols[i % len(symbols)]}/", stats, measuring))
+        for i in range(clients)
+    ]
+    await asyncio.sleep(warmup)
+    measuring.set()
+    await asyncio.sleep(duration)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return stats
+
+
+def swarm_process(server, symbols, clients, warmup, duration, queue):
+    """Рой клиентов в отдельном процессе, чтобы не влиять на замеры инжестора"""
+    stats = asyncio.run(client_swarm(server, symbols, clients, warmup, duration))
+    latencies = sorted(stats.pop('latencies'))
+    stats['latency_ms'] = {
+        'p50': round(percentile(latencies, 50), 2) if latencies else None,
+        'p99': round(percentile(latencies, 99), 2) if latencies else None,
+        'max': round(latencies[-1], 2) if latencies else None,
+    }
+    queue.put(stats)
+
+
+async def run_ingestor(args, symbols):
+    """Прогон инжестора против фейкового сервера, возвращает его показатели"""
+    frames = load_frames(args.frames) if args.frames else None
+    fake = FakeBinanceServer(rate=args.rate, frames=frames)
+    settings.BINANCE_WEBSOCKET_URI = await fake.start()
+    settings.CRYPTO_PAIRS = symbols
+    settings.DATA_SAVE_INTERVAL = args.flush_interval
+    settings.LATENCY_TRACING = True
+
+    from crypto_stream.services.binance_client import BinanceWebsocketClient
+    client = BinanceWebsocketClient()
+    task = asyncio.ensure_future(client.start())
+
+    await asyncio.sleep(args.warmup)
+    count_rows = sync_to_async(PriceUpdate.objects.filter(pair__symbol__in=symbols).count)
+    rows_before, frames_before, sent_before = await count_rows(), FRAMES_RECEIVED.labels().value, fake.sent
+    started = time.perf_counter()
+    await asyncio.sleep(args.duration)
+    elapsed = time.perf_counter() - started
+    sent, frames_received = fake.sent - sent_before, FRAMES_RECEIVED.labels().value - frames_before
+
+    # Отмена задачи сохраняет остаток буфера в БД, эти строки тоже учитываются
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    await client.stop()
+    rows = await count_rows() - rows_before
+    await fake.stop()
+
+    return {
+        'elapsed_seconds': round(elapsed, 2),
+        'sent_msgs_per_sec': round(sent / elapsed, 1),
+        'ingested_msgs_per_sec': round(frames_received / elapsed, 1),
+        'db_rows_per_sec': round(rows / elapsed, 1),
+        'ingestor_rss_mb': rss_mb(),
+        'ingestor_peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pairs', type=int, default=10, help='Количество пар')
+    parser.add_argument('--rate', type=int, default=1000, help='Сделок в секунду на соединение с Binance')
+    parser.add_argument('--clients', type=int, default=100, help='Количество WebSocket-клиентов')
+    parser.add_argument('--server', default='ws://127.0.0.1:8000', help='Адрес веб-сервера Channels')
+    parser.add_argument('--duration', type=float, default=30, help='Длительность замера, сек')
+    parser.add_argument('--warmup', type=float, default=5, help='Прогрев перед замером, сек')
+    parser.add_argument('--flush-interval', type=float, default=settings.DATA_SAVE_INTERVAL)
+    parser.add_argument('--frames', help='Файл с записанными кадрами Binance вместо синтетических сделок')
+    parser.add_argument('--output', help='Путь к файлу результата (по умолчанию benchmarks/results/)')
+    args = parser.parse_args()
+
+    symbols = [f"bench{i:03d}usdt" for i in range(args.pairs)]
+    queue = multiprocessing.Queue()
+    swarm = multiprocessing.Process(
+        target=swarm_process, args=(args.server, symbols, args.clients, args.warmup, args.duration, queue)
+    )
+    swarm.start()
+    ingestor = asyncio.run(run_ingestor(args, symbols))
+    clients = queue.get()
+    swarm.join()
+
+    results = dict(ingestor)
+    results['delivered_msgs_per_sec'] = round(clients['received'] / ingestor['elapsed_seconds'], 1)
+    results['latency_ms'] = clients['latency_ms']
+    results['clients_connected'] = clients['connected']
+    results['client_errors'] = clients['errors']
+
+    params = {key: value for key, value in vars(args).items() if key != 'output'}
+    path = write_result('ingest_load', params, results, args.output)
+    print(json.dumps(results, indent=2))
+    print(f"Results saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Масштабирование конвейерного режима инжестора по числу процессов-обработчиков.
+
+Для каждого значения `--workers` передает заранее сгенерированные кадры сделок
+через IngestPipeline и ждет, пока обработчики разберут их и запишут в БД
+(запрос flush). Значение 0 — обработка в одном процессе, как без конвейера.
+Результат: кадров в секунду и ускорение относительно одного процесса.
+
+Запуск (PostgreSQL и Redis из настроек проекта):
+    python -m benchmarks.pipeline_scaling --workers 0 1 2 4 8 --frames 200000 --pairs 32
+    python -m benchmarks.pipeline_scaling --no-persist --no-broadcast  # только разбор
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from asgiref.sync import sync_to_async  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+from benchmarks.fake_binance import FakeBinanceServer  # noqa: E402
+from benchmarks.report import write_result  # noqa: E402
+from crypto_stream.models import CryptoPair, PriceUpdate  # noqa: E402
+from crypto_stream.services.binance_client import BinanceWebsocketClient  # noqa: E402
+from crypto_stream.services.pipeline import IngestPipeline, PipelineWorker  # noqa: E402
+
+
+@sync_to_async
+def prepare_pairs(symbols):
+    for symbol in symbols:
+        CryptoPair.objects.update_or_create(symbol=symbol, defaults={'is_active': True})
+
+
+@sync_to_async
+def delete_trades(symbols):
+    PriceUpdate.objects.filter(pair__symbol__in=symbols).delete()
+
+
+def generate_frames(symbols, count):
+    fake = FakeBinanceServer()
+    return [json.dumps(fake.synthetic_trade(symbols[i % len(symbols)]), separators=(',', ':')) for i in range(count)]
+
+
+async def run_single(frames, options):
+    """Обработка всех кадров в текущем процессе"""
+    client = BinanceWebsocketClient(record_frames=False, pipeline=False)
+    worker = PipelineWorker(0, None, None, options)
+    worker.client = client
+    client.event_log = None
+    if not options['broadcast']:
+        client.broadcast = worker.discard
+    if not options['persist']:
+        client.save_price_updates = worker.discard_buffers
+
+    started = time.perf_counter()
+    for frame in frames:
+        await client.process_message(frame)
+    if client.has_pending_data():
+        await client.save_price_updates()
+    return time.perf_counter() - started
+
+
+async def run_pipeline(frames, workers, options):
+    """Обработка кадров процессами-обработчиками, время до подтверждения записи"""
+    client = BinanceWebsocketClient(record_frames=False, pipeline=False)
+    pipeline = IngestPipeline(client, workers=workers, options=options)
+    await pipeline.start()
+    # Ожидание запуска обработчиков (импорт Django) не входит в замер
+    await pipeline.flush(timeout=120)
+
+    started = time.perf_counter()
+    for frame in frames:
+        await pipeline.dispatch(frame, time.time())
+    await pipeline.flush(timeout=600)
+    elapsed = time.perf_counter() - started
+    await pipeline.stop()
+    return elapsed
+
+
+async def run(args):
+    symbols = [f"pipe{i:03d}usdt" for i in range(args.pairs)]
+    await prepare_pairs(symbols)
+    frames = generate_frames(symbols, args.frames)
+    options = {'persist': not args.no_persist, 'broadcast': not args.no_broadcast}
+    settings.DATA_SAVE_INTERVAL = args.flush_interval
+
+    results = {'cpu_count': os.cpu_count()}
+    baseline = None
+    for workers in args.workers:
+        await delete_trades(symbols)
+        elapsed = await (run_single(frames, options) if workers == 0 else run_pipeline(frames, workers, options))
+        rate = len(frames) / elapsed
+        baseline = baseline or rate
+        results[f"workers_{workers}"] = {
+            'msgs_per_sec': round(rate, 1),
+            'speedup': round(rate / baseline, 2),
+        }
+        print(f"workers={workers}: {rate:.0f} frames/s")
+    await delete_trades(symbols)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 1, 2, 4], help='Числа обработчиков')
+    parser.add_argument('--frames', type=int, default=100000, help='Кадров на прогон')
+    parser.add_argument('--pairs', type=int, default=32, help='Количество пар')
+    parser.add_argument('--flush-interval', type=float, default=1, help='DATA_SAVE_INTERVAL, сек')
+    parser.add_argument('--no-persist', action='store_true', help='Не записывать сделки в БД')
+    parser.add_argument('--no-broadcast', action='store_true', help='Не транслировать обновления')
+    parser.add_argument('--output', help='Путь к файлу результата (по умолчанию benchmarks/results/)')
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    params = {key: value for key, value in vars(args).items() if key != 'output'}
+    path = write_result('pipeline_scaling', params, results, args.output)
+    print(json.dumps(results, indent=2))
+    print(f"Results saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
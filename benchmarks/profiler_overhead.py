@@ -0,0 +1,91 @@
+"""
+Накладные расходы выборочного профилирования на горячем пути инжестора.
+
+Синтетический поток сделок разбирается и кодируется так же, как в TradeHandler
+(json.loads, Decimal, build_price_update, encode_price_update), сначала без
+профилировщика, затем с ним. Результат — время на сделку и замедление в процентах.
+
+Запуск:
+    python -m benchmarks.profiler_overhead --trades 200000 --interval 0.01
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from decimal import Decimal
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from benchmarks.report import write_result  # noqa: E402
+from crypto_stream.services.encoding import build_price_update, encode_price_update  # noqa: E402
+from crypto_stream.services.profiling import SamplingProfiler, hot_path  # noqa: E402
+
+
+def generate_frames(count):
+    """Кадры trade Binance для BTCUSDT"""
+    return [json.dumps({
+        "e": "trade", "E": 1672515782136 + trade_id, "s": "BTCUSDT", "t": trade_id,
+        "p": f"{50000 + trade_id % 100}.{trade_id % 100:02d}", "q": "0.01200000",
+        "b": trade_id, "a": trade_id + 1, "T": 1672515782136 + trade_id, "m": trade_id % 2 == 0,
+    }) for trade_id in range(count)]
+
+
+@hot_path('benchmark_trade')
+def handle(frame):
+    data = json.loads(frame)
+    message = build_price_update(
+        data['s'].lower(), Decimal(data['p']),
+        datetime.fromtimestamp(data['T'] / 1000, tz=timezone.utc), data['t'], Decimal(data['q'])
+    )
+    return encode_price_update(message)
+
+
+def run(frames):
+    started = time.perf_counter()
+    for frame in frames:
+        handle(frame)
+    return (time.perf_counter() - started) / len(frames) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--trades', type=int, default=200000, help='Количество сделок')
+    parser.add_argument('--interval', type=float, default=0.01, help='PROFILING_INTERVAL, сек')
+    parser.add_argument('--output', help='Путь к файлу результата (по умолчанию benchmarks/results/)')
+    args = parser.parse_args()
+
+    frames = generate_frames(args.trades)
+    run(frames[:10000])  # Прогрев
+
+    baseline = run(frames)
+    profiler = SamplingProfiler(interval=args.interval)
+    profiler.start()
+    try:
+        profiled = run(frames)
+    finally:
+        profiler.stop()
+
+    results = {
+        'baseline_us_per_trade': round(baseline, 3),
+        'profiled_us_per_trade': round(profiled, 3),
+        'overhead_percent': round((profiled / baseline - 1) * 100, 2),
+        'samples': profiler.samples,
+        'stacks': len(profiler.stacks),
+    }
+    for name, value in results.items():
+        print(f"{name:>22}: {value}")
+
+    params = {key: value for key, value in vars(args).items() if key != 'output'}
+    path = write_result('profiler_overhead', params, results, args.output)
+    print(f"Results saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
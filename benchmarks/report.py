@@ -0,0 +1,103 @@
+"""
+Единый формат результатов бенчмарков и сравнение с эталонным прогоном.
+
+Результат сохраняется в JSON:
+    {"benchmark": ..., "created_at": ..., "git_commit": ..., "python": ...,
+     "params": {...}, "results": {...}}
+
+Сравнение двух файлов:
+    python -m benchmarks.report benchmarks/results/baseline.json benchmarks/results/new.json
+"""
+import os
+import sys
+import json
+import argparse
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# Метрики, у которых меньшее значение лучше; для остальных лучше большее
+LOWER_IS_BETTER = ('latency', 'rss', '_us_', 'cpu', 'seconds', 'errors', 'dropped', 'missing', 'duplicate')
+
+
+def git_commit():
+    """Текущий коммит репозитория, если он доступен"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_result(benchmark, params, results, path=None):
+    """Сохранение результата прогона, возвращает путь к файлу"""
+    created_at = datetime.now(timezone.utc)
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{benchmark}-{created_at:%Y%m%dT%H%M%S}.json")
+    document = {
+        'benchmark': benchmark,
+        'created_at': created_at.isoformat(),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'host': platform.node(),
+        'params': params,
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2)
+    return path
+
+
+def flatten(results, prefix=''):
+    """Плоский словарь числовых метрик вида {'latency_ms.p99': 12.5}"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(baseline, current, threshold=0.1):
+    """Сравнение результатов, возвращает строки (метрика, было, стало, изменение, регрессия)"""
+    before, after = flatten(baseline['results']), flatten(current['results'])
+    rows = []
+    for name in sorted(before.keys() & after.keys()):
+        old, new = before[name], after[name]
+        change = (new - old) / old if old else 0.0
+        lower_is_better = any(marker in name for marker in LOWER_IS_BETTER)
+        regression = change > threshold if lower_is_better else change < -threshold
+        rows.append((name, old, new, change, regression))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сравнение результатов бенчмарков')
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Допустимое ухудшение (доля)')
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    if baseline['params'] != current['params']:
+        print("Warning: benchmark parameters differ, results may not be comparable")
+
+    rows = compare(baseline, current, args.threshold)
+    print(f"{'metric':<40} {'baseline':>14} {'current':>14} {'change':>9}")
+    for name, old, new, change, regression in rows:
+        mark = '  REGRESSION' if regression else ''
+        print(f"{name:<40} {old:>14} {new:>14} {change:>+8.1%}{mark}")
+    sys.exit(1 if any(row[4] for row in rows) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Размер сделки на проводе и стоимость ее разбора клиентом для подпротоколов ws/crypto/.
+
+Сделки синтетического потока кодируются так же, как в инжесторе и потребителях
+(кадр каждой кодировки строится один раз на сделку), затем для каждой кодировки
+считаются средний размер кадра и время декодирования на клиенте.
+
+Запуск:
+    python -m benchmarks.wire_formats --trades 100000
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from decimal import Decimal
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+import msgpack  # noqa: E402
+
+from benchmarks.report import write_result  # noqa: E402
+from crypto_stream.services.encoding import (  # noqa: E402
+    TICK, TICK_DELTA, TICK_DIFF, FrameCache, binary_frame, build_price_update, delta_frame, encode_binary,
+    encode_price_update, inflate, price_tick,
+)
+
+
+def generate_events(count):
+    """События channel layer для случайного блуждания цены BTCUSDT"""
+    price = Decimal('50000.00')
+    timestamp = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    events = []
+    for trade_id in range(3120000000, 3120000000 + count):
+        price += Decimal(random.randint(-50, 50)) / 100
+        timestamp += timedelta(milliseconds=random.randint(0, 40))
+        quantity = Decimal(random.randint(1, 500000)) / 10 ** 6
+        message = build_price_update('btcusdt', price, timestamp, trade_id, quantity)
+        tick = price_tick(price, timestamp, trade_id, quantity)
+        events.append(encode_binary(encode_price_update(message), tick))
+    return events
+
+
+def delta_frames(events):
+    """Кадры клиента crypto.struct.delta, получившего все сделки"""
+    frames, previous = [], None
+    for event in events:
+        frames.append(delta_frame(event['tick'], previous))
+        previous = event['tick']
+    return frames
+
+
+def decode_delta(frames):
+    """Восстановление сделок из полных записей и разностей"""
+    last = None
+    for frame in frames:
+        if frame[0] == TICK_DIFF:
+            _, trade_id, timestamp, price, quantity = TICK_DELTA.unpack(frame)
+            last = (last[0] + trade_id, last[1] + timestamp, last[2] + price, quantity)
+        else:
+            last = TICK.unpack(frame)[1:]
+
+
+FORMATS = {
+    'json': (lambda events: [event['text'].encode() for event in events],
+             lambda frames: [json.loads(frame) for frame in frames]),
+    'json_deflate': (lambda events: [FrameCache.encoders['deflate'](event) for event in events],
+                     lambda frames: [json.loads(inflate(frame)) for frame in frames]),
+    'msgpack': (lambda events: [FrameCache.encoders['msgpack'](event) for event in events],
+                lambda frames: [msgpack.unpackb(frame) for frame in frames]),
+    'struct': (lambda events: [binary_frame('struct', event) for event in events],
+               lambda frames: [TICK.unpack(frame) for frame in frames]),
+    'struct_delta': (delta_frames, decode_delta),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--trades', type=int, default=100000, help='Количество сделок')
+    parser.add_argument('--output', help='Путь к файлу результата (по умолчанию benchmarks/results/)')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    events = generate_events(args.trades)
+    results = {'ingest_encode_us_per_trade': round((time.perf_counter() - started) / args.trades * 1e6, 2)}
+
+    for name, (encode, decode) in FORMATS.items():
+        started = time.perf_counter()
+        frames = encode(events)
+        encoded = time.perf_counter() - started
+        started = time.perf_counter()
+        decode(frames)
+        elapsed = time.perf_counter() - started
+        results[name] = {
+            'bytes_per_trade': round(sum(map(len, frames)) / len(frames), 1),
+            'encode_us_per_trade': round(encoded / len(frames) * 1e6, 3),
+            'decode_us_per_trade': round(elapsed / len(frames) * 1e6, 3),
+        }
+        print(f"{name:>14}: {results[name]['bytes_per_trade']:>6} bytes, "
+              f"{results[name]['encode_us_per_trade']:>6} us to encode, "
+              f"{results[name]['decode_us_per_trade']:>6} us to decode")
+
+    params = {key: value for key, value in vars(args).items() if key != 'output'}
+    path = write_result('wire_formats', params, results, args.output)
+    print(f"Results saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
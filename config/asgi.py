@@ -1,20 +1,29 @@
 import os
-import django
 
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
-django.setup()
 
-from crypto_stream.routing import websocket_urlpatterns  # noqa
+# get_asgi_application() настраивает Django; маршруты WebSocket импортируются после него.
+# Потребители не загружают стек инжестора (websockets, aiohttp, NumPy) при запуске
+http_application = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from channels.auth import AuthMiddlewareStack  # noqa: E402
+
+from django.conf import settings  # noqa: E402
+from crypto_stream.routing import websocket_urlpatterns  # noqa: E402
+
+# Непрерывное профилирование веб-процесса, стеки отдает /profile
+if settings.PROFILING_ENABLED:
+    from crypto_stream.services.profiling import get_profiler
+    get_profiler().start()
 
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": http_application,
     "websocket": AuthMiddlewareStack(
         URLRouter(
             websocket_urlpatterns
         )
     ),
-})
\ No newline at end of file
+})
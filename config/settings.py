@@ -72,13 +72,17 @@ DATABASES = {
     }
 }
 
+# Redis
+REDIS_HOST = os.environ.get('REDIS_HOST', 'localhost')
+REDIS_PORT = int(os.environ.get('REDIS_PORT', 6379))
+REDIS_URL = f'redis://{REDIS_HOST}:{REDIS_PORT}/0'
+
 # Channels
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
         'CONFIG': {
-            'hosts': [(os.environ.get('REDIS_HOST', 'localhost'),
-                       int(os.environ.get('REDIS_PORT', 6379)))],
+            'hosts': [(REDIS_HOST, REDIS_PORT)],
         },
     },
 }
@@ -113,6 +117,115 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Binance WebSocket Settings
-BINANCE_WEBSOCKET_URI = 'wss://stream.binance.com:9443/ws'
+BINANCE_WEBSOCKET_URI = os.environ.get('BINANCE_WEBSOCKET_URI', 'wss://stream.binance.com:9443/ws')
 CRYPTO_PAIRS = ['btcusdt', 'ethusdt']  # Пары криптовалют для отслеживания
-DATA_SAVE_INTERVAL = 60  # Интервал сохранения данных в секундах
\ No newline at end of file
+CRYPTO_DEFAULT_STREAMS = ['trade']  # Потоки, на которые подписывается пара по умолчанию
+# Потоки для отдельных пар, например {'ethusdt': ['aggTrade', 'kline_1m', 'miniTicker', 'bookTicker']}
+CRYPTO_PAIR_STREAMS = {}
+DATA_SAVE_INTERVAL = float(os.environ.get('DATA_SAVE_INTERVAL', 60))  # Максимальный интервал сохранения данных в секундах
+# Адаптивная запись: размер пачки по измеренной длительности вставки (False — запись раз в DATA_SAVE_INTERVAL)
+FLUSH_ADAPTIVE = os.environ.get('FLUSH_ADAPTIVE', 'true').lower() == 'true'
+FLUSH_TARGET_LATENCY = 0.25  # Целевая p99 длительность записи пачки в секундах
+FLUSH_MIN_ROWS = 500  # Меньшие пачки записываются только по DATA_SAVE_INTERVAL
+FLUSH_MAX_ROWS = 50000  # Максимальный размер пачки
+FLUSH_MIN_INTERVAL = 0.05  # Минимальный интервал между записями в секундах
+FLUSH_MAX_BUFFER_ROWS = 200000  # Предел строк в буфере: при превышении запись выполняется сразу
+FLUSH_WINDOW = 64  # Записей, по которым оценивается длительность вставки
+HEALTH_MAX_TRADE_AGE = 300  # /health отвечает 503, если последняя сделка активной пары старше (секунд)
+INGESTOR_METRICS_PORT = None  # Порт HTTP-сервера метрик процесса run_ingestor (None — отключен)
+WS_BINARY_PROTOCOLS = True  # Бинарные подпротоколы и сжатие JSON для ws/crypto/ (инжестор добавляет к сделке запись struct)
+LATENCY_TRACING = os.environ.get('LATENCY_TRACING', 'false').lower() == 'true'  # Отметки времени события, получения и отправки в обновлениях цен
+LATENCY_SAMPLE_RATE = 0.01  # Доля доставок клиентам, учитываемых в задержке доставки
+LATENCY_PUBLISH_INTERVAL = 5  # Период отправки счетчиков задержек процесса в Redis в секундах
+LATENCY_WINDOW = 300  # Окно перцентилей /api/latency/ в секундах
+BINANCE_REST_URI = os.environ.get('BINANCE_REST_URI', 'https://api.binance.com')
+
+# Управление подписками без перезапуска инжестора
+BINANCE_MAX_STREAMS_PER_CONNECTION = 200  # Потоков на одно соединение с Binance (лимит Binance — 1024)
+SUBSCRIPTION_SYNC_INTERVAL = 30  # Период сверки подписок с таблицей CryptoPair в секундах (0 — отключено)
+SUBSCRIBE_ON_DEMAND = False  # Подписка на пары вне CRYPTO_PAIRS только при наличии клиентов WebSocket
+SUBSCRIBE_ON_DEMAND_GRACE = 30  # Задержка отписки после отключения последнего клиента в секундах
+INGESTOR_CONTROL_GROUP = 'binance_ingestor'  # Группа channel layer для управляющих сообщений инжестору
+
+# Конвейерный режим: разбор и запись в БД в отдельных процессах (0 — все в процессе инжестора)
+PIPELINE_WORKERS = int(os.environ.get('PIPELINE_WORKERS', 0))
+PIPELINE_BATCH_SIZE = 256  # Кадров в пачке, передаваемой обработчику
+PIPELINE_BATCH_INTERVAL = 0.005  # Максимальное ожидание заполнения пачки в секундах
+PIPELINE_QUEUE_SIZE = 1024  # Пачек в очереди обработчика, при заполнении чтение сокета приостанавливается
+PIPELINE_FLUSH_TIMEOUT = 30  # Ожидание записи буферов обработчиками при остановке в секундах
+
+# Журнал упреждающей записи сделок на диске (не задан — сделки буферизуются в памяти)
+SPOOL_DIR = os.environ.get('SPOOL_DIR') or None
+SPOOL_FSYNC_INTERVAL = 0.2  # Интервал записи буфера цен в спул с fsync в секундах
+SPOOL_SEGMENT_BYTES = 16 * 1024 * 1024  # Размер сегмента спула
+SPOOL_MAX_BYTES = 1024 * 1024 * 1024  # Предел размера спула, сверх него удаляются самые старые сегменты
+SPOOL_DRAIN_BATCH = 10000  # Строк в одной записи из спула в БД
+
+# Кластерный режим: пары распределяются между несколькими процессами run_ingestor
+CLUSTER_ENABLED = os.environ.get('CLUSTER_ENABLED', 'false').lower() == 'true'
+CLUSTER_NODE_ID = os.environ.get('CLUSTER_NODE_ID') or None  # По умолчанию <hostname>-<pid>
+CLUSTER_HEARTBEAT_INTERVAL = 1  # Период продления регистрации узла и аренд пар в секундах
+CLUSTER_LEASE_SECONDS = 5  # Срок аренды: через столько секунд пары упавшего узла переходят к другим
+CLUSTER_VIRTUAL_NODES = 64  # Виртуальных узлов на инжестор в кольце согласованного хэширования
+CLUSTER_RESUME_MAX_TRADES = 50000  # Максимум сделок, дозагружаемых через REST API при захвате пары
+
+# Стаканы заявок (поток @depth@100ms)
+ORDER_BOOK_PAIRS = []  # Пары, для которых поддерживается локальный стакан
+ORDER_BOOK_SNAPSHOT_LIMIT = 1000  # Глубина снимка, запрашиваемого через REST API
+ORDER_BOOK_BROADCAST_LEVELS = 10  # Количество уровней, отправляемых клиентам WebSocket
+ORDER_BOOK_PUBLISH_LEVELS = 1000  # Количество уровней, публикуемых в Redis для REST API
+ORDER_BOOK_SNAPSHOT_FIXTURES = None  # Каталог с фикстурами <symbol>.json вместо REST API
+
+# Снимок состояния рынка (последние цены, лучшие цены, 24-часовая статистика) в Redis
+MARKET_STATE_PUBLISH_INTERVAL = 0.5  # Период публикации изменившихся пар инжестором в секундах (0 — отключено)
+MARKET_STATE_TTL = 300  # Время жизни снимка без обновлений в секундах
+MARKET_STATE_CROSS_VIA = 'usdt'  # Общая валюта для синтетических кросс-курсов
+
+# Журнал сделок в Redis Streams для восстановления пропущенных обновлений
+TRADE_STREAM_ENABLED = os.environ.get('TRADE_STREAM_ENABLED', 'false').lower() == 'true'
+TRADE_STREAM_MAXLEN = 10000  # Максимальная длина потока для каждой пары (XADD MAXLEN ~)
+TRADE_STREAM_REPLAY_BATCH = 500  # Размер страницы при повторной отправке пропущенных сделок
+
+# Запись необработанных кадров Binance для воспроизведения (None — отключена)
+FRAME_RECORDER_DIR = os.environ.get('FRAME_RECORDER_DIR') or None
+FRAME_RECORDER_SEGMENT_SECONDS = 300  # Максимальная длительность одного сегмента
+FRAME_RECORDER_SEGMENT_BYTES = 64 * 1024 * 1024  # Максимальный объем сегмента до сжатия
+
+# Холодное хранилище сделок старше горячего окна
+ARCHIVE_HOT_WINDOW_DAYS = 7  # Сколько дней сделок хранится в таблице PriceUpdate
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', os.path.join(BASE_DIR, 'archive'))  # Каталог сегментов (и кэш для S3)
+ARCHIVE_CODEC = 'zlib'  # Сжатие колонок: zlib или zstd (требуется пакет zstandard)
+ARCHIVE_ROW_GROUP_SIZE = 65536  # Строк в группе, группа распаковывается целиком
+ARCHIVE_S3_BUCKET = os.environ.get('ARCHIVE_S3_BUCKET') or None  # Бакет S3-совместимого хранилища (требуется boto3)
+ARCHIVE_S3_ENDPOINT = os.environ.get('ARCHIVE_S3_ENDPOINT') or None  # Адрес хранилища, например MinIO
+ARCHIVE_S3_PREFIX = 'trades/'
+
+# Прореженная история цен
+HISTORY_MAX_POINTS = 5000  # Максимум корзин в ответе /api/history/{symbol}/ с max_points или resolution
+
+# Ограничение запросов истории маркерными корзинами в Redis
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMITS = {  # Емкость корзины и пополнение в токенах в секунду
+    'connection': (20, 2),  # Соединение WebSocket
+    'ip': (60, 5),
+    'api_key': (120, 10),  # Заголовок X-API-Key
+}
+RATE_LIMIT_ROWS_PER_TOKEN = 1000  # Строк ответа на один токен стоимости запроса
+RATE_LIMIT_RANGE_PER_TOKEN = 86400  # Секунд запрошенного интервала на один токен
+RATE_LIMIT_TOKENS_PER_DB_SECOND = 20  # Токенов, списываемых за секунду запросов к БД
+
+# Выборочное профилирование (стеки всех потоков по реальному времени)
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'false').lower() == 'true'  # Непрерывно с запуска процесса
+PROFILING_INTERVAL = 0.01  # Секунд между выборками (100 Гц)
+PROFILING_MAX_DEPTH = 64  # Кадров стека в выборке, от текущего к корню
+PROFILING_MAX_STACKS = 20000  # Различных стеков в памяти, остальные учитываются как [truncated]
+PROFILING_MAX_SECONDS = 60  # Максимальная длительность выборки по запросу /profile
+PROFILING_DIR = os.environ.get('PROFILING_DIR', os.path.join(BASE_DIR, 'profiles'))  # Файлы по сигналу SIGUSR2
+
+# Оповещения о ценах, проверяемые инжестором на каждой сделке
+ALERTS_ENABLED = True
+
+# Технические индикаторы по кэшированным рядам цен
+INDICATOR_MAX_POINTS = 500  # Свечей в ряду пары для одного интервала
+INDICATOR_CACHE_SIZE = 64  # Рядов (пара, интервал) в LRU-кэше процесса
+INDICATOR_STREAM_INTERVAL = 1.0  # Минимальный интервал отправки индикаторов по WebSocket в секундах
@@ -1,7 +1,12 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from crypto_stream.views import health, metrics, profile
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('crypto_stream.urls')),
+    path('metrics', metrics, name='metrics'),
+    path('health', health, name='health'),
+    path('profile', profile, name='profile'),
 ]
\ No newline at end of file
@@ -1,12 +1,66 @@
-from django.contrib import admin
-from .models import CryptoPair, PriceUpdate
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db.models import Sum
+from django.utils.functional import cached_property
+from .models import CryptoPair, PriceUpdate, PairStats, Kline, ArchiveSegment, PriceAlert
+from .services.subscriptions import request_subscription_sync
+from .services.alerts import notify_alert_changed
 
 
 @admin.register(CryptoPair)
 class CryptoPairAdmin(admin.ModelAdmin):
     """Админ-панель для модели CryptoPair"""
-    list_display = ('symbol', 'created_at')
+    list_display = ('symbol', 'is_active', 'trade_count', 'last_trade_at', 'created_at')
+    list_filter = ('is_active',)
+    list_select_related = ('stats',)
     search_fields = ('symbol',)
+    actions = ['activate_pairs', 'deactivate_pairs']
+
+    @admin.action(description='Подписаться на потоки выбранных пар')
+    def activate_pairs(self, request, queryset):
+        """Включение подписки на выбранные пары"""
+        queryset.update(is_active=True)
+        self.sync_subscriptions(request)
+
+    @admin.action(description='Отписаться от потоков выбранных пар')
+    def deactivate_pairs(self, request, queryset):
+        """Отключение подписки на выбранные пары"""
+        queryset.update(is_active=False)
+        self.sync_subscriptions(request)
+
+    @admin.display(description='Сделок')
+    def trade_count(self, obj):
+        stats = getattr(obj, 'stats', None)
+        return stats.trade_count if stats else 0
+
+    @admin.display(description='Последняя сделка')
+    def last_trade_at(self, obj):
+        stats = getattr(obj, 'stats', None)
+        return stats.last_trade_at if stats else None
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        self.sync_subscriptions(request)
+
+    def sync_subscriptions(self, request):
+        """Уведомление инжестора об изменении списка пар"""
+        try:
+            request_subscription_sync()
+        except Exception as e:
+            # Инжестор применит изменения при ближайшей периодической сверке
+            self.message_user(request, f"Ingestor was not notified: {e}", level=messages.WARNING)
+
+
+class PairStatsPaginator(Paginator):
+    """Количество строк PriceUpdate без фильтров берется из PairStats, а не из COUNT(*) по таблице"""
+
+    @cached_property
+    def count(self):
+        if not self.object_list.query.where:
+            total = PairStats.objects.aggregate(total=Sum('trade_count'))['total']
+            if total is not None:
+                return total
+        return super().count
 
 
 @admin.register(PriceUpdate)
@@ -14,5 +68,68 @@ class PriceUpdateAdmin(admin.ModelAdmin):
     """Админ-панель для модели PriceUpdate"""
     list_display = ('pair', 'price', 'timestamp', 'trade_id')
     list_filter = ('pair', 'timestamp')
+    list_select_related = ('pair',)
     search_fields = ('pair__symbol', 'trade_id')
-    date_hierarchy = 'timestamp'
\ No newline at end of file
+    # date_hierarchy выбирает различные даты по всей таблице, фильтр по времени добавляет только условие
+    paginator = PairStatsPaginator
+    show_full_result_count = False
+
+
+@admin.register(PairStats)
+class PairStatsAdmin(admin.ModelAdmin):
+    """Админ-панель статистики пар (только чтение, обновляется инжестором)"""
+    list_display = (
+        'pair', 'trade_count', 'archived_count', 'first_trade_at', 'last_trade_at',
+        'last_price', 'last_trade_id', 'volume'
+    )
+    list_select_related = ('pair',)
+    search_fields = ('pair__symbol',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Kline)
+class KlineAdmin(admin.ModelAdmin):
+    """Админ-панель для модели Kline"""
+    list_display = ('pair', 'interval', 'open_time', 'open', 'high', 'low', 'close', 'volume')
+    list_filter = ('pair', 'interval')
+    search_fields = ('pair__symbol',)
+
+
+@admin.register(ArchiveSegment)
+class ArchiveSegmentAdmin(admin.ModelAdmin):
+    """Админ-панель для сегментов холодного хранилища"""
+    list_display = ('pair', 'start_time', 'end_time', 'row_count', 'size', 'storage')
+    list_filter = ('pair', 'storage')
+    search_fields = ('pair__symbol', 'name')
+
+
+@admin.register(PriceAlert)
+class PriceAlertAdmin(admin.ModelAdmin):
+    """Админ-панель для правил оповещений о цене"""
+    list_display = (
+        'pair', 'owner', 'kind', 'direction', 'value', 'window_seconds', 'is_active', 'trigger_count', 'triggered_at'
+    )
+    list_filter = ('kind', 'is_active', 'pair')
+    search_fields = ('pair__symbol', 'owner__username')
+    raw_id_fields = ('owner',)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        self.notify_ingestor(request, obj.id)
+
+    def delete_model(self, request, obj):
+        alert_id = obj.id
+        super().delete_model(request, obj)
+        self.notify_ingestor(request, alert_id)
+
+    def notify_ingestor(self, request, alert_id):
+        """Уведомление инжестора об изменении правила"""
+        try:
+            notify_alert_changed(alert_id)
+        except Exception as e:
+            self.message_user(request, f"Ingestor was not notified: {e}", level=messages.WARNING)
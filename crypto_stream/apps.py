@@ -1,4 +1,5 @@
 import os
+import sys
 import asyncio
 import threading
 from django.apps import AppConfig
@@ -10,8 +11,9 @@ class CryptoStreamConfig(AppConfig):
     name = 'crypto_stream'
 
     def ready(self):
-        # Проверяем, что это не вызвано командой migrate или другими командами Django
-        if os.environ.get('RUN_MAIN', None) != 'true':
+        # Клиент запускается только в процессе runserver с автоперезагрузкой; migrate,
+        # run_ingestor и другие команды, а также ASGI-серверы не загружают стек инжестора
+        if os.environ.get('RUN_MAIN', None) != 'true' or sys.argv[1:2] != ['runserver']:
             return
 
         # Импортируем здесь, чтобы избежать циклических импортов
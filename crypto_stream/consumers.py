@@ -1,19 +1,41 @@
 import json
+import time
+import base64
+import asyncio
 import logging
+from datetime import datetime
+from urllib.parse import parse_qs
+from django.conf import settings
+from redis.exceptions import RedisError
 from channels.generic.websocket import AsyncWebsocketConsumer
+from asgiref.sync import sync_to_async
 from channels.db import database_sync_to_async
 from .models import CryptoPair, PriceUpdate
+from .serializers import IndicatorRequestSerializer, PriceHistorySerializer
+from .services.encoding import DEFLATE_DICTIONARY, PRICE_SCALE, SUBPROTOCOLS, binary_frame
+from .services.alerts import alert_group
+from .services.event_log import get_event_log, stream_id_key
+from .services.market_state import get_market_snapshot
+from .services.subscriptions import notify_interest
+from .services.latency import LATENCY
+from .services.profiling import hot_path
+from .services.rate_limit import get_async_rate_limiter, history_cost, scope_identities
 
 logger = logging.getLogger(__name__)
 
 
 class CryptoConsumer(AsyncWebsocketConsumer):
     """WebSocket потребитель для работы с данными криптовалют"""
+    encoding = 'json'  # Кодировка сделок согласно подпротоколу клиента
 
     async def connect(self):
         """Обработка подключения клиента к WebSocket"""
         self.symbol = self.scope['url_route']['kwargs']['symbol'].lower()
         self.group_name = f"crypto_{self.symbol}"
+        self.last_stream_id = None  # Последняя запись журнала, отправленная при восстановлении
+        self.interest_registered = False
+        self.last_tick = None  # Последняя сделка, отправленная в бинарном виде (база разностей)
+        self.alert_group = None  # Группа оповещений пользователя по паре
 
         # Проверяем существование запрошенной пары
         if not await self.pair_exists(self.symbol):
@@ -27,14 +49,85 @@ class CryptoConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
-        await self.accept()
+        # Оповещения отправляются только соединениям владельца правил
+        user = self.scope.get('user')
+        if user is not None and user.is_authenticated:
+            self.alert_group = alert_group(user.id, self.symbol)
+            await self.channel_layer.group_add(self.alert_group, self.channel_name)
+
+        subprotocol = self.select_subprotocol()
+        self.encoding = SUBPROTOCOLS.get(subprotocol, 'json')
+        await self.accept(subprotocol=subprotocol)
         logger.info(f"Client connected to WebSocket for {self.symbol}")
 
+        # Параметры кодировки для клиента бинарного подпротокола
+        if self.encoding != 'json':
+            await self.send(text_data=json.dumps({
+                'type': 'protocol',
+                'protocol': subprotocol,
+                'price_scale': PRICE_SCALE,
+                **({'dictionary': base64.b64encode(DEFLATE_DICTIONARY).decode()} if self.encoding == 'deflate' else {}),
+            }))
+
+        # Сообщаем инжестору о клиенте, чтобы он подписался на потоки пары
+        if settings.SUBSCRIBE_ON_DEMAND:
+            await notify_interest(self.symbol, 1)
+            self.interest_registered = True
+
+        # Переподключившийся клиент передает идентификатор последней полученной записи
+        since = parse_qs(self.scope.get('query_string', b'').decode()).get('since', [None])[0]
+        if since and settings.TRADE_STREAM_ENABLED:
+            await self.replay_since(since)
+            return
+
         # Отправляем последнее обновление цены клиенту
         latest_price = await self.get_latest_price(self.symbol)
         if latest_price:
             await self.send(text_data=json.dumps(latest_price))
 
+    def select_subprotocol(self):
+        """Первый поддерживаемый подпротокол из предложенных клиентом"""
+        for name in self.scope.get('subprotocols') or []:
+            if name in SUBPROTOCOLS and (settings.WS_BINARY_PROTOCOLS or SUBPROTOCOLS[name] == 'json'):
+                return name
+        return None
+
+    async def replay_since(self, since):
+        """Повторная отправка сделок из журнала Redis Streams, пропущенных клиентом"""
+        event_log = get_event_log()
+        try:
+            first_id = await event_log.first_id(self.symbol)
+            # Часть пропущенных записей уже вытеснена из ограниченного потока
+            truncated = first_id is not None and stream_id_key(first_id) > stream_id_key(since)
+
+            count = 0
+            cursor = since
+            while True:
+                entries = await event_log.read_since(
+                    self.symbol, cursor, settings.TRADE_STREAM_REPLAY_BATCH
+                )
+                for entry_id, message in entries:
+                    message['stream_id'] = entry_id
+                    await self.send(text_data=json.dumps(message))
+                count += len(entries)
+                if entries:
+                    cursor = entries[-1][0]
+                if len(entries) < settings.TRADE_STREAM_REPLAY_BATCH:
+                    break
+        except (ValueError, RedisError) as e:
+            logger.error(f"Failed to replay trades for {self.symbol} since {since}: {e}")
+            truncated = True
+            count = 0
+            cursor = None
+
+        # Живые обновления, уже отправленные из журнала, будут пропущены
+        self.last_stream_id = stream_id_key(cursor) if cursor else None
+        await self.send(text_data=json.dumps({
+            'type': 'replay_complete',
+            'count': count,
+            'truncated': truncated
+        }))
+
     async def disconnect(self, close_code):
         """Обработка отключения клиента"""
         # Удаляем клиента из группы
@@ -42,6 +135,10 @@ class CryptoConsumer(AsyncWebsocketConsumer):
             self.group_name,
             self.channel_name
         )
+        if self.alert_group:
+            await self.channel_layer.group_discard(self.alert_group, self.channel_name)
+        if self.interest_registered:
+            await notify_interest(self.symbol, -1)
         logger.info(f"Client disconnected from WebSocket for {self.symbol}")
 
     async def receive(self, text_data):
@@ -50,19 +147,49 @@ class CryptoConsumer(AsyncWebsocketConsumer):
             data = json.loads(text_data)
             message_type = data.get('type')
 
+            # Эхо обновления цены от клиента для измерения задержки доставки
+            if message_type == 'latency_echo':
+                self.record_echo(data)
+
             # Обработка запроса на получение истории цен
-            if message_type == 'history':
-                limit = data.get('limit', 50)  # Количество записей (по умолчанию 50)
-                history = await self.get_price_history(self.symbol, limit)
-                await self.send(text_data=json.dumps({
-                    'type': 'history',
-                    'data': history
-                }))
+            elif message_type == 'history':
+                await self.send_history(data)
         except json.JSONDecodeError:
             logger.error(f"Failed to parse message from client: {text_data}")
         except Exception as e:
             logger.error(f"Error processing message from client: {e}")
 
+    async def send_history(self, data):
+        """Ответ на запрос истории с учетом ограничения запросов клиента"""
+        request_serializer = PriceHistorySerializer(data={
+            'symbol': self.symbol,
+            'limit': data.get('limit', 50)  # Количество записей (по умолчанию 50)
+        })
+        if not request_serializer.is_valid():
+            await self.send_error(400, request_serializer.errors)
+            return
+        limit = request_serializer.validated_data['limit']
+
+        limiter = get_async_rate_limiter()
+        identities = scope_identities(self.scope, self.channel_name)
+        wait = await limiter.check(identities, history_cost(limit), 'ws_history')
+        if wait:
+            await self.send_error(429, 'Rate limit exceeded.', retry_after=round(wait, 3))
+            return
+
+        # Время запроса к БД списывается из корзин клиента после ответа
+        started = time.perf_counter()
+        history = await self.get_price_history(self.symbol, limit)
+        await limiter.account(identities, time.perf_counter() - started, 'ws_history')
+        await self.send(text_data=json.dumps({
+            'type': 'history',
+            'data': history
+        }))
+
+    async def send_error(self, code, detail, **extra):
+        """Сообщение об ошибке запроса клиента (коды как у HTTP)"""
+        await self.send(text_data=json.dumps({'type': 'error', 'code': code, 'detail': detail, **extra}))
+
     @database_sync_to_async
     def pair_exists(self, symbol):
         """Проверка существования пары криптовалют"""
@@ -107,11 +234,189 @@ class CryptoConsumer(AsyncWebsocketConsumer):
         except CryptoPair.DoesNotExist:
             return []
 
+    def record_echo(self, data):
+        """Учет задержки по эхо-сообщению клиента с отметками времени обновления"""
+        broadcast_at = data.get('broadcast_at')
+        if not isinstance(broadcast_at, (int, float)):
+            return
+        LATENCY.record('broadcast_to_echo', time.time() - broadcast_at / 1000)
+        client_received_at = data.get('client_received_at')
+        if isinstance(client_received_at, (int, float)):
+            LATENCY.record('broadcast_to_client', (client_received_at - broadcast_at) / 1000)
+
+    def record_delivery(self, event):
+        """Выборочный учет задержки доставки обновления клиенту"""
+        if 'broadcast_at' not in event or not LATENCY.sampled():
+            return
+        now = time.time()
+        LATENCY.record('broadcast_to_deliver', now - event['broadcast_at'] / 1000)
+        if 'event_time' in event:
+            LATENCY.record('exchange_to_deliver', now - event['event_time'] / 1000)
+
+    @hot_path('send_price_update')
     async def send_price_update(self, event):
         """Отправка обновления цены клиенту"""
+        # Пропускаем обновления, уже полученные клиентом при восстановлении из журнала
+        if self.last_stream_id and 'stream_id' in event:
+            if stream_id_key(event['stream_id']) <= self.last_stream_id:
+                return
+            self.last_stream_id = None
+
+        # Клиенту бинарного подпротокола — представление сделки, закодированное инжестором
+        if self.encoding != 'json' and 'tick' in event:
+            await self.send(bytes_data=self.binary_frame(event))
+            self.record_delivery(event)
+            return
+
+        # Заранее сериализованное сообщение пересылаем клиенту как есть
+        if 'bytes' in event:
+            await self.send(bytes_data=event['bytes'])
+            self.record_delivery(event)
+            return
+        if 'text' in event:
+            await self.send(text_data=event['text'])
+            self.record_delivery(event)
+            return
+
         # Исключаем поле 'type', которое используется для маршрутизации события
         message = {k: v for k, v in event.items() if k != 'type'}
         message['type'] = 'price_update'
 
         # Отправка сообщения клиенту
-        await self.send(text_data=json.dumps(message))
\ No newline at end of file
+        await self.send(text_data=json.dumps(message))
+
+    def binary_frame(self, event):
+        """Кадр сделки в кодировке подпротокола клиента"""
+        previous, self.last_tick = self.last_tick, event['tick']
+        return binary_frame(self.encoding, event, previous)
+
+    async def send_stream_event(self, event):
+        """Пересылка события дополнительного потока (свечи, тикеры) клиенту"""
+        await self.send(text_data=event['text'])
+
+    async def send_alert(self, event):
+        """Пересылка сработавшего оповещения о цене клиенту"""
+        await self.send(text_data=event['text'])
+
+
+class OrderBookConsumer(AsyncWebsocketConsumer):
+    """WebSocket потребитель для трансляции верхних уровней стакана заявок"""
+
+    async def connect(self):
+        """Обработка подключения клиента к потоку стакана"""
+        self.symbol = self.scope['url_route']['kwargs']['symbol'].lower()
+        self.group_name = f"depth_{self.symbol}"
+
+        # Стакан поддерживается только для настроенных пар
+        if self.symbol not in settings.ORDER_BOOK_PAIRS:
+            logger.warning(f"Client attempted to connect to order book of untracked pair: {self.symbol}")
+            await self.close()
+            return
+
+        await self.channel_layer.group_add(
+            self.group_name,
+            self.channel_name
+        )
+
+        await self.accept()
+        logger.info(f"Client connected to order book WebSocket for {self.symbol}")
+
+        # Отправляем текущее состояние стакана, опубликованное инжестором
+        try:
+            book = await sync_to_async(get_market_snapshot().read_book)(
+                self.symbol, settings.ORDER_BOOK_BROADCAST_LEVELS
+            )
+        except RedisError as e:
+            logger.error(f"Failed to read order book for {self.symbol}: {e}")
+            book = None
+        if book:
+            book.pop('updated_at', None)
+            await self.send(text_data=json.dumps({'type': 'depth_update', **book}))
+
+    async def disconnect(self, close_code):
+        """Обработка отключения клиента"""
+        await self.channel_layer.group_discard(
+            self.group_name,
+            self.channel_name
+        )
+
+    async def send_depth_update(self, event):
+        """Пересылка заранее сериализованного обновления стакана клиенту"""
+        await self.send(text_data=event['text'])
+
+
+class IndicatorConsumer(AsyncWebsocketConsumer):
+    """
+    WebSocket потребитель для потоковой отправки технических индикаторов.
+
+    Сделки из группы пары дописываются в общий кэш рядов процесса, поэтому
+    индикаторы считаются один раз для всех клиентов с одинаковыми параметрами.
+    """
+
+    async def connect(self):
+        """Обработка подключения клиента к потоку индикаторов"""
+        self.symbol = self.scope['url_route']['kwargs']['symbol'].lower()
+        self.group_name = f"crypto_{self.symbol}"
+        self.send_task = None
+        self.last_sent = 0
+
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        request_serializer = IndicatorRequestSerializer(data={
+            'symbol': self.symbol,
+            **{key: values[0] for key, values in query.items()}
+        })
+        if not request_serializer.is_valid() or not await self.pair_exists(self.symbol):
+            await self.close()
+            return
+        self.params = request_serializer.validated_data
+
+        # NumPy загружается при первом подключении к потоку индикаторов
+        from .services.indicators import get_indicator_cache
+        self.cache = get_indicator_cache()
+
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+        # Первое сообщение содержит ряд целиком, последующие — только последнюю свечу
+        self.series = await database_sync_to_async(self.cache.get)(self.symbol, self.params['interval'])
+        await self.send_indicators(self.params['points'])
+
+    async def disconnect(self, close_code):
+        """Обработка отключения клиента"""
+        if self.send_task:
+            self.send_task.cancel()
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    @database_sync_to_async
+    def pair_exists(self, symbol):
+        """Проверка существования пары криптовалют"""
+        return CryptoPair.objects.filter(symbol=symbol).exists()
+
+    async def send_indicators(self, points):
+        """Отправка значений индикаторов клиенту"""
+        self.last_sent = time.monotonic()
+        values = self.series.compute(
+            self.params['indicators'], self.params['period'], self.params['rsi_period'],
+            self.params['width'], points
+        )
+        await self.send(text_data=json.dumps({'type': 'indicators', **values}))
+
+    async def send_later(self, delay):
+        """Отложенная отправка, чтобы не превышать INDICATOR_STREAM_INTERVAL"""
+        await asyncio.sleep(delay)
+        self.send_task = None
+        await self.send_indicators(1)
+
+    async def send_price_update(self, event):
+        """Дозапись сделки в ряд и отправка обновленных индикаторов"""
+        message = json.loads(event['text']) if 'text' in event else event
+        timestamp = datetime.fromisoformat(message['timestamp']).timestamp()
+        self.cache.add_trade(
+            self.symbol, timestamp, float(message['price']), float(message['quantity'] or 0), message.get('trade_id')
+        )
+        if self.send_task is None:
+            delay = self.last_sent + settings.INDICATOR_STREAM_INTERVAL - time.monotonic()
+            self.send_task = asyncio.ensure_future(self.send_later(max(delay, 0)))
+
+    async def send_stream_event(self, event):
+        """События дополнительных потоков пары не используются"""
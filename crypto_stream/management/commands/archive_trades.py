@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from crypto_stream.tasks import archive_old_trades
+
+
+class Command(BaseCommand):
+    help = 'Перенос сделок старше ARCHIVE_HOT_WINDOW_DAYS в холодное хранилище'
+
+    def handle(self, *args, **options):
+        count = archive_old_trades()
+        self.stdout.write(self.style.SUCCESS(f"Archived {count} trades"))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from crypto_stream.models import CryptoPair
+from crypto_stream.services.pair_stats import rebuild_pair_stats
+
+
+class Command(BaseCommand):
+    help = 'Пересчет статистики пар (PairStats) по таблицам PriceUpdate и ArchiveSegment'
+
+    def add_arguments(self, parser):
+        parser.add_argument('symbols', nargs='*', help='Пары (по умолчанию все)')
+
+    def handle(self, *args, **options):
+        pairs = CryptoPair.objects.all()
+        if options['symbols']:
+            pairs = pairs.filter(symbol__in=[symbol.lower() for symbol in options['symbols']])
+        rebuild_pair_stats(pairs)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats for {pairs.count()} pairs"))
@@ -0,0 +1,63 @@
+import time
+import asyncio
+from django.core.management.base import BaseCommand, CommandError
+
+from crypto_stream.services import BinanceWebsocketClient
+from crypto_stream.services.recorder import FrameReplayer
+
+
+class Command(BaseCommand):
+    help = 'Воспроизведение записанных кадров Binance через обработчик инжестора'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Файлы сегментов или каталоги с ними')
+        parser.add_argument(
+            '--speed', default='max',
+            help='Скорость относительно записи: 1 — реальное время, 10 — в 10 раз быстрее, max — без пауз'
+        )
+        parser.add_argument('--broadcast', action='store_true', help='Отправлять обновления клиентам WebSocket')
+        parser.add_argument('--no-persist', action='store_true', help='Не записывать данные в БД')
+        parser.add_argument('--flush-every', type=int, default=10000, help='Запись в БД каждые N кадров')
+
+    def handle(self, *args, **options):
+        if options['speed'] == 'max':
+            speed = None
+        else:
+            try:
+                speed = float(options['speed'])
+            except ValueError:
+                raise CommandError("--speed must be a number or 'max'")
+        asyncio.run(self.run(options, speed))
+
+    async def run(self, options, speed):
+        """Воспроизведение кадров без подключения к Binance"""
+        # Кадры обрабатываются в этом процессе: обработчики конвейера при воспроизведении не запускаются
+        client = BinanceWebsocketClient(record_frames=False, pipeline=False)
+        # Исторические сделки не должны попадать в журнал для переподключения клиентов
+        client.event_log = None
+        if not options['broadcast']:
+            client.broadcast = self.discard
+            client.order_books.on_update = self.discard
+        if options['no_persist']:
+            # Без спула: сделки из него записал бы в БД следующий запуск инжестора
+            client.spool = None
+            client.save_price_updates = lambda: self.discard_buffers(client)
+        else:
+            await client.initialize_pairs()
+
+        replayer = FrameReplayer(options['paths'], speed, options['flush_every'])
+        started = time.perf_counter()
+        count = await replayer.replay(client)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Replayed {count} frames in {elapsed:.2f}s ({count / elapsed if elapsed else 0:.0f} frames/s)"
+        ))
+
+    async def discard(self, *args):
+        pass
+
+    async def discard_buffers(self, client):
+        client.price_buffer = {}
+        for handler in client.handlers.values():
+            if handler.has_pending():
+                handler.buffer = {}
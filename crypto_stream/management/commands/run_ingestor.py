@@ -0,0 +1,39 @@
+import asyncio
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from crypto_stream.services import BinanceWebsocketClient
+from crypto_stream.services.metrics import start_metrics_server
+from crypto_stream.services.profiling import get_profiler
+
+
+class Command(BaseCommand):
+    help = 'Запуск клиента Binance WebSocket в отдельном процессе'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--metrics-port', type=int, default=settings.INGESTOR_METRICS_PORT,
+            help='Порт HTTP-сервера метрик Prometheus'
+        )
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(options))
+
+    async def run(self, options):
+        """Запуск сервера метрик и клиента Binance в одном цикле событий"""
+        server = None
+        if options['metrics_port']:
+            server = await start_metrics_server(options['metrics_port'])
+
+        # SIGUSR2 запускает профилирование или записывает собранные стеки в PROFILING_DIR
+        profiler = get_profiler()
+        profiler.install_signal_handler('ingestor', asyncio.get_running_loop())
+        if settings.PROFILING_ENABLED:
+            profiler.start()
+
+        client = BinanceWebsocketClient()
+        try:
+            await client.start()
+        finally:
+            if server:
+                server.close()
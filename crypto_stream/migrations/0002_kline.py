@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto_stream', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Kline',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval', models.CharField(max_length=4)),
+                ('open_time', models.DateTimeField()),
+                ('close_time', models.DateTimeField()),
+                ('open', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('high', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('low', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('close', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('volume', models.DecimalField(decimal_places=8, max_digits=30)),
+                ('quote_volume', models.DecimalField(decimal_places=8, max_digits=30)),
+                ('trade_count', models.IntegerField(default=0)),
+                ('pair', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='klines', to='crypto_stream.cryptopair')),
+            ],
+            options={
+                'ordering': ['-open_time'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='kline',
+            constraint=models.UniqueConstraint(fields=('pair', 'interval', 'open_time'), name='unique_kline'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto_stream', '0002_kline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cryptopair',
+            name='is_active',
+            field=models.BooleanField(default=True),
+        ),
+    ]
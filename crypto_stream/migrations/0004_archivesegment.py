@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto_stream', '0003_cryptopair_is_active'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_time', models.DateTimeField()),
+                ('end_time', models.DateTimeField()),
+                ('row_count', models.IntegerField()),
+                ('size', models.BigIntegerField()),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('storage', models.CharField(default='local', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('pair', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archive_segments', to='crypto_stream.cryptopair')),
+            ],
+            options={
+                'ordering': ['-start_time'],
+                'indexes': [models.Index(fields=['pair', 'start_time', 'end_time'], name='crypto_stre_pair_id_1886d5_idx')],
+            },
+        ),
+    ]
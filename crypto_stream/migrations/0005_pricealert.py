@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto_stream', '0004_archivesegment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('price_cross', 'Пересечение цены'), ('percent_move', 'Изменение цены в процентах за окно'), ('volume_spike', 'Объем сделок за окно')], max_length=20)),
+                ('value', models.DecimalField(decimal_places=8, max_digits=30)),
+                ('direction', models.CharField(choices=[('above', 'Вверх'), ('below', 'Вниз')], default='above', max_length=5)),
+                ('window_seconds', models.PositiveIntegerField(default=60)),
+                ('repeat', models.BooleanField(default=False)),
+                ('is_active', models.BooleanField(default=True)),
+                ('trigger_count', models.PositiveIntegerField(default=0)),
+                ('triggered_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('pair', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alerts', to='crypto_stream.cryptopair')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['is_active'], name='crypto_stre_is_acti_d94311_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-19 05:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto_stream', '0005_pricealert'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PairStats',
+            fields=[
+                ('pair', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='crypto_stream.cryptopair')),
+                ('trade_count', models.BigIntegerField(default=0)),
+                ('archived_count', models.BigIntegerField(default=0)),
+                ('first_trade_at', models.DateTimeField(blank=True, null=True)),
+                ('last_trade_at', models.DateTimeField(blank=True, null=True)),
+                ('last_price', models.DecimalField(blank=True, decimal_places=8, max_digits=20, null=True)),
+                ('last_trade_id', models.BigIntegerField(blank=True, null=True)),
+                ('volume', models.DecimalField(decimal_places=8, default=0, max_digits=40)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'pair stats',
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:21
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('crypto_stream', '0006_pairstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pricealert',
+            name='owner',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='price_alerts', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:32
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def delete_duplicate_trades(apps, schema_editor):
+    """Удаление повторно записанных сделок перед созданием уникального ограничения"""
+    PriceUpdate = apps.get_model('crypto_stream', 'PriceUpdate')
+    duplicates = (
+        PriceUpdate.objects.filter(trade_id__isnull=False)
+        .values('pair_id', 'trade_id')
+        .annotate(rows=Count('id'), keep=Min('id'))
+        .filter(rows__gt=1)
+    )
+    for duplicate in duplicates.iterator():
+        PriceUpdate.objects.filter(
+            pair_id=duplicate['pair_id'], trade_id=duplicate['trade_id']
+        ).exclude(id=duplicate['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto_stream', '0007_pricealert_owner'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_trades, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='priceupdate',
+            constraint=models.UniqueConstraint(fields=('pair', 'trade_id'), name='unique_price_update_trade'),
+        ),
+    ]
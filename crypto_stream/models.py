@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 
@@ -5,6 +6,7 @@ from django.utils import timezone
 class CryptoPair(models.Model):
     """Модель для хранения информации о паре криптовалют"""
     symbol = models.CharField(max_length=20, unique=True)
+    is_active = models.BooleanField(default=True)  # Подписка инжестора на потоки пары
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -27,7 +29,117 @@ class PriceUpdate(models.Model):
             models.Index(fields=['pair', 'timestamp']),
             models.Index(fields=['timestamp']),
         ]
+        constraints = [
+            # Сделка может прийти повторно (догрузка при захвате пары в кластере, повтор спула)
+            models.UniqueConstraint(fields=['pair', 'trade_id'], name='unique_price_update_trade'),
+        ]
         ordering = ['-timestamp']
 
     def __str__(self):
-        return f"{self.pair.symbol} - {self.price} - {self.timestamp}"
\ No newline at end of file
+        return f"{self.pair.symbol} - {self.price} - {self.timestamp}"
+
+
+class PairStats(models.Model):
+    """Статистика сделок пары, обновляемая инжестором в транзакции каждой записи в БД"""
+    pair = models.OneToOneField(CryptoPair, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    trade_count = models.BigIntegerField(default=0)  # Строк пары в таблице PriceUpdate
+    archived_count = models.BigIntegerField(default=0)  # Строк, перенесенных в холодное хранилище
+    first_trade_at = models.DateTimeField(blank=True, null=True)
+    last_trade_at = models.DateTimeField(blank=True, null=True)
+    last_price = models.DecimalField(max_digits=20, decimal_places=8, blank=True, null=True)
+    last_trade_id = models.BigIntegerField(blank=True, null=True)
+    volume = models.DecimalField(max_digits=40, decimal_places=8, default=0)  # Суммарный объем записанных сделок
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'pair stats'
+
+    def __str__(self):
+        return f"{self.pair.symbol} - {self.trade_count}"
+
+
+class Kline(models.Model):
+    """Модель для хранения закрытых свечей из потока kline"""
+    pair = models.ForeignKey(CryptoPair, on_delete=models.CASCADE, related_name='klines')
+    interval = models.CharField(max_length=4)
+    open_time = models.DateTimeField()
+    close_time = models.DateTimeField()
+    open = models.DecimalField(max_digits=20, decimal_places=8)
+    high = models.DecimalField(max_digits=20, decimal_places=8)
+    low = models.DecimalField(max_digits=20, decimal_places=8)
+    close = models.DecimalField(max_digits=20, decimal_places=8)
+    volume = models.DecimalField(max_digits=30, decimal_places=8)
+    quote_volume = models.DecimalField(max_digits=30, decimal_places=8)
+    trade_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['pair', 'interval', 'open_time'], name='unique_kline'),
+        ]
+        ordering = ['-open_time']
+
+    def __str__(self):
+        return f"{self.pair.symbol} {self.interval} - {self.open_time}"
+
+
+class ArchiveSegment(models.Model):
+    """Файл холодного хранилища со сделками пары за закрытый интервал времени"""
+    pair = models.ForeignKey(CryptoPair, on_delete=models.CASCADE, related_name='archive_segments')
+    start_time = models.DateTimeField()  # Время первой сделки в сегменте
+    end_time = models.DateTimeField()  # Время последней сделки в сегменте
+    row_count = models.IntegerField()
+    size = models.BigIntegerField()  # Размер файла в байтах
+    name = models.CharField(max_length=255, unique=True)  # Имя файла в ARCHIVE_DIR или ключ в S3
+    storage = models.CharField(max_length=10, default='local')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['pair', 'start_time', 'end_time']),
+        ]
+        ordering = ['-start_time']
+
+    def __str__(self):
+        return f"{self.pair.symbol} {self.start_time} - {self.end_time}"
+
+
+class PriceAlert(models.Model):
+    """Правило оповещения, проверяемое инжестором на каждой сделке пары"""
+    KIND_PRICE_CROSS = 'price_cross'
+    KIND_PERCENT_MOVE = 'percent_move'
+    KIND_VOLUME_SPIKE = 'volume_spike'
+    KIND_CHOICES = [
+        (KIND_PRICE_CROSS, 'Пересечение цены'),
+        (KIND_PERCENT_MOVE, 'Изменение цены в процентах за окно'),
+        (KIND_VOLUME_SPIKE, 'Объем сделок за окно'),
+    ]
+    DIRECTION_CHOICES = [
+        ('above', 'Вверх'),
+        ('below', 'Вниз'),
+    ]
+
+    pair = models.ForeignKey(CryptoPair, on_delete=models.CASCADE, related_name='alerts')
+    # Оповещения отправляются только соединениям владельца; правила без владельца
+    # (созданные до появления владельцев) не отправляются никому
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='price_alerts', blank=True, null=True
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # Для пересечения — цена, для изменения — процент, для объема — объем за окно
+    value = models.DecimalField(max_digits=30, decimal_places=8)
+    direction = models.CharField(max_length=5, choices=DIRECTION_CHOICES, default='above')
+    window_seconds = models.PositiveIntegerField(default=60)  # Окно для изменения цены и объема
+    repeat = models.BooleanField(default=False)  # Не отключать правило после срабатывания
+    is_active = models.BooleanField(default=True)
+    trigger_count = models.PositiveIntegerField(default=0)
+    triggered_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_active']),
+        ]
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.pair.symbol} {self.kind} {self.direction} {self.value}"
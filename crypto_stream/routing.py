@@ -3,4 +3,6 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r'ws/crypto/(?P<symbol>\w+)/$', consumers.CryptoConsumer.as_asgi()),
+    re_path(r'ws/depth/(?P<symbol>\w+)/$', consumers.OrderBookConsumer.as_asgi()),
+    re_path(r'ws/indicators/(?P<symbol>\w+)/$', consumers.IndicatorConsumer.as_asgi()),
 ]
\ No newline at end of file
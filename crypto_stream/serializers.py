@@ -1,5 +1,7 @@
+from django.conf import settings
 from rest_framework import serializers
-from .models import CryptoPair, PriceUpdate
+from .models import CryptoPair, PriceUpdate, PairStats, PriceAlert
+from .services.intervals import INDICATORS, INTERVALS
 
 
 class CryptoPairSerializer(serializers.ModelSerializer):
@@ -7,7 +9,7 @@ class CryptoPairSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = CryptoPair
-        fields = ['id', 'symbol', 'created_at']
+        fields = ['id', 'symbol', 'is_active', 'created_at']
 
 
 class PriceUpdateSerializer(serializers.ModelSerializer):
@@ -28,4 +30,89 @@ class PriceHistorySerializer(serializers.Serializer):
     symbol = serializers.CharField(required=True)
     start_time = serializers.DateTimeField(required=False)
     end_time = serializers.DateTimeField(required=False)
-    limit = serializers.IntegerField(required=False, min_value=1, max_value=1000, default=100)
\ No newline at end of file
+    limit = serializers.IntegerField(required=False, min_value=1, max_value=1000, default=100)
+    # Прореженная история: не больше max_points корзин шириной не меньше resolution секунд
+    max_points = serializers.IntegerField(required=False, min_value=1, max_value=settings.HISTORY_MAX_POINTS)
+    resolution = serializers.IntegerField(required=False, min_value=1)
+
+
+class OrderBookRequestSerializer(serializers.Serializer):
+    """Сериализатор для запроса стакана заявок"""
+    symbol = serializers.CharField(required=True)
+    depth = serializers.IntegerField(
+        required=False, min_value=1, max_value=settings.ORDER_BOOK_PUBLISH_LEVELS, default=10
+    )
+
+
+class PriceAlertSerializer(serializers.ModelSerializer):
+    """Сериализатор для правил оповещений о цене"""
+    symbol = serializers.SlugRelatedField(source='pair', slug_field='symbol', queryset=CryptoPair.objects.all())
+
+    class Meta:
+        model = PriceAlert
+        fields = [
+            'id', 'symbol', 'kind', 'value', 'direction', 'window_seconds',
+            'repeat', 'is_active', 'trigger_count', 'triggered_at', 'created_at'
+        ]
+        read_only_fields = ['trigger_count', 'triggered_at', 'created_at']
+
+    def validate_value(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Value must be positive.")
+        return value
+
+    def validate_window_seconds(self, value):
+        if value < 1:
+            raise serializers.ValidationError("Window must be at least 1 second.")
+        return value
+
+
+class PairStatsSerializer(serializers.ModelSerializer):
+    """Сериализатор для статистики сделок пары"""
+    symbol = serializers.CharField(source='pair.symbol', read_only=True)
+
+    class Meta:
+        model = PairStats
+        fields = [
+            'symbol', 'trade_count', 'archived_count', 'first_trade_at', 'last_trade_at',
+            'last_price', 'last_trade_id', 'volume', 'updated_at'
+        ]
+
+
+class IndicatorRequestSerializer(serializers.Serializer):
+    """Сериализатор для запроса технических индикаторов"""
+    symbol = serializers.CharField(required=True)
+    interval = serializers.ChoiceField(choices=list(INTERVALS), required=False, default='1m')
+    indicators = serializers.CharField(required=False, default=','.join(INDICATORS))
+    period = serializers.IntegerField(required=False, min_value=2, max_value=200, default=20)
+    rsi_period = serializers.IntegerField(required=False, min_value=2, max_value=200, default=14)
+    width = serializers.FloatField(required=False, min_value=0.1, max_value=10, default=2.0)
+    points = serializers.IntegerField(required=False, min_value=1, max_value=1000, default=100)
+
+    def validate_indicators(self, value):
+        names = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = set(names) - set(INDICATORS)
+        if unknown or not names:
+            raise serializers.ValidationError(f"Supported indicators: {', '.join(INDICATORS)}.")
+        return names
+
+
+class SnapshotRequestSerializer(serializers.Serializer):
+    """Сериализатор для запроса снимка состояния рынка"""
+    symbols = serializers.CharField(required=False)
+    cross = serializers.CharField(required=False)
+    matrix = serializers.CharField(required=False)
+
+    def validate_symbols(self, value):
+        return [symbol.strip().lower() for symbol in value.split(',') if symbol.strip()]
+
+    def validate_cross(self, value):
+        crosses = [pair.strip().lower() for pair in value.split(',') if pair.strip()]
+        for pair in crosses:
+            base, _, quote = pair.partition('/')
+            if not base or not quote:
+                raise serializers.ValidationError("Crosses must be given as BASE/QUOTE, e.g. eth/btc.")
+        return crosses
+
+    def validate_matrix(self, value):
+        return [asset.strip().lower() for asset in value.split(',') if asset.strip()]
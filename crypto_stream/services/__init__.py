@@ -1,3 +1,11 @@
-from .binance_client import BinanceWebsocketClient
+# Клиент импортируется лениво: процессы-обработчики конвейера загружают пакет до настройки Django
 
-__all__ = ['BinanceWebsocketClient']
\ No newline at end of file
+
+def __getattr__(name):
+    if name == 'BinanceWebsocketClient':
+        from .binance_client import BinanceWebsocketClient
+        return BinanceWebsocketClient
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+__all__ = ['BinanceWebsocketClient']
@@ -0,0 +1,270 @@
+"""
+Оповещения о ценах, проверяемые инкрементально на потоке сделок.
+
+Правила каждой пары хранятся в отсортированных списках, поэтому проверка сделки
+стоит O(log n + k), где k — число сработавших правил:
+
+- пересечение цены: пороги выше и ниже цены, сработавшие правила — пороги между
+  предыдущей и текущей ценой;
+- изменение в процентах и объем: правила сгруппированы по длине окна, для окна
+  поддерживаются минимум и максимум цены (монотонные очереди) и сумма объема,
+  сработавшие правила — с порогом не выше текущего изменения или объема.
+"""
+import heapq
+import logging
+from collections import deque, namedtuple
+from datetime import datetime, timezone
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db.models import F
+from sortedcontainers import SortedList
+
+from crypto_stream.models import PriceAlert
+
+logger = logging.getLogger(__name__)
+
+INF = float('inf')
+
+Rule = namedtuple('Rule', 'id symbol kind direction value window repeat owner', defaults=[None])
+
+
+def rule_from_alert(alert):
+    """Правило движка из модели PriceAlert"""
+    return Rule(
+        alert.id, alert.pair.symbol, alert.kind, alert.direction,
+        float(alert.value), alert.window_seconds, alert.repeat, alert.owner_id
+    )
+
+
+def alert_group(owner_id, symbol):
+    """Группа channel layer соединений владельца правил, подключенных к паре"""
+    return f"alerts_{owner_id}_{symbol}"
+
+
+class AlertWindow:
+    """Скользящее окно сделок пары с правилами изменения цены и объема"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.trades = deque()  # (время, объем)
+        self.minimums = deque()  # (время, цена), цены возрастают
+        self.maximums = deque()  # (время, цена), цены убывают
+        self.volume = 0.0
+        self.rises = SortedList()  # (процент, id)
+        self.drops = SortedList()
+        self.volumes = SortedList()  # (объем, id)
+
+    def __bool__(self):
+        return bool(self.rises or self.drops or self.volumes)
+
+    def rules(self, rule):
+        """Список, в котором хранится правило"""
+        if rule.kind == PriceAlert.KIND_VOLUME_SPIKE:
+            return self.volumes
+        return self.rises if rule.direction == 'above' else self.drops
+
+    def add_trade(self, timestamp, price, quantity):
+        """Учет сделки и вытеснение сделок старше окна"""
+        self.trades.append((timestamp, quantity))
+        self.volume += quantity
+        while self.minimums and self.minimums[-1][1] >= price:
+            self.minimums.pop()
+        self.minimums.append((timestamp, price))
+        while self.maximums and self.maximums[-1][1] <= price:
+            self.maximums.pop()
+        self.maximums.append((timestamp, price))
+
+        expired = timestamp - self.seconds
+        while self.trades[0][0] < expired:
+            self.volume -= self.trades.popleft()[1]
+        while self.minimums[0][0] < expired:
+            self.minimums.popleft()
+        while self.maximums[0][0] < expired:
+            self.maximums.popleft()
+
+    def matches(self, price):
+        """Сработавшие правила: (id, наблюдаемое значение)"""
+        rise = (price - self.minimums[0][1]) / self.minimums[0][1] * 100
+        drop = (self.maximums[0][1] - price) / self.maximums[0][1] * 100
+        result = []
+        for rules, observed in ((self.rises, rise), (self.drops, drop), (self.volumes, self.volume)):
+            if rules and rules[0][0] <= observed:
+                result.extend((alert_id, observed) for _, alert_id in rules.irange(maximum=(observed, INF)))
+        return result
+
+
+class SymbolAlerts:
+    """Правила оповещений одной пары"""
+
+    def __init__(self):
+        self.last_price = None
+        self.above = SortedList()  # (порог, id): срабатывает при росте цены через порог
+        self.below = SortedList()  # (порог, id): срабатывает при падении цены через порог
+        self.windows = {}
+
+    def __bool__(self):
+        return bool(self.above or self.below or self.windows)
+
+    def rules(self, rule):
+        """Список, в котором хранится правило"""
+        if rule.kind == PriceAlert.KIND_PRICE_CROSS:
+            return self.above if rule.direction == 'above' else self.below
+        window = self.windows.get(rule.window)
+        if window is None:
+            window = self.windows[rule.window] = AlertWindow(rule.window)
+        return window.rules(rule)
+
+    def remove(self, rule):
+        self.rules(rule).discard((rule.value, rule.id))
+        window = self.windows.get(rule.window)
+        if window is not None and not window:
+            del self.windows[rule.window]
+
+    def matches(self, timestamp, price, quantity):
+        """Сработавшие правила: (id, наблюдаемое значение)"""
+        result = []
+        last = self.last_price
+        if last is not None:
+            if price > last and self.above:
+                # Пороги в интервале (last, price]
+                result.extend(
+                    (alert_id, price) for _, alert_id in self.above.irange((last, INF), (price, INF))
+                )
+            elif price < last and self.below:
+                # Пороги в интервале [price, last)
+                result.extend(
+                    (alert_id, price) for _, alert_id in self.below.irange((price, -INF), (last, -INF))
+                )
+        self.last_price = price
+
+        for window in self.windows.values():
+            window.add_trade(timestamp, price, quantity)
+            result.extend(window.matches(price))
+        return result
+
+
+class AlertEngine:
+    """Проверка правил оповещений на каждой сделке в процессе инжестора"""
+
+    def __init__(self):
+        self.rules = {}
+        self.symbols = {}
+        self.rearm = []  # Куча (время, id) повторяемых правил, ожидающих окончания окна
+        self.fired = []  # Сработавшие правила, ожидающие записи в БД
+
+    def add(self, rule):
+        self.rules[rule.id] = rule
+        book = self.symbols.setdefault(rule.symbol, SymbolAlerts())
+        book.rules(rule).add((rule.value, rule.id))
+
+    def remove(self, alert_id):
+        rule = self.rules.pop(alert_id, None)
+        if rule is None:
+            return
+        book = self.symbols.get(rule.symbol)
+        if book is not None:
+            book.remove(rule)
+            if not book:
+                del self.symbols[rule.symbol]
+
+    @sync_to_async
+    def fetch_rules(self, **filters):
+        """Активные правила из БД"""
+        alerts = PriceAlert.objects.filter(is_active=True, **filters).select_related('pair')
+        return [rule_from_alert(alert) for alert in alerts]
+
+    # Структуры изменяются только в цикле событий, из БД правила читаются в отдельном потоке
+
+    async def load(self):
+        """Загрузка активных правил из БД"""
+        rules = await self.fetch_rules()
+        self.rules = {}
+        self.symbols = {}
+        self.rearm = []
+        for rule in rules:
+            self.add(rule)
+        logger.info(f"Loaded {len(self.rules)} price alerts")
+
+    async def refresh(self, alert_id):
+        """Применение изменения правила, сделанного через API"""
+        rules = await self.fetch_rules(id=alert_id)
+        self.remove(alert_id)
+        for rule in rules:
+            self.add(rule)
+
+    def evaluate(self, symbol, timestamp, price, quantity):
+        """
+        Проверка сделки по правилам пары, возвращает пары (владелец, сообщение)
+        для сработавших правил.
+
+        `timestamp` — время сделки в секундах, цена и объем — float.
+        """
+        if self.rearm and self.rearm[0][0] <= timestamp:
+            self.rearm_rules(timestamp)
+        book = self.symbols.get(symbol)
+        if book is None:
+            return []
+
+        alerts = []
+        for alert_id, observed in book.matches(timestamp, price, quantity):
+            rule = self.rules.get(alert_id)
+            if rule is None:
+                continue
+            alerts.append((rule.owner, {
+                'type': 'alert',
+                'alert_id': rule.id,
+                'symbol': symbol,
+                'kind': rule.kind,
+                'direction': rule.direction,
+                'value': rule.value,
+                'observed': round(observed, 8),
+                'price': price,
+                'timestamp': int(timestamp * 1000),
+            }))
+            self.fired.append((rule.id, timestamp, rule.repeat))
+
+            # Пересечение повторно сработает только после возврата цены за порог,
+            # остальные повторяемые правила снова проверяются после окончания окна
+            if not rule.repeat:
+                self.remove(rule.id)
+            elif rule.kind != PriceAlert.KIND_PRICE_CROSS:
+                book.remove(rule)
+                heapq.heappush(self.rearm, (timestamp + rule.window, rule.id))
+        return alerts
+
+    def rearm_rules(self, now):
+        """Возврат повторяемых правил, окно которых закончилось"""
+        while self.rearm and self.rearm[0][0] <= now:
+            _, alert_id = heapq.heappop(self.rearm)
+            rule = self.rules.get(alert_id)
+            if rule is None:
+                continue
+            rules = self.symbols.setdefault(rule.symbol, SymbolAlerts()).rules(rule)
+            # Правило могло быть добавлено заново при изменении через API
+            if (rule.value, rule.id) not in rules:
+                rules.add((rule.value, rule.id))
+
+    def has_pending(self):
+        return bool(self.fired)
+
+    def persist(self):
+        """Синхронная запись срабатываний в БД"""
+        fired, self.fired = self.fired, []
+        for alert_id, timestamp, repeat in fired:
+            updates = {
+                'triggered_at': datetime.fromtimestamp(timestamp, tz=timezone.utc),
+                'trigger_count': F('trigger_count') + 1,
+            }
+            if not repeat:
+                updates['is_active'] = False
+            PriceAlert.objects.filter(id=alert_id).update(**updates)
+
+
+def notify_alert_changed(alert_id):
+    """Уведомление инжестора об изменении правила (из синхронного кода)"""
+    async_to_sync(get_channel_layer().group_send)(settings.INGESTOR_CONTROL_GROUP, {
+        'type': 'alerts.changed',
+        'alert_id': alert_id
+    })
@@ -0,0 +1,412 @@
+"""
+Холодное хранилище сделок: колоночные сжатые сегменты на диске или в S3.
+
+Сегмент содержит сделки одной пары за закрытый интервал (сутки UTC) и устроен так:
+
+    MAGIC | группа 1: колонки | группа 2: колонки | ... | футер JSON | длина футера | MAGIC
+
+Каждая колонка группы — сжатый массив int64 (int8 для флага), в футере перечислены
+смещения колонок и диапазон времени каждой группы. Колонка группы, значения которой
+не помещаются в int64 (цена или объем от ~9.2e10), хранится текстом: по строке на
+значение, номера таких колонок перечислены в 'text_columns' группы. При чтении файл
+отображается в память (mmap), распаковываются только группы, пересекающиеся
+с запрошенным интервалом.
+"""
+import os
+import json
+import mmap
+import zlib
+import heapq
+import struct
+import logging
+from array import array
+from bisect import bisect_left, bisect_right
+from decimal import Decimal
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from crypto_stream.models import ArchiveSegment, CryptoPair, PriceUpdate
+from crypto_stream.services.pair_stats import archive_pair_stats
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'CSTRADE1'
+TRAILER = struct.Struct('<Q8s')
+
+# Колонки сегмента: имя и код типа array. Цены и объемы хранятся в единицах 1e-8
+COLUMNS = (
+    ('timestamp', 'q'),  # Микросекунды Unix
+    ('price', 'q'),
+    ('quantity', 'q'),
+    ('trade_id', 'q'),
+    ('buyer_order_id', 'q'),
+    ('seller_order_id', 'q'),
+    ('is_buyer_maker', 'b'),
+)
+FIELDS = tuple(name for name, _ in COLUMNS)
+NULL = -2 ** 63  # Значение NULL в колонках int64
+INT64_MAX = 2 ** 63 - 1
+SCALE = Decimal(10) ** 8
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def compress(data, codec):
+    if codec == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return zlib.compress(data, 6)
+
+
+def decompress(data, codec):
+    if codec == 'zstd':
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def to_micros(value):
+    return (value - EPOCH) // MICROSECOND
+
+
+def from_micros(value):
+    return EPOCH + timedelta(microseconds=value)
+
+
+def encode_value(name, value):
+    """Значение поля в целое число колонки"""
+    if value is None:
+        return NULL
+    if name == 'timestamp':
+        return to_micros(value)
+    if name in ('price', 'quantity'):
+        scaled = int(Decimal(value) * SCALE)
+        if not NULL < scaled <= INT64_MAX:
+            raise OverflowError(f"{name} {value} does not fit into an int64 column")
+        return scaled
+    return int(value)
+
+
+def decode_value(name, value):
+    """Целое число колонки в значение поля PriceUpdate"""
+    if name == 'is_buyer_maker':
+        return bool(value)
+    if value == NULL:
+        return None
+    if name == 'timestamp':
+        return from_micros(value)
+    if name in ('price', 'quantity'):
+        return Decimal(value).scaleb(-8)
+    return value
+
+
+def encode_text(value):
+    """Значение поля в строку текстовой колонки"""
+    return '' if value is None else str(value)
+
+
+def decode_text(name, value):
+    """Строка текстовой колонки в значение поля PriceUpdate"""
+    if not value:
+        return None
+    if name in ('price', 'quantity'):
+        return Decimal(value)
+    return int(value)
+
+
+def write_segment(path, symbol, rows, row_group_size=None, codec=None):
+    """
+    Запись сегмента из строк, упорядоченных по времени.
+
+    Строки — кортежи значений в порядке FIELDS. Файл пишется во временный
+    и переименовывается, поэтому незавершенный сегмент не виден читателям.
+    Возвращает футер сегмента.
+    """
+    row_group_size = row_group_size or settings.ARCHIVE_ROW_GROUP_SIZE
+    codec = codec or settings.ARCHIVE_CODEC
+    groups = []
+    total = 0
+    tmp_path = path + '.tmp'
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+
+        def flush(columns):
+            group = {'rows': len(columns[0]), 'min_ts': columns[0][0], 'max_ts': columns[0][-1], 'columns': []}
+            for index, column in enumerate(columns):
+                if isinstance(column, list):
+                    group.setdefault('text_columns', []).append(index)
+                    data = compress('\n'.join(column).encode(), codec)
+                else:
+                    data = compress(column.tobytes(), codec)
+                group['columns'].append([f.tell(), len(data)])
+                f.write(data)
+            groups.append(group)
+
+        columns = [array(typecode) for _, typecode in COLUMNS]
+        for row in rows:
+            for index, (name, value) in enumerate(zip(FIELDS, row)):
+                column = columns[index]
+                if isinstance(column, list):
+                    column.append(encode_text(value))
+                    continue
+                try:
+                    column.append(encode_value(name, value))
+                except OverflowError:
+                    # Значение не помещается в int64: колонка группы переводится в текст
+                    columns[index] = [encode_text(decode_value(name, item)) for item in column]
+                    columns[index].append(encode_text(value))
+            total += 1
+            if len(columns[0]) >= row_group_size:
+                flush(columns)
+                columns = [array(typecode) for _, typecode in COLUMNS]
+        if len(columns[0]):
+            flush(columns)
+
+        footer = {
+            'symbol': symbol,
+            'codec': codec,
+            'rows': total,
+            'columns': [list(column) for column in COLUMNS],
+            'groups': groups,
+        }
+        encoded = json.dumps(footer).encode()
+        f.write(encoded)
+        f.write(TRAILER.pack(len(encoded), MAGIC))
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, path)
+    return footer
+
+
+class SegmentReader:
+    """Чтение сегмента через отображение файла в память"""
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        footer_length, magic = TRAILER.unpack_from(self.buffer, len(self.buffer) - TRAILER.size)
+        if magic != MAGIC or self.buffer[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a trade archive segment")
+        footer_start = len(self.buffer) - TRAILER.size - footer_length
+        self.footer = json.loads(self.buffer[footer_start:footer_start + footer_length])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.buffer.close()
+        self.file.close()
+
+    def read_column(self, group, index):
+        """Распаковка колонки группы: массив int64 или список строк текстовой колонки"""
+        offset, length = group['columns'][index]
+        with memoryview(self.buffer) as view:
+            data = decompress(view[offset:offset + length], self.footer['codec'])
+        if index in group.get('text_columns', ()):
+            return data.decode().split('\n')
+        values = array(COLUMNS[index][1])
+        values.frombytes(data)
+        return values
+
+    def column_groups(self, start_time=None, end_time=None, names=FIELDS):
+        """
+        Колонки `names` групп, пересекающихся с интервалом, по одному словарю на группу.
+
+        Время остается в микросекундах Unix, цены и объемы декодируются в Decimal;
+        строки вне интервала отбрасываются.
+        """
+        start = to_micros(start_time) if start_time else None
+        end = to_micros(end_time) if end_time else None
+        indexes = [FIELDS.index(name) for name in names]
+        for group in self.footer['groups']:
+            if (start is not None and group['max_ts'] < start) or (end is not None and group['min_ts'] > end):
+                continue
+            timestamps = self.read_column(group, 0)
+            first, last = 0, len(timestamps)
+            if start is not None and timestamps[0] < start:
+                first = bisect_left(timestamps, start)
+            if end is not None and timestamps[-1] > end:
+                last = bisect_right(timestamps, end)
+            text_columns = group.get('text_columns', ())
+            columns = {}
+            for name, index in zip(names, indexes):
+                values = timestamps if index == 0 else self.read_column(group, index)
+                values = values[first:last]
+                if index in text_columns:
+                    columns[name] = [decode_text(name, value) for value in values]
+                elif name in ('price', 'quantity'):
+                    columns[name] = [decode_value(name, value) for value in values]
+                else:
+                    columns[name] = values
+            yield columns
+
+    def rows(self, start_time=None, end_time=None, reverse=False):
+        """Сделки сегмента в интервале [start_time, end_time] в порядке времени (reverse — от новых)"""
+        start = to_micros(start_time) if start_time else None
+        end = to_micros(end_time) if end_time else None
+        groups = self.footer['groups']
+        for group in reversed(groups) if reverse else groups:
+            # Группы вне интервала пропускаются без распаковки
+            if (start is not None and group['max_ts'] < start) or (end is not None and group['min_ts'] > end):
+                continue
+            columns = [self.read_column(group, index) for index in range(len(COLUMNS))]
+            text_columns = group.get('text_columns', ())
+            decoders = [
+                decode_text if index in text_columns else decode_value for index in range(len(COLUMNS))
+            ]
+            timestamps = columns[0]
+            positions = range(len(timestamps) - 1, -1, -1) if reverse else range(len(timestamps))
+            for position in positions:
+                timestamp = timestamps[position]
+                if (start is not None and timestamp < start) or (end is not None and timestamp > end):
+                    continue
+                # Строки декодируются по одной, только те, что действительно прочитаны
+                yield {
+                    name: decode(name, column[position])
+                    for name, decode, column in zip(FIELDS, decoders, columns)
+                }
+
+
+class ArchiveStorage:
+    """Хранение сегментов в локальном каталоге и, при настройке, в S3-совместимом хранилище"""
+
+    def __init__(self, directory=None, bucket=None, endpoint=None, prefix=None):
+        self.directory = directory or settings.ARCHIVE_DIR
+        self.bucket = bucket or settings.ARCHIVE_S3_BUCKET
+        self.endpoint = endpoint or settings.ARCHIVE_S3_ENDPOINT
+        self.prefix = prefix if prefix is not None else settings.ARCHIVE_S3_PREFIX
+        self._s3 = None
+
+    @property
+    def kind(self):
+        return 's3' if self.bucket else 'local'
+
+    @property
+    def s3(self):
+        if self._s3 is None:
+            import boto3
+            self._s3 = boto3.client('s3', endpoint_url=self.endpoint)
+        return self._s3
+
+    def local_path(self, name):
+        return os.path.join(self.directory, name)
+
+    def store(self, name):
+        """Выгрузка записанного сегмента в S3; локальная копия остается только как кэш"""
+        if self.bucket:
+            self.s3.upload_file(self.local_path(name), self.bucket, self.prefix + name)
+            os.remove(self.local_path(name))
+
+    def fetch(self, name):
+        """Локальный путь к сегменту, при необходимости загруженному из S3"""
+        path = self.local_path(name)
+        if not os.path.exists(path) and self.bucket:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.s3.download_file(self.bucket, self.prefix + name, path + '.tmp')
+            os.replace(path + '.tmp', path)
+        return path
+
+    def delete(self, name):
+        if self.bucket:
+            self.s3.delete_object(Bucket=self.bucket, Key=self.prefix + name)
+        if os.path.exists(self.local_path(name)):
+            os.remove(self.local_path(name))
+
+
+def archive_cutoff(now=None):
+    """Граница горячего окна: начало суток, старше которых сделки переносятся в архив"""
+    now = now or timezone.now()
+    boundary = now.astimezone(dt_timezone.utc) - timedelta(days=settings.ARCHIVE_HOT_WINDOW_DAYS)
+    return boundary.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class TradeArchiver:
+    """Перенос закрытых суток сделок из PriceUpdate в сегменты холодного хранилища"""
+
+    def __init__(self, storage=None):
+        self.storage = storage or ArchiveStorage()
+
+    def archive(self, now=None):
+        """Архивация всех пар, возвращает количество перенесенных строк"""
+        cutoff = archive_cutoff(now)
+        total = 0
+        for pair in CryptoPair.objects.all():
+            first = PriceUpdate.objects.filter(pair=pair, timestamp__lt=cutoff).aggregate(
+                first=Min('timestamp'))['first']
+            if first is None:
+                continue
+            day = first.astimezone(dt_timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+            while day < cutoff:
+                total += self.archive_range(pair, day, day + timedelta(days=1))
+                day += timedelta(days=1)
+        return total
+
+    def archive_range(self, pair, start, end):
+        """Экспорт сделок пары за интервал [start, end) в сегмент и удаление их из горячей таблицы"""
+        queryset = PriceUpdate.objects.filter(pair=pair, timestamp__gte=start, timestamp__lt=end)
+        ids = queryset.order_by('id').values_list('id', flat=True)
+        first_id, last_id = ids.first(), ids.last()
+        if first_id is None:
+            return 0
+
+        # Строки, добавленные после выборки (поздние сделки), останутся до следующего запуска
+        queryset = queryset.filter(id__lte=last_id)
+        name = f"{pair.symbol}/{start:%Y-%m-%d}-{first_id}-{last_id}.trades"
+        path = self.storage.local_path(name)
+        rows = queryset.order_by('timestamp', 'id').values_list(*FIELDS).iterator(chunk_size=10000)
+        footer = write_segment(path, pair.symbol, rows)
+        count = footer['rows']
+        size = os.path.getsize(path)
+        self.storage.store(name)
+
+        with transaction.atomic():
+            ArchiveSegment.objects.create(
+                pair=pair,
+                start_time=from_micros(footer['groups'][0]['min_ts']),
+                end_time=from_micros(footer['groups'][-1]['max_ts']),
+                row_count=count,
+                size=size,
+                name=name,
+                storage=self.storage.kind
+            )
+            queryset.delete()
+            archive_pair_stats(pair, count)
+
+        logger.info(f"Archived {count} trades of {pair.symbol} for {start:%Y-%m-%d} to {name} ({size} bytes)")
+        return count
+
+
+def read_archived(pair, start_time, end_time, limit, storage=None):
+    """Сделки пары из архива в интервале, от новых к старым, в виде несохраненных PriceUpdate"""
+    storage = storage or ArchiveStorage()
+    segments = ArchiveSegment.objects.filter(
+        pair=pair, start_time__lte=end_time, end_time__gte=start_time
+    ).order_by('-end_time')
+
+    rows = []
+    for segment in segments:
+        # Остальные сегменты старше уже найденных строк
+        if len(rows) >= limit and segment.end_time < rows[-1]['timestamp']:
+            break
+        # Группы сегмента читаются от новых к старым, пока строки могут попасть в ответ
+        taken = []
+        with SegmentReader(storage.fetch(segment.name)) as reader:
+            for row in reader.rows(start_time, end_time, reverse=True):
+                if len(taken) >= limit or (len(rows) >= limit and row['timestamp'] < rows[-1]['timestamp']):
+                    break
+                taken.append(row)
+        # Сегменты одних суток могут пересекаться по времени (поздние сделки)
+        rows = list(heapq.merge(rows, taken, key=lambda row: row['timestamp'], reverse=True))[:limit]
+
+    return [PriceUpdate(pair=pair, **row) for row in rows]
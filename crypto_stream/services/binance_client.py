@@ -1,15 +1,36 @@
+import os
+import glob
 import json
+import time
 import asyncio
 import logging
 import websockets
-from decimal import Decimal
-from datetime import datetime
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from channels.layers import get_channel_layer
 from asgiref.sync import sync_to_async
 
 from crypto_stream.models import CryptoPair, PriceUpdate
+from crypto_stream.services.alerts import AlertEngine, alert_group
+from crypto_stream.services.cluster import ClusterCoordinator
+from crypto_stream.services.encoding import encode_depth_update
+from crypto_stream.services.event_log import TradeEventLog
+from crypto_stream.services.flush_controller import FlushController
+from crypto_stream.services.market_state import MarketState
+from crypto_stream.services.order_book import get_order_book_manager
+from crypto_stream.services.pair_stats import new_trades, update_pair_stats
+from crypto_stream.services.pipeline import IngestPipeline
+from crypto_stream.services.profiling import hot_path
+from crypto_stream.services.recorder import FrameRecorder
+from crypto_stream.services.spool import TradeSpool
+from crypto_stream.services.stream_handlers import STREAM_HANDLERS, detect_event_type
+from crypto_stream.services.subscriptions import SubscriptionManager, InterestRegistry
+from crypto_stream.services.metrics import (
+    FRAMES_RECEIVED, MESSAGES_PARSED, PARSE_ERRORS, PROCESSING_ERRORS, BUFFER_ROWS,
+    FLUSH_DURATION, FLUSH_ROWS, GROUP_SEND_DURATION, RECONNECTS, SPOOL_LAG
+)
+from crypto_stream.services.latency import LATENCY
 
 logger = logging.getLogger(__name__)
 
@@ -17,23 +38,48 @@ logger = logging.getLogger(__name__)
 class BinanceWebsocketClient:
     """Клиент для взаимодействия с Binance WebSocket API"""
 
-    def __init__(self):
+    def __init__(self, record_frames=True, pipeline=True):
         self.base_url = settings.BINANCE_WEBSOCKET_URI
         self.pairs = settings.CRYPTO_PAIRS
         self.websocket = None
         self.is_running = False
         self.last_save_time = timezone.now()
+        self.last_spool_time = time.monotonic()
         self.channel_layer = get_channel_layer()
         self.price_buffer = {}  # Буфер для хранения цен перед записью в БД
+        self.spool = TradeSpool() if settings.SPOOL_DIR else None
+        self.flush_controller = FlushController()  # Размер пачки и момент записи в БД
+        self.event_log = TradeEventLog() if settings.TRADE_STREAM_ENABLED else None
+        self.recorder = FrameRecorder() if record_frames and settings.FRAME_RECORDER_DIR else None
+        self.default_streams = settings.CRYPTO_DEFAULT_STREAMS
+        self.pair_streams = settings.CRYPTO_PAIR_STREAMS
+        self.order_book_pairs = settings.ORDER_BOOK_PAIRS
+        self.handlers = {event_type: handler_class(self) for event_type, handler_class in STREAM_HANDLERS.items()}
+        self.order_books = get_order_book_manager()
+        self.order_books.on_update = self.broadcast_order_book
+        self.subscriptions = SubscriptionManager(self)
+        self.subscription_lock = asyncio.Lock()
+        self.interest = InterestRegistry() if settings.SUBSCRIBE_ON_DEMAND else None
+        self.alerts = AlertEngine() if settings.ALERTS_ENABLED else None
+        self.market_state = MarketState()
+        self.cluster = ClusterCoordinator(self) if settings.CLUSTER_ENABLED else None
+        self.pipeline = IngestPipeline(self) if pipeline and settings.PIPELINE_WORKERS else None
+        self.background_tasks = []
+        self.received_at = None  # Время получения обрабатываемого сообщения
+        self.latency_tracing = settings.LATENCY_TRACING  # Отключается при воспроизведении записанных кадров
 
     async def connect(self):
         """Подключение к WebSocket API Binance"""
-        # Формируем URL для подключения к нескольким стримам
-        streams = "/".join([f"{pair}@trade" for pair in self.pairs])
-        websocket_url = f"{self.base_url}/{streams}"
+        # Распределяем потоки по соединениям при первом подключении,
+        # при переподключении используем текущие подписки основного соединения.
+        # В кластерном режиме пары подписываются только после захвата аренды
+        if not self.subscriptions.shards:
+            self.subscriptions.assign(self.build_streams() if self.cluster is None else [])
+        websocket_url = self.stream_url(self.subscriptions.shards[0].streams)
 
         try:
             self.websocket = await websockets.connect(websocket_url)
+            self.subscriptions.shards[0].websocket = self.websocket
             self.is_running = True
             logger.info(f"Connected to Binance WebSocket API: {websocket_url}")
             return True
@@ -41,6 +87,53 @@ class BinanceWebsocketClient:
             logger.error(f"Failed to connect to Binance WebSocket: {e}")
             return False
 
+    def build_streams(self):
+        """Список потоков Binance согласно настройкам подписок для каждой пары"""
+        streams = []
+        for pair in self.pairs:
+            for stream in self.pair_streams.get(pair, self.default_streams):
+                streams.append(f"{pair}@{stream}")
+        for pair in self.order_book_pairs:
+            stream = f"{pair}@depth@100ms"
+            if stream not in streams:
+                streams.append(stream)
+        return streams
+
+    def stream_url(self, streams):
+        """URL для подключения к нескольким стримам"""
+        if not streams:
+            return self.base_url
+        return f"{self.base_url}/{'/'.join(streams)}"
+
+    def has_pending_data(self):
+        """Есть ли буферизованные данные, ожидающие записи в БД"""
+        return (
+            bool(self.price_buffer)
+            or bool(self.spool and self.spool.has_pending())
+            or any(handler.has_pending() for handler in self.handlers.values())
+            or bool(self.alerts and self.alerts.has_pending())
+        )
+
+    def buffered_rows(self):
+        """Количество строк в буфере цен"""
+        return sum(len(rows) for rows in self.price_buffer.values())
+
+    def flush_due(self):
+        """Пора ли записывать буфер цен в БД"""
+        elapsed = (timezone.now() - self.last_save_time).total_seconds()
+        if elapsed < self.flush_controller.min_interval:
+            return False
+        return self.flush_controller.due(elapsed, self.buffered_rows())
+
+    async def flush(self):
+        """Запись всех буферизованных данных, включая переданные обработчикам конвейера"""
+        if self.spool:
+            await self.spool_buffer()
+        if self.has_pending_data():
+            await self.save_price_updates()
+        if self.pipeline:
+            await self.pipeline.flush()
+
     async def disconnect(self):
         """Отключение от WebSocket API"""
         if self.websocket:
@@ -54,17 +147,24 @@ class BinanceWebsocketClient:
         pair, created = CryptoPair.objects.get_or_create(symbol=symbol)
         return pair
 
-    @sync_to_async
-    def save_price_updates(self):
-        """Сохранение накопленных обновлений цен в базу данных"""
-        updates_to_create = []
-
-        for symbol, data in self.price_buffer.items():
+    def write_price_updates(self, buffer):
+        """Запись строк буфера цен {symbol: [строки]} в БД, возвращает количество новых строк"""
+        pairs = []
+        for symbol, data in buffer.items():
             try:
-                pair = CryptoPair.objects.get(symbol=symbol)
+                pairs.append((CryptoPair.objects.get(symbol=symbol), data))
+            except CryptoPair.DoesNotExist:
+                logger.error(f"Crypto pair {symbol} does not exist")
 
-                for update_data in data:
-                    updates_to_create.append(PriceUpdate(
+        written = 0
+        # Статистика пар обновляется в той же транзакции, что и запись сделок
+        with transaction.atomic():
+            for pair, data in pairs:
+                rows = new_trades(pair, data)
+                if not rows:
+                    continue
+                PriceUpdate.objects.bulk_create([
+                    PriceUpdate(
                         pair=pair,
                         price=update_data['price'],
                         timestamp=update_data['timestamp'],
@@ -73,74 +173,236 @@ class BinanceWebsocketClient:
                         buyer_order_id=update_data.get('buyer_order_id'),
                         seller_order_id=update_data.get('seller_order_id'),
                         is_buyer_maker=update_data.get('is_buyer_maker', False)
-                    ))
+                    )
+                    for update_data in rows
+                ], ignore_conflicts=True)
+                # Статистика учитывает только строки, которых еще не было в таблице
+                update_pair_stats(pair, rows)
+                written += len(rows)
 
-            except CryptoPair.DoesNotExist:
-                logger.error(f"Crypto pair {symbol} does not exist")
+        if written:
+            logger.info(f"Saved {written} price updates to database")
+        return written
 
-        if updates_to_create:
-            PriceUpdate.objects.bulk_create(updates_to_create)
-            logger.info(f"Saved {len(updates_to_create)} price updates to database")
+    def write_timed(self, buffer):
+        """Запись пачки с учетом ее длительности в адаптивном размере пачки"""
+        started = time.perf_counter()
+        rows = self.write_price_updates(buffer)
+        self.flush_controller.observe(rows, time.perf_counter() - started)
+        return rows
+
+    @sync_to_async
+    @hot_path('save_price_updates')
+    def save_price_updates(self):
+        """Сохранение накопленных обновлений цен в базу данных"""
+        started = time.perf_counter()
+
+        if self.spool:
+            # Буфер цен уже перенесен в спул, в БД строки передаются из него
+            rows = self.spool.drain(self.write_timed, batch_rows=self.flush_controller.batch_rows)
+        else:
+            elapsed = (timezone.now() - self.last_save_time).total_seconds()
+            self.flush_controller.record_rate(self.buffered_rows(), elapsed)
+            rows = self.write_timed(self.price_buffer)
+
+            # Очищаем буфер после сохранения
+            self.price_buffer = {}
+            BUFFER_ROWS.set(0)
+
+        # Сохраняем данные остальных потоков (свечи и т.п.)
+        for handler in self.handlers.values():
+            if handler.has_pending():
+                handler.persist()
+        if self.alerts and self.alerts.has_pending():
+            self.alerts.persist()
 
-        # Очищаем буфер после сохранения
-        self.price_buffer = {}
         self.last_save_time = timezone.now()
+        FLUSH_DURATION.observe(time.perf_counter() - started)
+        FLUSH_ROWS.observe(rows)
+
+    async def spool_buffer(self):
+        """Перенос буфера цен в спул на диске"""
+        if not self.price_buffer:
+            return
+        now = time.monotonic()
+        buffer, self.price_buffer = self.price_buffer, {}
+        BUFFER_ROWS.set(0)
+        # Запись на диск не ждет потока, в котором идет запись в БД
+        rows = await sync_to_async(self.spool.append, thread_sensitive=False)(buffer)
+        self.flush_controller.record_rate(rows, now - self.last_spool_time)
+        self.last_spool_time = now
+
+    async def run_spooler(self):
+        """Периодический перенос буфера цен в спул (одна запись и fsync на интервал)"""
+        while self.is_running:
+            await asyncio.sleep(settings.SPOOL_FSYNC_INTERVAL)
+            try:
+                await self.spool_buffer()
+            except Exception as e:
+                logger.error(f"Failed to append trades to spool: {e}")
+            SPOOL_LAG.set(self.spool.lag())
+
+    async def run_spool_writer(self):
+        """Периодическая передача спула в БД; при недоступности БД строки остаются на диске"""
+        while self.is_running:
+            # Интервал подбирается по частоте сделок, чтобы в БД уходили пачки размера batch_rows
+            await asyncio.sleep(self.flush_controller.interval)
+            try:
+                await self.spool_buffer()
+                if self.has_pending_data():
+                    await self.save_price_updates()
+            except Exception as e:
+                logger.error(f"Failed to write spooled trades to database: {e}")
+
+    async def recover_spool(self):
+        """Запись в БД строк, оставшихся в спуле после остановки или сбоя"""
+        directory = self.spool.directory
+        # Спулы обработчиков конвейера освобождены, пока обработчики не запущены
+        for path in [directory] + sorted(glob.glob(os.path.join(directory, 'worker-*'))):
+            spool = self.spool if path == directory else TradeSpool(path)
+            if not spool.has_pending():
+                continue
+            try:
+                rows = await sync_to_async(spool.drain)(self.write_price_updates)
+                logger.info(f"Recovered {rows} spooled trades from {path}")
+            except Exception as e:
+                logger.error(f"Failed to recover spooled trades from {path}: {e}")
 
-    async def process_message(self, message):
+    @hot_path('process_message')
+    async def process_message(self, message, received_at=None):
         """Обработка сообщения, полученного от Binance"""
+        received_at = received_at or time.time()
+        FRAMES_RECEIVED.inc()
         try:
+            # В конвейерном режиме события пар разбираются в процессах-обработчиках
+            if self.pipeline and await self.pipeline.dispatch(message, received_at):
+                return
+
             data = json.loads(message)
 
-            # Проверяем, что сообщение содержит информацию о сделке
-            if 'e' in data and data['e'] == 'trade':
-                symbol = data['s'].lower()  # Символ пары в нижнем регистре
-                price = Decimal(data['p'])  # Цена
-                trade_time = datetime.fromtimestamp(data['T'] / 1000, tz=timezone.utc)  # Время сделки
-
-                # Дополнительные данные
-                trade_id = data['t']
-                quantity = Decimal(data['q'])
-                buyer_order_id = data['b']
-                seller_order_id = data['a']
-                is_buyer_maker = data['m']
-
-                # Добавляем данные в буфер
-                if symbol not in self.price_buffer:
-                    self.price_buffer[symbol] = []
-
-                self.price_buffer[symbol].append({
-                    'price': price,
-                    'timestamp': trade_time,
-                    'trade_id': trade_id,
-                    'quantity': quantity,
-                    'buyer_order_id': buyer_order_id,
-                    'seller_order_id': seller_order_id,
-                    'is_buyer_maker': is_buyer_maker
-                })
-
-                # Отправляем обновление клиентам через WebSocket
-                await self.channel_layer.group_send(
-                    f"crypto_{symbol}",
-                    {
-                        "type": "send_price_update",
-                        "symbol": symbol,
-                        "price": str(price),
-                        "timestamp": trade_time.isoformat(),
-                        "trade_id": trade_id,
-                        "quantity": str(quantity)
-                    }
-                )
+            # Ответ на управляющее сообщение SUBSCRIBE/UNSUBSCRIBE
+            if 'id' in data and 'e' not in data:
+                self.subscriptions.handle_response(data)
+                return
 
-                # Проверяем, нужно ли сохранить данные в БД
-                time_since_last_save = (timezone.now() - self.last_save_time).total_seconds()
-                if time_since_last_save >= settings.DATA_SAVE_INTERVAL:
-                    await self.save_price_updates()
+            # Передаем событие обработчику, зарегистрированному для его типа
+            event_type = detect_event_type(data)
+            handler = self.handlers.get(event_type)
+            if handler is None:
+                return
+
+            MESSAGES_PARSED.labels(data.get('s', '').lower(), event_type).inc()
+            event_time = data.get('E') or data.get('T')
+            if event_time and self.latency_tracing:
+                LATENCY.record('exchange_to_receive', received_at - event_time / 1000)
+
+            # Время получения используется обработчиками для трассировки задержек
+            self.received_at = received_at
+
+            await handler.handle(data)
+
+            # Проверяем, нужно ли сохранить данные в БД (со спулом запись идет в фоне)
+            if self.spool is None and self.flush_due():
+                await self.save_price_updates()
 
         except json.JSONDecodeError:
+            PARSE_ERRORS.inc()
             logger.error(f"Failed to parse message: {message}")
         except Exception as e:
+            PROCESSING_ERRORS.inc()
             logger.error(f"Error processing message: {e}")
 
+    @hot_path('group_send')
+    async def broadcast(self, symbol, event):
+        """Отправка заранее сериализованного события подписчикам пары"""
+        started = time.perf_counter()
+        await self.channel_layer.group_send(f"crypto_{symbol}", event)
+        GROUP_SEND_DURATION.observe(time.perf_counter() - started)
+
+    async def broadcast_alert(self, owner_id, symbol, event):
+        """Отправка сработавшего оповещения соединениям владельца правила"""
+        await self.channel_layer.group_send(alert_group(owner_id, symbol), event)
+
+    async def broadcast_order_book(self, book):
+        """Отправка верхних уровней стакана клиентам через WebSocket"""
+        top = book.top(settings.ORDER_BOOK_BROADCAST_LEVELS)
+        self.market_state.update_book(book)
+        if top['best_bid'] and top['best_ask']:
+            self.market_state.update_quote(book.symbol, *top['best_bid'], *top['best_ask'])
+        await self.channel_layer.group_send(f"depth_{book.symbol}", encode_depth_update(top))
+
+    @sync_to_async
+    def get_active_symbols(self):
+        """Получение активных пар из базы данных"""
+        return list(CryptoPair.objects.filter(is_active=True).values_list('symbol', flat=True))
+
+    async def desired_pairs(self):
+        """Пары, на потоки которых должен быть подписан инжестор"""
+        active = await self.get_active_symbols()
+        if self.interest is None:
+            return active
+
+        # В режиме подписки по требованию пары из CRYPTO_PAIRS подписаны всегда,
+        # остальные — пока к ним подключен хотя бы один клиент
+        watched = await self.interest.watched()
+        return [symbol for symbol in active if symbol in settings.CRYPTO_PAIRS or symbol in watched]
+
+    async def sync_subscriptions(self):
+        """Сверка подписок с таблицей CryptoPair и интересом клиентов"""
+        async with self.subscription_lock:
+            try:
+                pairs = await self.desired_pairs()
+                if self.cluster:
+                    pairs = await self.cluster.claim(pairs)
+                self.pairs = pairs
+                await self.subscriptions.sync(self.build_streams())
+                if self.cluster:
+                    await self.cluster.release()
+            except Exception as e:
+                logger.error(f"Failed to synchronize subscriptions: {e}")
+
+    async def run_subscription_sync(self):
+        """Периодическая сверка подписок"""
+        interval = settings.SUBSCRIPTION_SYNC_INTERVAL
+        if not interval:
+            return
+        while self.is_running:
+            await asyncio.sleep(interval)
+            await self.sync_subscriptions()
+
+    async def listen_control(self):
+        """Прием управляющих сообщений (админ-панель, подписка по требованию) через channel layer"""
+        channel = await self.channel_layer.new_channel()
+        try:
+            while self.is_running:
+                # Членство в группе channels_redis истекает, поэтому периодически обновляем его
+                await self.channel_layer.group_add(settings.INGESTOR_CONTROL_GROUP, channel)
+                try:
+                    message = await asyncio.wait_for(self.channel_layer.receive(channel), timeout=3600)
+                except asyncio.TimeoutError:
+                    continue
+                await self.handle_control(message)
+        finally:
+            await self.channel_layer.group_discard(settings.INGESTOR_CONTROL_GROUP, channel)
+
+    async def handle_control(self, message):
+        """Обработка управляющего сообщения"""
+        if message['type'] == 'subscriptions.sync':
+            await self.sync_subscriptions()
+        elif message['type'] == 'alerts.changed':
+            if self.alerts:
+                await self.alerts.refresh(message['alert_id'])
+        elif message['type'] == 'subscriptions.interest':
+            if message['delta'] > 0:
+                if message['symbol'] not in self.pairs:
+                    await self.sync_subscriptions()
+            else:
+                # Отписка выполняется с задержкой на случай быстрого переподключения клиента
+                asyncio.get_running_loop().call_later(
+                    settings.SUBSCRIBE_ON_DEMAND_GRACE,
+                    lambda: asyncio.ensure_future(self.sync_subscriptions())
+                )
+
     async def initialize_pairs(self):
         """Инициализация пар криптовалют в базе данных"""
         for pair in self.pairs:
@@ -156,21 +418,54 @@ class BinanceWebsocketClient:
 
         # Инициализируем пары в базе данных
         await self.initialize_pairs()
+        if self.alerts:
+            await self.alerts.load()
+        if self.spool:
+            await self.recover_spool()
+        if self.pipeline:
+            await self.pipeline.start()
+
+        # Подключаем дополнительные соединения и применяем подписки из таблицы CryptoPair
+        await self.subscriptions.open_extra_shards()
+        if self.cluster:
+            await self.cluster.heartbeat()
+        await self.sync_subscriptions()
+        self.background_tasks = [
+            asyncio.ensure_future(self.run_subscription_sync()),
+            asyncio.ensure_future(self.listen_control()),
+            asyncio.ensure_future(self.market_state.run_publisher(lambda: self.is_running)),
+        ]
+        if self.cluster:
+            self.background_tasks.append(asyncio.ensure_future(self.cluster.run()))
+        if self.spool:
+            self.background_tasks.append(asyncio.ensure_future(self.run_spooler()))
+            self.background_tasks.append(asyncio.ensure_future(self.run_spool_writer()))
 
         try:
             while self.is_running:
                 try:
                     message = await self.websocket.recv()
+                    if self.recorder:
+                        self.recorder.record(message)
                     await self.process_message(message)
                 except websockets.exceptions.ConnectionClosed:
+                    RECONNECTS.labels('primary').inc()
                     logger.warning("WebSocket connection closed, reconnecting...")
                     await asyncio.sleep(5)
                     await self.connect()
         finally:
             # Сохраняем все оставшиеся данные перед выходом
-            if self.price_buffer:
-                await self.save_price_updates()
+            for task in self.background_tasks:
+                task.cancel()
+            await self.subscriptions.close()
+            await self.flush()
+            if self.pipeline:
+                await self.pipeline.stop()
+            if self.cluster:
+                await self.cluster.leave()
             await self.disconnect()
+            if self.recorder:
+                self.recorder.close()
 
     async def start(self):
         """Запуск клиента Binance WebSocket"""
@@ -180,4 +475,7 @@ class BinanceWebsocketClient:
     async def stop(self):
         """Остановка клиента"""
         self.is_running = False
-        await self.disconnect()
\ No newline at end of file
+        await self.disconnect()
+        if self.event_log:
+            await self.event_log.close()
+        await self.market_state.close()
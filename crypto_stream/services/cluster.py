@@ -0,0 +1,286 @@
+"""
+Кластерный режим инжестора: пары распределяются между несколькими узлами.
+
+Узлы регистрируются в Redis (сортированное множество с временем истечения
+регистрации) и продлевают ее каждые CLUSTER_HEARTBEAT_INTERVAL секунд. Владелец
+пары определяется согласованным хэшированием по живым узлам, право на прием пары
+закрепляется арендой — ключом Redis с TTL, который продлевает только владелец.
+
+- Узел присоединился: часть пар по кольцу переходит к нему, прежний владелец
+  отписывается, записывает буфер в БД и освобождает аренду, новый захватывает ее.
+- Узел упал: его регистрация и аренды истекают через CLUSTER_LEASE_SECONDS,
+  пары захватывают оставшиеся узлы.
+
+Захватив пару, узел дозагружает через REST API сделки между последней записанной
+в БД и первой полученной из потока, поэтому смена владельца не оставляет пропусков.
+"""
+import os
+import time
+import bisect
+import socket
+import asyncio
+import hashlib
+import logging
+from decimal import Decimal
+
+import aiohttp
+import redis.asyncio as redis
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from crypto_stream.models import PairStats, PriceUpdate
+from crypto_stream.services.metrics import BUFFER_ROWS
+from crypto_stream.services.stream_handlers import from_millis
+
+logger = logging.getLogger(__name__)
+
+NODES_KEY = 'ingestor:nodes'
+LEASE_KEY = 'ingestor:lease:{}'
+RESUME_PAGE = 1000  # Максимальный размер страницы /api/v3/historicalTrades
+
+# Продление и освобождение аренды только ее владельцем
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def ring_hash(value):
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Кольцо согласованного хэширования с виртуальными узлами"""
+
+    def __init__(self, nodes, replicas=None):
+        replicas = replicas or settings.CLUSTER_VIRTUAL_NODES
+        points = sorted((ring_hash(f"{node}#{index}"), node) for node in nodes for index in range(replicas))
+        self.hashes = [point for point, _ in points]
+        self.nodes = [node for _, node in points]
+
+    def owner(self, key):
+        """Узел, отвечающий за ключ"""
+        if not self.nodes:
+            return None
+        return self.nodes[bisect.bisect(self.hashes, ring_hash(key)) % len(self.nodes)]
+
+
+class LeaseStore:
+    """Регистрация узлов и аренды пар в Redis"""
+
+    def __init__(self, url=None):
+        self.redis = redis.Redis.from_url(url or settings.REDIS_URL)
+        self.renew_script = self.redis.register_script(RENEW_SCRIPT)
+        self.release_script = self.redis.register_script(RELEASE_SCRIPT)
+
+    async def heartbeat(self, node_id, ttl):
+        """Продление регистрации узла и удаление истекших регистраций"""
+        now = int(time.time() * 1000)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zadd(NODES_KEY, {node_id: now + int(ttl * 1000)})
+            pipe.zremrangebyscore(NODES_KEY, '-inf', now)
+            await pipe.execute()
+
+    async def members(self):
+        """Живые узлы кластера"""
+        now = int(time.time() * 1000)
+        return sorted(node.decode() for node in await self.redis.zrangebyscore(NODES_KEY, now, '+inf'))
+
+    async def leave(self, node_id):
+        await self.redis.zrem(NODES_KEY, node_id)
+
+    async def acquire(self, symbol, node_id, ttl):
+        """Захват аренды пары, если она свободна"""
+        return bool(await self.redis.set(LEASE_KEY.format(symbol), node_id, nx=True, px=int(ttl * 1000)))
+
+    async def renew(self, symbols, node_id, ttl):
+        """Продление аренд, возвращает пары, аренда которых еще принадлежит узлу"""
+        symbols = list(symbols)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for symbol in symbols:
+                await self.renew_script(keys=[LEASE_KEY.format(symbol)], args=[node_id, int(ttl * 1000)], client=pipe)
+            results = await pipe.execute()
+        return {symbol for symbol, renewed in zip(symbols, results) if renewed}
+
+    async def release(self, symbol, node_id):
+        await self.release_script(keys=[LEASE_KEY.format(symbol)], args=[node_id])
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+class BinanceRestTradeSource:
+    """Получение прошедших сделок через REST API Binance"""
+
+    def __init__(self, base_url=None):
+        self.base_url = base_url or settings.BINANCE_REST_URI
+
+    async def fetch(self, symbol, from_id, limit):
+        """Сделки пары, начиная с идентификатора from_id"""
+        async with aiohttp.ClientSession() as session:
+            async with session.get(
+                f"{self.base_url}/api/v3/historicalTrades",
+                params={'symbol': symbol.upper(), 'fromId': from_id, 'limit': limit}
+            ) as response:
+                response.raise_for_status()
+                return await response.json()
+
+
+class ClusterCoordinator:
+    """Участие инжестора в кластере: регистрация, аренды пар и дозагрузка при смене владельца"""
+
+    def __init__(self, client, store=None, trade_source=None, node_id=None):
+        self.client = client
+        self.store = store or LeaseStore()
+        self.trade_source = trade_source or BinanceRestTradeSource()
+        self.node_id = node_id or settings.CLUSTER_NODE_ID or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_seconds = settings.CLUSTER_LEASE_SECONDS
+        self.members = []
+        self.ring = HashRing([])
+        self.owned = set()  # Пары, аренда которых принадлежит узлу
+        self.waiting = set()  # Пары узла по кольцу, аренду которых еще держит прежний владелец
+        self.releasing = set()  # Пары, которые узел освободит после отписки
+        self.first_live = {}  # Первая сделка из потока для пар, по которым идет дозагрузка
+        self.resume_tasks = {}
+
+    async def heartbeat(self):
+        """Продление регистрации и аренд, возвращает True, если нужно пересмотреть распределение"""
+        await self.store.heartbeat(self.node_id, self.lease_seconds)
+        members = await self.store.members()
+        changed = members != self.members
+        if changed:
+            logger.info(f"Cluster members of {self.node_id}: {', '.join(members)}")
+            self.members = members
+            self.ring = HashRing(members)
+
+        if self.owned:
+            held = await self.store.renew(self.owned, self.node_id, self.lease_seconds)
+            lost = self.owned - held
+            if lost:
+                # Аренда истекла (например, узел был недоступен), пары уже могли захватить другие узлы
+                logger.warning(f"Node {self.node_id} lost leases of {', '.join(sorted(lost))}")
+                self.owned -= lost
+                self.stop_resume(lost)
+                changed = True
+        return changed or bool(self.waiting)
+
+    async def claim(self, candidates):
+        """Захват аренд пар, закрепленных за узлом по кольцу; возвращает пары для подписки"""
+        wanted = {symbol for symbol in candidates if self.ring.owner(symbol) == self.node_id}
+        self.releasing = self.owned - wanted
+        for symbol in sorted(wanted - self.owned):
+            if await self.store.acquire(symbol, self.node_id, self.lease_seconds):
+                logger.info(f"Node {self.node_id} acquired {symbol}")
+                self.owned.add(symbol)
+                self.start_resume(symbol)
+        self.waiting = wanted - self.owned
+        return [symbol for symbol in candidates if symbol in wanted and symbol in self.owned]
+
+    async def release(self):
+        """Освобождение аренд пар, от которых узел отписался"""
+        if not self.releasing:
+            return
+        # Сделки записываются до передачи аренды, новый владелец продолжит с последней из них
+        await self.client.flush()
+        for symbol in sorted(self.releasing):
+            await self.store.release(symbol, self.node_id)
+            logger.info(f"Node {self.node_id} released {symbol}")
+        self.stop_resume(self.releasing)
+        self.owned -= self.releasing
+        self.releasing = set()
+
+    async def run(self):
+        """Периодическое продление регистрации и пересмотр распределения пар"""
+        while self.client.is_running:
+            await asyncio.sleep(settings.CLUSTER_HEARTBEAT_INTERVAL)
+            try:
+                if await self.heartbeat():
+                    await self.client.sync_subscriptions()
+            except Exception as e:
+                logger.error(f"Cluster heartbeat of {self.node_id} failed: {e}")
+
+    async def leave(self):
+        """Выход из кластера: пары сразу переходят к остальным узлам"""
+        self.stop_resume(set(self.resume_tasks))
+        for symbol in sorted(self.owned):
+            await self.store.release(symbol, self.node_id)
+        self.owned = set()
+        await self.store.leave(self.node_id)
+        await self.store.close()
+
+    def observe_trade(self, symbol, trade_id):
+        """Учет сделки из потока: первая сделка ограничивает дозагрузку"""
+        if symbol in self.resume_tasks and symbol not in self.first_live:
+            self.first_live[symbol] = trade_id
+
+    def start_resume(self, symbol):
+        self.first_live.pop(symbol, None)
+        self.resume_tasks[symbol] = asyncio.ensure_future(self.resume(symbol))
+
+    def stop_resume(self, symbols):
+        for symbol in symbols:
+            task = self.resume_tasks.pop(symbol, None)
+            if task:
+                task.cancel()
+
+    @sync_to_async
+    def last_persisted_trade_id(self, symbol):
+        # Последняя записанная сделка берется из статистики пары, без сортировки PriceUpdate
+        last_id = PairStats.objects.filter(pair__symbol=symbol).values_list('last_trade_id', flat=True).first()
+        if last_id is not None:
+            return last_id
+        return PriceUpdate.objects.filter(
+            pair__symbol=symbol, trade_id__isnull=False
+        ).order_by('-timestamp').values_list('trade_id', flat=True).first()
+
+    async def resume(self, symbol):
+        """Дозагрузка сделок между последней записанной в БД и первой полученной из потока"""
+        fetched = 0
+        try:
+            last_id = await self.last_persisted_trade_id(symbol)
+            if last_id is None:
+                return
+            from_id = last_id + 1
+            polled = False
+            while fetched < settings.CLUSTER_RESUME_MAX_TRADES:
+                trades = await self.trade_source.fetch(symbol, from_id, RESUME_PAGE)
+                first_live = self.first_live.get(symbol)
+                if first_live is not None:
+                    trades = [trade for trade in trades if trade['id'] < first_live]
+                if not trades:
+                    # Поток мог еще не прислать первую сделку: ждем ее один интервал
+                    if first_live is not None or polled:
+                        break
+                    polled = True
+                    await asyncio.sleep(settings.CLUSTER_HEARTBEAT_INTERVAL)
+                    continue
+
+                self.client.price_buffer.setdefault(symbol, []).extend({
+                    'price': Decimal(trade['price']),
+                    'timestamp': from_millis(trade['time']),
+                    'trade_id': trade['id'],
+                    'quantity': Decimal(trade['qty']),
+                    'buyer_order_id': None,
+                    'seller_order_id': None,
+                    'is_buyer_maker': trade['isBuyerMaker']
+                } for trade in trades)
+                BUFFER_ROWS.inc(len(trades))
+                fetched += len(trades)
+                from_id = trades[-1]['id'] + 1
+                if first_live is not None and from_id >= first_live:
+                    break
+            logger.info(f"Node {self.node_id} resumed {symbol} after trade {last_id}, backfilled {fetched} trades")
+        except Exception as e:
+            logger.error(f"Failed to backfill {symbol} after failover: {e}")
+        finally:
+            if self.resume_tasks.get(symbol) is asyncio.current_task():
+                del self.resume_tasks[symbol]
+                self.first_live.pop(symbol, None)
@@ -0,0 +1,169 @@
+"""
+Прореженная история цен для длинных интервалов.
+
+Интервал делится на корзины одинаковой ширины, для каждой корзины возвращаются
+цены открытия и закрытия, минимум, максимум, число сделок и объем. Агрегирование
+выполняется в БД (GROUP BY номера корзины), клиенту передается не больше
+`max_points` строк независимо от числа сделок в интервале. Минимум и максимум
+сохраняют выбросы, которые теряются при простом прореживании по числу строк.
+"""
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, FloatField, Func, Max, Min, Sum
+
+from crypto_stream.models import ArchiveSegment, PriceUpdate
+from crypto_stream.services.archive import ArchiveStorage, SegmentReader, archive_cutoff, from_micros, to_micros
+
+
+class BucketIndex(Func):
+    """Номер корзины ширины `width` секунд, отсчитываемой от `origin` (аналог date_bin)"""
+    output_field = FloatField()
+
+    def __init__(self, expression, origin, width, **extra):
+        self.origin = origin
+        self.width = width
+        super().__init__(expression, **extra)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.source_expressions[0])
+        return f"FLOOR(EXTRACT(EPOCH FROM ({sql} - %s)) / %s)", [*params, self.origin, self.width]
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.source_expressions[0])
+        return (
+            f"CAST((julianday({sql}) - julianday(%s)) * 86400.0 / %s AS INTEGER)",
+            [*params, connection.ops.adapt_datetimefield_value(self.origin), self.width],
+        )
+
+
+def bucket_width(start_time, end_time, max_points=None, resolution=None):
+    """Ширина корзины в секундах: не меньше `resolution` и не больше `max_points` корзин на интервал"""
+    max_points = min(max_points or settings.HISTORY_MAX_POINTS, settings.HISTORY_MAX_POINTS)
+    span = max((end_time - start_time).total_seconds(), 1)
+    return max(resolution or 0, math.ceil(span / max_points))
+
+
+def merge_bucket(buckets, index, first_time, first_price, last_time, last_price, low, high, count, volume):
+    """Добавление статистики в корзину (части одной корзины из БД и из архива)"""
+    bucket = buckets.get(index)
+    if bucket is None:
+        buckets[index] = {
+            'first_time': first_time, 'open': first_price, 'last_time': last_time, 'close': last_price,
+            'low': low, 'high': high, 'count': count, 'volume': volume,
+        }
+        return
+    if first_time < bucket['first_time']:
+        bucket['first_time'], bucket['open'] = first_time, first_price
+    if last_time > bucket['last_time']:
+        bucket['last_time'], bucket['close'] = last_time, last_price
+    bucket['low'] = min(bucket['low'], low)
+    bucket['high'] = max(bucket['high'], high)
+    bucket['count'] += count
+    bucket['volume'] += volume
+
+
+def database_buckets(pair, start_time, end_time, width, buckets):
+    """Агрегирование сделок из таблицы PriceUpdate по корзинам в БД"""
+    queryset = PriceUpdate.objects.filter(pair=pair, timestamp__gte=start_time, timestamp__lte=end_time)
+    rows = list(
+        queryset.annotate(bucket=BucketIndex('timestamp', start_time, width))
+        .order_by()
+        .values('bucket')
+        .annotate(
+            first_time=Min('timestamp'), last_time=Max('timestamp'),
+            low=Min('price'), high=Max('price'), count=Count('id'), volume=Sum('quantity'),
+        )
+    )
+    if not rows:
+        return
+
+    # Цены открытия и закрытия — сделки на границах корзин, не больше двух строк на корзину
+    boundaries = {row['first_time'] for row in rows} | {row['last_time'] for row in rows}
+    prices = {}
+    for timestamp, price in (
+        queryset.filter(timestamp__in=boundaries).order_by('timestamp', 'trade_id', 'id')
+        .values_list('timestamp', 'price')
+    ):
+        prices.setdefault(timestamp, []).append(price)
+
+    for row in rows:
+        merge_bucket(
+            buckets, int(row['bucket']),
+            row['first_time'], prices[row['first_time']][0],
+            row['last_time'], prices[row['last_time']][-1],
+            row['low'], row['high'], row['count'], row['volume'] or 0,
+        )
+
+
+def archive_buckets(pair, start_time, end_time, width, buckets, storage=None):
+    """
+    Агрегирование сделок из архивных сегментов по корзинам при чтении.
+
+    Строки группы упорядочены по времени, поэтому соседние сделки одной корзины
+    сворачиваются на месте и добавляются в общую корзину один раз.
+    """
+    storage = storage or ArchiveStorage()
+    origin = to_micros(start_time)
+    width_micros = width * 1000000
+    segments = ArchiveSegment.objects.filter(
+        pair=pair, start_time__lte=end_time, end_time__gte=start_time
+    ).order_by('start_time')
+    for segment in segments:
+        with SegmentReader(storage.fetch(segment.name)) as reader:
+            for group in reader.column_groups(start_time, end_time, ('timestamp', 'price', 'quantity')):
+                current = None
+                for timestamp, price, quantity in zip(group['timestamp'], group['price'], group['quantity']):
+                    index = (timestamp - origin) // width_micros
+                    if current is None or current[0] != index:
+                        if current is not None:
+                            merge_archived(buckets, current)
+                        current = [index, timestamp, price, timestamp, price, price, price, 0, 0]
+                    current[3], current[4] = timestamp, price
+                    current[5] = min(current[5], price)
+                    current[6] = max(current[6], price)
+                    current[7] += 1
+                    current[8] += quantity or 0
+                if current is not None:
+                    merge_archived(buckets, current)
+
+
+def merge_archived(buckets, bucket):
+    """Добавление свернутой части корзины из архива (время в микросекундах)"""
+    index, first_time, first_price, last_time, last_price, low, high, count, volume = bucket
+    merge_bucket(
+        buckets, index, from_micros(first_time), first_price, from_micros(last_time), last_price,
+        low, high, count, volume,
+    )
+
+
+def downsample_history(pair, start_time, end_time, max_points=None, resolution=None, archived=None):
+    """
+    Прореженная история пары: корзины по возрастанию времени и их ширина в секундах.
+
+    `archived` — читать ли архивные сегменты; по умолчанию, если интервал
+    начинается раньше горячего окна.
+    """
+    width = bucket_width(start_time, end_time, max_points, resolution)
+    buckets = {}
+    database_buckets(pair, start_time, end_time, width, buckets)
+    if archived is None:
+        archived = start_time < archive_cutoff()
+    # Сделки старше горячего окна попадают в те же корзины из архива
+    if archived:
+        archive_buckets(pair, start_time, end_time, width, buckets)
+
+    points = []
+    for index in sorted(buckets):
+        bucket = buckets[index]
+        points.append({
+            'time': start_time + timedelta(seconds=index * width),
+            'open': bucket['open'],
+            'high': bucket['high'],
+            'low': bucket['low'],
+            'close': bucket['close'],
+            'count': bucket['count'],
+            'volume': bucket['volume'],
+        })
+    return points, width
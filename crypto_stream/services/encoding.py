@@ -0,0 +1,173 @@
+import json
+import zlib
+import struct
+from collections import OrderedDict
+
+import msgpack
+
+# Подпротоколы WebSocket-маршрута ws/crypto/ и кодировка сделок для каждого из них.
+# Служебные сообщения (последняя цена при подключении, восстановление, оповещения)
+# во всех подпротоколах отправляются текстовыми кадрами JSON
+SUBPROTOCOLS = {
+    'crypto.json': 'json',
+    'crypto.json.deflate': 'deflate',
+    'crypto.msgpack': 'msgpack',
+    'crypto.struct': 'struct',
+    'crypto.struct.delta': 'delta',
+}
+PRICE_SCALE = 10 ** 8  # Цена и количество передаются целыми числами в единицах 1e-8
+
+# Сделка фиксированной длины (33 байта, little-endian): тип 1, trade_id, время в мс, цена, количество
+TICK = struct.Struct('<BqqqQ')
+# Разность с предыдущей сделкой пары (21 байт): тип 2, приращения trade_id, времени и цены, количество
+TICK_DELTA = struct.Struct('<BIiiQ')
+TICK_FULL, TICK_DIFF = 1, 2
+INT32 = 2 ** 31
+
+# Общий словарь сжатия: каждое сообщение сжимается независимо, поэтому один раз для всех клиентов
+DEFLATE_DICTIONARY = (
+    b'{"type":"price_update","symbol":"usdt","price":"0.00000000","timestamp":"T00:00:00.000000+00:00",'
+    b'"trade_id":0,"quantity":"0.00000000","stream_id":"-0","event_time":,"received_at":,"broadcast_at":}'
+)
+
+
+def build_price_update(symbol, price, timestamp, trade_id, quantity):
+    """Формирование сообщения об обновлении цены в формате, отправляемом клиентам"""
+    return {
+        'type': 'price_update',
+        'symbol': symbol,
+        'price': str(price),
+        'timestamp': timestamp.isoformat(),
+        'trade_id': trade_id,
+        'quantity': str(quantity) if quantity is not None else None
+    }
+
+
+def price_tick(price, timestamp, trade_id, quantity):
+    """Сделка в целых числах: trade_id, время в миллисекундах, цена и количество в единицах 1e-8"""
+    return (
+        trade_id or 0,
+        round(timestamp.timestamp() * 1000),
+        int(price * PRICE_SCALE),
+        int(quantity * PRICE_SCALE) if quantity is not None else 0,
+    )
+
+
+def deflate(data):
+    """Сжатие сообщения без заголовков zlib (raw deflate) с общим словарем"""
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, DEFLATE_DICTIONARY)
+    return compressor.compress(data) + compressor.flush()
+
+
+def inflate(data):
+    """Распаковка сообщения подпротокола crypto.json.deflate"""
+    decompressor = zlib.decompressobj(-15, DEFLATE_DICTIONARY)
+    return decompressor.decompress(data) + decompressor.flush()
+
+
+def encode_binary(event, tick):
+    """
+    Добавление в событие сделки фиксированной длины (33 байта).
+
+    Остальные бинарные представления строятся из нее потребителями по требованию
+    (binary_frame), поэтому инжестор не кодирует сделку для подпротоколов без клиентов.
+    """
+    event['tick'] = TICK.pack(TICK_FULL, *tick)
+    return event
+
+
+def delta_frame(tick, previous=None):
+    """Разность сделки с предыдущей сделкой клиента или полная запись"""
+    if previous is None:
+        return tick
+    _, trade_id, timestamp, price, quantity = TICK.unpack(tick)
+    _, previous_id, previous_timestamp, previous_price, _ = TICK.unpack(previous)
+    deltas = (trade_id - previous_id, timestamp - previous_timestamp, price - previous_price)
+    # Разность, не помещающаяся в 32 бита, заменяется полной записью
+    if 0 < deltas[0] < 2 * INT32 and -INT32 <= deltas[1] < INT32 and -INT32 <= deltas[2] < INT32:
+        return TICK_DELTA.pack(TICK_DIFF, *deltas, quantity)
+    return tick
+
+
+class FrameCache:
+    """
+    Кадры сделок в кодировках подпротоколов, построенные потребителями процесса.
+
+    Сделку получают все потребители пары почти одновременно, поэтому кадр
+    кодируется один раз на процесс и только для подпротоколов с клиентами.
+    """
+
+    encoders = {
+        'deflate': lambda event: deflate(event['text'].encode()),
+        'msgpack': lambda event: msgpack.packb(TICK.unpack(event['tick'])[1:]),
+    }
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.frames = OrderedDict()
+
+    def get(self, encoding, event):
+        """Кадр события в кодировке `encoding` (deflate или msgpack)"""
+        key = (encoding, event['text'])
+        frame = self.frames.get(key)
+        if frame is None:
+            frame = self.frames[key] = self.encoders[encoding](event)
+            if len(self.frames) > self.size:
+                self.frames.popitem(last=False)
+        return frame
+
+
+FRAMES = FrameCache()
+
+
+def binary_frame(encoding, event, previous=None):
+    """Кадр сделки в кодировке подпротокола; для delta — относительно предыдущей сделки клиента"""
+    if encoding == 'struct':
+        return event['tick']
+    if encoding == 'delta':
+        return delta_frame(event['tick'], previous)
+    return FRAMES.get(encoding, event)
+
+
+def encode_price_update(message):
+    """
+    Формирование события для channel layer с заранее сериализованным сообщением.
+
+    Сообщение кодируется в JSON один раз на обновление, а потребители
+    пересылают готовую строку клиентам без повторной сериализации.
+    """
+    event = {
+        'type': 'send_price_update',
+        'text': json.dumps(message, separators=(',', ':'))
+    }
+    # Идентификатор записи в журнале сделок нужен потребителю для отсечения дублей при восстановлении,
+    # отметки времени — для учета задержки доставки без разбора сериализованного сообщения
+    for field in ('stream_id', 'event_time', 'broadcast_at'):
+        if field in message:
+            event[field] = message[field]
+    return event
+
+
+def encode_depth_update(top):
+    """Формирование события channel layer с сериализованными верхними уровнями стакана"""
+    message = {'type': 'depth_update', **top}
+    return {
+        'type': 'send_depth_update',
+        'text': json.dumps(message, separators=(',', ':'))
+    }
+
+
+def encode_alert(message):
+    """Формирование события channel layer с сериализованным оповещением о цене"""
+    return {
+        'type': 'send_alert',
+        'text': json.dumps(message, separators=(',', ':'))
+    }
+
+
+def encode_stream_event(message):
+    """Формирование события channel layer с сериализованным событием дополнительного потока"""
+    return {
+        'type': 'send_stream_event',
+        'text': json.dumps(message, separators=(',', ':'))
+    }
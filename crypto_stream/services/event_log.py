@@ -0,0 +1,67 @@
+import json
+import logging
+import redis.asyncio as redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def stream_id_key(stream_id):
+    """Преобразование идентификатора записи Redis Stream ('<ms>-<seq>') в кортеж для сравнения"""
+    ms, _, seq = str(stream_id).partition('-')
+    return int(ms), int(seq or 0)
+
+
+class TradeEventLog:
+    """Ограниченный по длине журнал сделок в Redis Streams (один поток на пару)"""
+
+    def __init__(self, url=None, maxlen=None):
+        self.redis = redis.Redis.from_url(url or settings.REDIS_URL)
+        self.maxlen = maxlen or settings.TRADE_STREAM_MAXLEN
+
+    @staticmethod
+    def stream_key(symbol):
+        """Имя потока Redis для пары"""
+        return f"trades:{symbol}"
+
+    async def publish(self, symbol, message):
+        """Добавление сделки в поток пары, возвращает идентификатор записи"""
+        entry_id = await self.redis.xadd(
+            self.stream_key(symbol),
+            {'data': json.dumps(message, separators=(',', ':'))},
+            maxlen=self.maxlen,
+            approximate=True
+        )
+        return entry_id.decode()
+
+    async def read_since(self, symbol, since, count):
+        """Чтение записей потока, добавленных строго после идентификатора `since`"""
+        entries = await self.redis.xrange(
+            self.stream_key(symbol), min=f"({since}", max='+', count=count
+        )
+        return [
+            (entry_id.decode(), json.loads(fields[b'data']))
+            for entry_id, fields in entries
+        ]
+
+    async def first_id(self, symbol):
+        """Идентификатор самой старой записи, оставшейся в потоке после обрезки"""
+        entries = await self.redis.xrange(self.stream_key(symbol), min='-', max='+', count=1)
+        if not entries:
+            return None
+        return entries[0][0].decode()
+
+    async def close(self):
+        """Закрытие соединения с Redis"""
+        await self.redis.aclose()
+
+
+_event_log = None
+
+
+def get_event_log():
+    """Общий экземпляр журнала для WebSocket-потребителей процесса"""
+    global _event_log
+    if _event_log is None:
+        _event_log = TradeEventLog()
+    return _event_log
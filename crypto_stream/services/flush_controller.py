@@ -0,0 +1,118 @@
+"""
+Адаптивный выбор размера пачки и момента записи сделок в БД.
+
+Длительность записи пачки моделируется как a + b * rows по последним записям
+(метод наименьших квадратов по окну), хвост распределения учитывается
+множителем — наибольшим отношением фактической длительности к модели в окне.
+Размер пачки выбирается так, чтобы оценка p99 не превышала FLUSH_TARGET_LATENCY,
+и ограничивается FLUSH_MIN_ROWS (меньшие вставки неэффективны) и FLUSH_MAX_ROWS.
+При низкой частоте сделок буфер записывается не реже DATA_SAVE_INTERVAL,
+при превышении FLUSH_MAX_BUFFER_ROWS — сразу.
+"""
+import threading
+from collections import deque
+
+from django.conf import settings
+
+from crypto_stream.services.metrics import FLUSH_BATCH_ROWS, FLUSH_INTERVAL, FLUSH_RATE
+
+WARMUP = 4  # Записей до первой оценки модели; до нее пачка удваивается
+
+
+class FlushController:
+    """Размер пачки по измеренной длительности вставки и интервал записи по частоте сделок"""
+
+    def __init__(self, target_latency=None, min_rows=None, max_rows=None, min_interval=None,
+                 max_interval=None, max_buffer_rows=None, window=None, adaptive=None):
+        self.target_latency = target_latency or settings.FLUSH_TARGET_LATENCY
+        self.min_rows = min_rows or settings.FLUSH_MIN_ROWS
+        self.max_rows = max_rows or settings.FLUSH_MAX_ROWS
+        self.min_interval = min_interval if min_interval is not None else settings.FLUSH_MIN_INTERVAL
+        self.fixed_max_interval = max_interval
+        self.max_buffer_rows = max_buffer_rows or settings.FLUSH_MAX_BUFFER_ROWS
+        self.adaptive = settings.FLUSH_ADAPTIVE if adaptive is None else adaptive
+        self.samples = deque(maxlen=window or settings.FLUSH_WINDOW)  # (строк, секунд) последних записей
+        self.lock = threading.Lock()
+        self.rate = 0.0  # Сглаженная частота поступления строк в секунду
+        self.batch_rows = self.min_rows
+        self.interval = self.max_interval
+        self.publish()
+
+    @property
+    def max_interval(self):
+        """Максимальный интервал между записями (DATA_SAVE_INTERVAL читается при каждом обращении)"""
+        return self.fixed_max_interval or settings.DATA_SAVE_INTERVAL
+
+    def due(self, elapsed, buffered):
+        """Пора ли записывать `buffered` строк, накопленных за `elapsed` секунд"""
+        if buffered >= self.max_buffer_rows or elapsed >= self.max_interval:
+            return True
+        return self.adaptive and elapsed >= self.min_interval and buffered >= self.batch_rows
+
+    def record_rate(self, rows, seconds):
+        """Учет строк, поступивших за `seconds` секунд (между записями или переносами в спул)"""
+        if seconds <= 0:
+            return
+        rate = rows / seconds
+        self.rate = rate if not self.rate else 0.7 * self.rate + 0.3 * rate
+        self.update_interval()
+
+    def observe(self, rows, seconds):
+        """Учет длительности записи пачки из `rows` строк"""
+        if rows <= 0:
+            return
+        with self.lock:
+            self.samples.append((rows, seconds))
+            self.batch_rows = self.estimate_batch_rows()
+        self.update_interval()
+
+    def model(self):
+        """Коэффициенты a, b модели длительности a + b * rows и множитель хвоста"""
+        count = len(self.samples)
+        mean_rows = sum(rows for rows, _ in self.samples) / count
+        mean_seconds = sum(seconds for _, seconds in self.samples) / count
+        variance = sum((rows - mean_rows) ** 2 for rows, _ in self.samples)
+        if variance > 0:
+            slope = sum((rows - mean_rows) * (seconds - mean_seconds) for rows, seconds in self.samples) / variance
+            intercept = mean_seconds - slope * mean_rows
+        else:
+            slope, intercept = 0.0, 0.0
+        if slope <= 0 or intercept < 0:
+            # Разброс не позволяет оценить накладные расходы: длительность считается пропорциональной
+            slope, intercept = mean_seconds / mean_rows, 0.0
+        if slope <= 0:
+            return None
+        tail = max(seconds / (intercept + slope * rows) for rows, seconds in self.samples)
+        return intercept, slope, max(tail, 1.0)
+
+    def estimate_batch_rows(self):
+        """Наибольшая пачка, оценка p99 записи которой не превышает целевую длительность"""
+        if len(self.samples) < WARMUP:
+            # Мало измерений: пачка растет, пока запись укладывается в целевую длительность
+            _, seconds = self.samples[-1]
+            if seconds < self.target_latency / 2:
+                size = self.batch_rows * 2
+            elif seconds > self.target_latency:
+                size = self.batch_rows / 2
+            else:
+                size = self.batch_rows
+        else:
+            model = self.model()
+            if model is None:
+                return self.max_rows
+            intercept, slope, tail = model
+            size = (self.target_latency / tail - intercept) / slope
+        return int(min(max(size, self.min_rows), self.max_rows))
+
+    def update_interval(self):
+        """Ожидаемый интервал между записями при текущей частоте сделок"""
+        if self.adaptive and self.rate > 0:
+            self.interval = min(max(self.batch_rows / self.rate, self.min_interval), self.max_interval)
+        else:
+            self.interval = self.max_interval
+        self.publish()
+
+    def publish(self):
+        FLUSH_BATCH_ROWS.set(self.batch_rows)
+        FLUSH_INTERVAL.set(self.interval)
+        FLUSH_RATE.set(self.rate)
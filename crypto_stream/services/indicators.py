@@ -0,0 +1,303 @@
+"""
+Технические индикаторы по кэшированным рядам цен.
+
+Ряд пары для интервала (свечи OHLCV в непрерывных массивах NumPy) загружается
+из БД один раз и хранится в LRU-кэше процесса; новые сделки добавляются
+в последнюю свечу или открывают новую без повторной загрузки. Индикаторы
+считаются векторно по всему ряду, результат кэшируется до следующего изменения ряда.
+"""
+import math
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from crypto_stream.models import CryptoPair, Kline, PriceUpdate
+from crypto_stream.services.intervals import INDICATORS, INTERVALS
+
+
+def sma(values, period):
+    """Простое скользящее среднее через накопленную сумму"""
+    result = np.full(len(values), np.nan)
+    if len(values) >= period:
+        cumsum = np.cumsum(np.insert(values, 0, 0.0))
+        result[period - 1:] = (cumsum[period:] - cumsum[:-period]) / period
+    return result
+
+
+def exponential_smoothing(values, alpha, initial):
+    """
+    Рекуррентное сглаживание s[i] = s[i-1] + alpha * (x[i] - s[i-1]) в векторной форме.
+
+    Внутри блока значение выражается через степени (1 - alpha); длина блока
+    ограничена, чтобы (1 - alpha) ** -m не выходило за пределы float64.
+    """
+    decay = 1.0 - alpha
+    if decay <= 0:
+        return values.astype(float)
+    result = np.empty(len(values))
+    block = max(1, int(600 / -math.log(decay)))
+    previous = initial
+    for start in range(0, len(values), block):
+        chunk = values[start:start + block]
+        # s[j] = d^(j+1) * s[-1] + alpha * d^(j+1) * sum(x[i] / d^(i+1), i <= j), где d = 1 - alpha
+        powers = decay ** np.arange(1, len(chunk) + 1)
+        smoothed = powers * (previous + alpha * np.cumsum(chunk / powers))
+        result[start:start + len(chunk)] = smoothed
+        previous = smoothed[-1]
+    return result
+
+
+def ema(values, period):
+    """Экспоненциальное скользящее среднее, начальное значение — SMA первых `period` точек"""
+    result = np.full(len(values), np.nan)
+    if len(values) >= period:
+        seed = values[:period].mean()
+        result[period - 1] = seed
+        result[period:] = exponential_smoothing(values[period:], 2.0 / (period + 1), seed)
+    return result
+
+
+def rsi(values, period):
+    """Индекс относительной силы со сглаживанием Уайлдера"""
+    result = np.full(len(values), np.nan)
+    if len(values) <= period:
+        return result
+    changes = np.diff(values)
+    gains = np.clip(changes, 0, None)
+    losses = np.clip(-changes, 0, None)
+    average_gain = np.empty(len(changes) - period + 1)
+    average_loss = np.empty(len(changes) - period + 1)
+    average_gain[0], average_loss[0] = gains[:period].mean(), losses[:period].mean()
+    average_gain[1:] = exponential_smoothing(gains[period:], 1.0 / period, average_gain[0])
+    average_loss[1:] = exponential_smoothing(losses[period:], 1.0 / period, average_loss[0])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        strength = average_gain / average_loss
+        result[period:] = np.where(average_loss == 0, 100.0, 100.0 - 100.0 / (1.0 + strength))
+    return result
+
+
+def bollinger(values, period, width=2.0):
+    """Полосы Боллинджера: средняя линия и границы ± width стандартных отклонений"""
+    middle = sma(values, period)
+    deviation = np.full(len(values), np.nan)
+    if len(values) >= period:
+        windows = np.lib.stride_tricks.sliding_window_view(values, period)
+        deviation[period - 1:] = windows.std(axis=1)
+    return {'middle': middle, 'upper': middle + width * deviation, 'lower': middle - width * deviation}
+
+
+def vwap(turnover, volume, window):
+    """Средневзвешенная по объему цена за последние `window` свечей"""
+    turnover = np.cumsum(np.insert(turnover, 0, 0.0))
+    volume = np.cumsum(np.insert(volume, 0, 0.0))
+    lagged = np.maximum(np.arange(1, len(turnover)) - window, 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (turnover[1:] - turnover[lagged]) / (volume[1:] - volume[lagged])
+
+
+def to_list(values):
+    """Массив в список с None вместо NaN"""
+    return [None if math.isnan(value) else round(value, 8) for value in values.tolist()]
+
+
+class PriceSeries:
+    """Свечи пары за интервал в непрерывных массивах с дозаписью сделок"""
+
+    def __init__(self, symbol, interval, max_points=None):
+        self.symbol = symbol
+        self.interval = interval
+        self.seconds = INTERVALS[interval]
+        self.max_points = max_points or settings.INDICATOR_MAX_POINTS
+        capacity = self.max_points * 2
+        self.times = np.zeros(capacity, dtype=np.int64)
+        self.columns = {name: np.zeros(capacity) for name in ('open', 'high', 'low', 'close', 'volume', 'turnover')}
+        self.size = 0
+        self.last_trade_id = None
+        self.last_timestamp = None
+        self.version = 0
+        self.results = {}
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Начальная загрузка: закрытые свечи из Kline, иначе агрегирование сделок"""
+        pair = CryptoPair.objects.filter(symbol=self.symbol).first()
+        if pair is None:
+            return
+        since = timezone.now() - timedelta(seconds=self.seconds * self.max_points)
+        klines = list(
+            Kline.objects.filter(pair=pair, interval=self.interval, open_time__gte=since)
+            .order_by('open_time')
+            .values_list('open_time', 'open', 'high', 'low', 'close', 'volume', 'quote_volume')
+        )
+        with self.lock:
+            for open_time, *values in klines:
+                self.append_bar(int(open_time.timestamp()), *map(float, values))
+        # Сделки после последней закрытой свечи дополняют ряд
+        self.refresh(pair, since if not klines else klines[-1][0] + timedelta(seconds=self.seconds))
+
+    def refresh(self, pair=None, since=None):
+        """Дозапись сделок, сохраненных в БД после последней учтенной"""
+        pair = pair or CryptoPair.objects.filter(symbol=self.symbol).first()
+        if pair is None:
+            return
+        since = since or self.last_timestamp or timezone.now() - timedelta(seconds=self.seconds * self.max_points)
+        queryset = PriceUpdate.objects.filter(pair=pair, timestamp__gte=since)
+        if self.last_trade_id is not None:
+            queryset = queryset.filter(trade_id__gt=self.last_trade_id)
+        rows = list(queryset.order_by('timestamp', 'trade_id').values_list('timestamp', 'price', 'quantity', 'trade_id'))
+        if rows:
+            self.add_trades(
+                np.array([row[0].timestamp() for row in rows]),
+                np.array([float(row[1]) for row in rows]),
+                np.array([float(row[2] or 0) for row in rows]),
+                rows[-1][3],
+            )
+
+    def append_bar(self, bucket, open_, high, low, close, volume, turnover):
+        """Добавление новой свечи в конец ряда"""
+        if self.size == len(self.times):
+            # Массивы заполнены: сдвигаем последние max_points свечей в начало
+            keep = self.max_points - 1
+            self.times[:keep] = self.times[self.size - keep:self.size]
+            for column in self.columns.values():
+                column[:keep] = column[self.size - keep:self.size]
+            self.size = keep
+        index = self.size
+        self.times[index] = bucket
+        for name, value in zip(('open', 'high', 'low', 'close', 'volume', 'turnover'),
+                               (open_, high, low, close, volume, turnover)):
+            self.columns[name][index] = value
+        self.size += 1
+
+    def add_trades(self, timestamps, prices, quantities, last_trade_id=None):
+        """Векторная дозапись упорядоченных по времени сделок"""
+        with self.lock:
+            if self.size:
+                # Сделки старше последней свечи пропускаются
+                fresh = timestamps >= self.times[self.size - 1]
+                timestamps, prices, quantities = timestamps[fresh], prices[fresh], quantities[fresh]
+            if not len(timestamps):
+                return
+            buckets = (timestamps // self.seconds * self.seconds).astype(np.int64)
+            starts = np.flatnonzero(np.diff(buckets, prepend=buckets[0] - 1))
+            ends = np.append(starts[1:], len(buckets)) - 1
+            highs = np.maximum.reduceat(prices, starts)
+            lows = np.minimum.reduceat(prices, starts)
+            volumes = np.add.reduceat(quantities, starts)
+            turnovers = np.add.reduceat(prices * quantities, starts)
+
+            for i, start in enumerate(starts):
+                last = self.size - 1
+                if self.size and buckets[start] == self.times[last]:
+                    self.columns['high'][last] = max(self.columns['high'][last], highs[i])
+                    self.columns['low'][last] = min(self.columns['low'][last], lows[i])
+                    self.columns['close'][last] = prices[ends[i]]
+                    self.columns['volume'][last] += volumes[i]
+                    self.columns['turnover'][last] += turnovers[i]
+                else:
+                    self.append_bar(
+                        buckets[start], prices[start], highs[i], lows[i], prices[ends[i]], volumes[i], turnovers[i]
+                    )
+
+            self.last_timestamp = datetime.fromtimestamp(float(timestamps[-1]), tz=dt_timezone.utc)
+            if last_trade_id is not None:
+                self.last_trade_id = last_trade_id
+            self.version += 1
+            self.results = {}
+
+    def add_trade(self, timestamp, price, quantity, trade_id=None):
+        """Дозапись одной сделки из живого потока"""
+        if trade_id is not None and self.last_trade_id is not None and trade_id <= self.last_trade_id:
+            return
+        self.add_trades(np.array([timestamp]), np.array([price]), np.array([quantity]), trade_id)
+
+    def compute(self, indicators=INDICATORS, period=20, rsi_period=14, width=2.0, points=None):
+        """Значения индикаторов для последних `points` свечей"""
+        key = (tuple(indicators), period, rsi_period, width, points)
+        with self.lock:
+            cached = self.results.get(key)
+            if cached is not None:
+                return cached
+            # Индикаторы считаются по всем хранимым свечам, чтобы первые из
+            # последних max_points точек не оставались без значения
+            size = self.size
+            close = self.columns['close'][:size].copy()
+            volume = self.columns['volume'][:size].copy()
+            turnover = self.columns['turnover'][:size].copy()
+            times = self.times[:size].copy()
+            version = self.version
+
+        tail = slice(-min(points or self.max_points, self.max_points), None)
+        result = {
+            'symbol': self.symbol,
+            'interval': self.interval,
+            'times': (times[tail] * 1000).tolist(),
+            'close': to_list(close[tail]),
+        }
+        if 'sma' in indicators:
+            result['sma'] = to_list(sma(close, period)[tail])
+        if 'ema' in indicators:
+            result['ema'] = to_list(ema(close, period)[tail])
+        if 'rsi' in indicators:
+            result['rsi'] = to_list(rsi(close, rsi_period)[tail])
+        if 'bollinger' in indicators:
+            result['bollinger'] = {name: to_list(band[tail]) for name, band in bollinger(close, period, width).items()}
+        if 'vwap' in indicators:
+            result['vwap'] = to_list(vwap(turnover, volume, self.max_points)[tail])
+
+        with self.lock:
+            if self.version == version:
+                self.results[key] = result
+        return result
+
+
+class IndicatorCache:
+    """LRU-кэш рядов цен по паре и интервалу"""
+
+    def __init__(self, max_series=None):
+        self.max_series = max_series or settings.INDICATOR_CACHE_SIZE
+        self.series = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, symbol, interval):
+        """Ряд пары для интервала; загружается из БД при первом обращении, далее дополняется"""
+        key = (symbol, interval)
+        with self.lock:
+            series = self.series.get(key)
+            if series is not None:
+                self.series.move_to_end(key)
+        if series is not None:
+            series.refresh()
+            return series
+
+        series = PriceSeries(symbol, interval)
+        series.load()
+        with self.lock:
+            # Ряд мог быть загружен параллельным запросом
+            series = self.series.setdefault(key, series)
+            self.series.move_to_end(key)
+            while len(self.series) > self.max_series:
+                self.series.popitem(last=False)
+        return series
+
+    def add_trade(self, symbol, timestamp, price, quantity, trade_id=None):
+        """Дозапись сделки во все закэшированные ряды пары"""
+        with self.lock:
+            targets = [series for (cached_symbol, _), series in self.series.items() if cached_symbol == symbol]
+        for series in targets:
+            series.add_trade(timestamp, price, quantity, trade_id)
+
+
+_indicator_cache = None
+
+
+def get_indicator_cache():
+    """Общий кэш рядов цен для представлений и WebSocket-потребителей процесса"""
+    global _indicator_cache
+    if _indicator_cache is None:
+        _indicator_cache = IndicatorCache()
+    return _indicator_cache
@@ -0,0 +1,4 @@
+"""Интервалы свечей и поддерживаемые индикаторы (без NumPy, для проверки параметров запроса)"""
+
+INTERVALS = {'1m': 60, '5m': 300, '15m': 900, '1h': 3600, '4h': 14400, '1d': 86400}
+INDICATORS = ('sma', 'ema', 'rsi', 'bollinger', 'vwap')
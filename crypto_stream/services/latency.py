@@ -0,0 +1,169 @@
+"""
+Задержка доставки обновлений цен по этапам.
+
+Задержки учитываются в логарифмических корзинах (шаг 10%). Каждый процесс —
+инжестор, обработчики конвейера, веб-процессы с WebSocket-потребителями —
+накапливает приращения счетчиков и раз в LATENCY_PUBLISH_INTERVAL секунд
+прибавляет их к поминутному хэшу Redis одним конвейером HINCRBY, поэтому
+/api/latency/ показывает перцентили по всем процессам за последние
+LATENCY_WINDOW секунд. Доставка каждому клиенту учитывается выборочно
+(LATENCY_SAMPLE_RATE), а не для каждого подписчика каждой сделки.
+"""
+import math
+import time
+import random
+import asyncio
+import logging
+from bisect import bisect_left
+
+import redis
+import redis.asyncio as async_redis
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from crypto_stream.services.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Этапы доставки обновления цены:
+# exchange_to_receive — от времени события Binance до получения инжестором;
+# receive_to_broadcast — обработка в инжесторе до отправки в channel layer;
+# broadcast_to_deliver — от отправки в channel layer до отправки клиенту потребителем;
+# exchange_to_deliver — полный путь от биржи до отправки клиенту;
+# broadcast_to_client — до получения клиентом (по часам клиента, из эхо-сообщения);
+# broadcast_to_echo — до получения сервером эхо-сообщения клиента.
+STAGES = (
+    'exchange_to_receive', 'receive_to_broadcast', 'broadcast_to_deliver',
+    'exchange_to_deliver', 'broadcast_to_client', 'broadcast_to_echo',
+)
+
+STAGE_LATENCY = Histogram(
+    'price_update_stage_latency_seconds', 'Price update latency per delivery stage', ['stage']
+)
+
+COUNTS_KEY = 'latency:{}'  # Поминутный хэш счетчиков '<этап>:<корзина>'
+
+# Верхние границы корзин в секундах: от 0,1 мс до ~150 с с шагом 10%
+BOUNDS = tuple(0.0001 * 1.1 ** index for index in range(150))
+
+
+class LatencyTracker:
+    """Счетчики задержек по этапам с расчетом перцентилей"""
+
+    def __init__(self, url=None, local=False):
+        self.url = url or settings.REDIS_URL
+        self.local = local  # Счетчики только в памяти процесса, без Redis
+        self.counts = {}  # (этап, корзина) -> число задержек, еще не отправленных в Redis
+        self.redis = None
+        self.reader = None
+        self.next_publish = None
+        self.publish_task = None
+
+    @staticmethod
+    def sampled():
+        """Учитывать ли очередную доставку клиенту (доля LATENCY_SAMPLE_RATE)"""
+        return random.random() < settings.LATENCY_SAMPLE_RATE
+
+    def record(self, stage, seconds):
+        """Учет задержки этапа"""
+        seconds = max(seconds, 0)
+        key = (stage, bisect_left(BOUNDS, seconds))
+        self.counts[key] = self.counts.get(key, 0) + 1
+        STAGE_LATENCY.labels(stage).observe(seconds)
+        if not self.local:
+            self.schedule_publish()
+
+    def schedule_publish(self):
+        """Фоновая отправка счетчиков в Redis не чаще раза в LATENCY_PUBLISH_INTERVAL секунд"""
+        now = time.monotonic()
+        if self.next_publish is not None and now < self.next_publish:
+            return
+        first = self.next_publish is None
+        self.next_publish = now + settings.LATENCY_PUBLISH_INTERVAL
+        if first or (self.publish_task and not self.publish_task.done()):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # Вне цикла событий счетчики будут отправлены при следующей записи
+        self.publish_task = loop.create_task(self.publish())
+
+    async def publish(self):
+        """Прибавление накопленных счетчиков к хэшу текущей минуты"""
+        counts, self.counts = self.counts, {}
+        if not counts:
+            return 0
+        if self.redis is None:
+            self.redis = async_redis.Redis.from_url(self.url)
+
+        key = COUNTS_KEY.format(int(time.time() // 60))
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for (stage, bucket), count in counts.items():
+                    pipe.hincrby(key, f"{stage}:{bucket}", count)
+                pipe.expire(key, settings.LATENCY_WINDOW + 60)
+                await pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Failed to publish latency counters: {e}")
+            for bucket, count in counts.items():
+                self.counts[bucket] = self.counts.get(bucket, 0) + count
+            return 0
+        return len(counts)
+
+    def read_counts(self):
+        """Счетчики всех процессов за окно LATENCY_WINDOW (в режиме local — только этого процесса)"""
+        if self.local:
+            return dict(self.counts)
+        if self.reader is None:
+            self.reader = redis.Redis.from_url(self.url)
+
+        minute = int(time.time() // 60)
+        with self.reader.pipeline(transaction=False) as pipe:
+            for offset in range(math.ceil(settings.LATENCY_WINDOW / 60)):
+                pipe.hgetall(COUNTS_KEY.format(minute - offset))
+            hashes = pipe.execute()
+
+        counts = {}
+        for fields in hashes:
+            for field, count in fields.items():
+                stage, _, bucket = field.decode().rpartition(':')
+                key = (stage, int(bucket))
+                counts[key] = counts.get(key, 0) + int(count)
+        return counts
+
+    def percentiles(self, quantiles=(50, 90, 99)):
+        """Перцентили задержек по этапам в миллисекундах (верхние границы корзин)"""
+        histograms = {}
+        for (stage, bucket), count in self.read_counts().items():
+            histogram = histograms.setdefault(stage, [0] * (len(BOUNDS) + 1))
+            histogram[min(bucket, len(BOUNDS))] += count
+
+        result = {}
+        for stage in STAGES:
+            histogram = histograms.get(stage)
+            if not histogram:
+                continue
+            total = sum(histogram)
+            highest = max(bucket for bucket, count in enumerate(histogram) if count)
+            stats = {'count': total, 'max_ms': self.bound_ms(highest)}
+            for quantile in quantiles:
+                rank = min(total - 1, int(total * quantile / 100))
+                seen = 0
+                for bucket, count in enumerate(histogram):
+                    seen += count
+                    if seen > rank:
+                        break
+                stats[f'p{quantile}_ms'] = self.bound_ms(bucket)
+            result[stage] = stats
+        return result
+
+    @staticmethod
+    def bound_ms(bucket):
+        return round(BOUNDS[min(bucket, len(BOUNDS) - 1)] * 1000, 3)
+
+    def reset(self):
+        """Очистка неотправленных счетчиков процесса"""
+        self.counts.clear()
+
+
+LATENCY = LatencyTracker()
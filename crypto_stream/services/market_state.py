@@ -0,0 +1,218 @@
+"""
+Текущее состояние рынка, поддерживаемое инжестором в памяти.
+
+Для каждой пары хранятся последняя сделка, лучшие цены (bookTicker или локальный
+стакан) и 24-часовая статистика (miniTicker). Инжестор периодически записывает
+изменившиеся пары в хэш Redis одной командой HSET, веб-процессы читают снимок
+одной командой HMGET/HGETALL без обращения к БД. Верхние уровни локальных стаканов
+публикуются тем же конвейером в отдельный хэш, откуда их читают REST API и
+WebSocket-потребители любых процессов.
+"""
+import json
+import time
+import asyncio
+import logging
+
+import redis
+import redis.asyncio as async_redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_KEY = 'market:snapshot'
+BOOKS_KEY = 'market:books'
+
+
+class MarketState:
+    """Состояние пар в процессе инжестора"""
+
+    def __init__(self, url=None):
+        self.url = url or settings.REDIS_URL
+        self.redis = None
+        self.symbols = {}
+        self.dirty = set()
+        self.books = {}  # Стаканы инжестора по символам
+        self.published_books = {}  # Символ -> last_update_id опубликованного стакана
+
+    def state(self, symbol):
+        state = self.symbols.get(symbol)
+        if state is None:
+            state = self.symbols[symbol] = {'symbol': symbol}
+        self.dirty.add(symbol)
+        return state
+
+    def update_trade(self, symbol, price, trade_time):
+        state = self.state(symbol)
+        state['price'] = price
+        state['trade_time'] = trade_time
+
+    def update_quote(self, symbol, bid, bid_qty, ask, ask_qty):
+        state = self.state(symbol)
+        state['bid'] = bid
+        state['bid_qty'] = bid_qty
+        state['ask'] = ask
+        state['ask_qty'] = ask_qty
+
+    def update_stats(self, symbol, data):
+        """24-часовая статистика из события miniTicker"""
+        open_price = float(data['o'])
+        self.state(symbol)['stats_24h'] = {
+            'open': data['o'],
+            'high': data['h'],
+            'low': data['l'],
+            'close': data['c'],
+            'volume': data['v'],
+            'quote_volume': data['q'],
+            'change_percent': round((float(data['c']) - open_price) / open_price * 100, 4) if open_price else None,
+            'event_time': data['E'],
+        }
+
+    def update_book(self, book):
+        """Стакан пары публикуется вместе со снимком, пока он синхронизирован"""
+        self.books[book.symbol] = book
+
+    def changed_books(self, now):
+        """Верхние уровни изменившихся стаканов и символы рассинхронизированных"""
+        mapping, removed = {}, []
+        for symbol, book in self.books.items():
+            if not book.is_synced:
+                if self.published_books.pop(symbol, None) is not None:
+                    removed.append(symbol)
+            elif self.published_books.get(symbol) != book.last_update_id:
+                top = book.top(settings.ORDER_BOOK_PUBLISH_LEVELS)
+                top['updated_at'] = now
+                mapping[symbol] = json.dumps(top, separators=(',', ':'))
+                self.published_books[symbol] = top['last_update_id']
+        return mapping, removed
+
+    async def publish(self):
+        """Запись изменившихся пар и стаканов в Redis"""
+        if not self.dirty and not self.books:
+            return 0
+        now = int(time.time() * 1000)
+        books, removed = self.changed_books(now)
+        if not self.dirty and not books and not removed:
+            return 0
+        if self.redis is None:
+            self.redis = async_redis.Redis.from_url(self.url)
+
+        mapping = {}
+        for symbol in self.dirty:
+            state = self.symbols[symbol]
+            state['updated_at'] = now
+            mapping[symbol] = json.dumps(state, separators=(',', ':'))
+        self.dirty = set()
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            if mapping:
+                pipe.hset(SNAPSHOT_KEY, mapping=mapping)
+                # Снимок остановленного инжестора не должен выдаваться за актуальный
+                pipe.expire(SNAPSHOT_KEY, settings.MARKET_STATE_TTL)
+            if removed:
+                pipe.hdel(BOOKS_KEY, *removed)
+            if books:
+                pipe.hset(BOOKS_KEY, mapping=books)
+                pipe.expire(BOOKS_KEY, settings.MARKET_STATE_TTL)
+            await pipe.execute()
+        return len(mapping) + len(books)
+
+    async def run_publisher(self, is_running):
+        """Периодическая публикация состояния, пока `is_running()` истинно"""
+        interval = settings.MARKET_STATE_PUBLISH_INTERVAL
+        if not interval:
+            return
+        while is_running():
+            await asyncio.sleep(interval)
+            try:
+                await self.publish()
+            except Exception as e:
+                logger.error(f"Failed to publish market state: {e}")
+
+    async def close(self):
+        if self.redis is not None:
+            await self.redis.aclose()
+
+
+def parse_assets(pair):
+    """Разбор кросс-курса вида 'eth/btc' в (базовый актив, котируемый актив)"""
+    base, _, quote = pair.lower().partition('/')
+    return base.strip(), quote.strip()
+
+
+def leg(asset, states, via):
+    """Цена, bid и ask актива в валюте `via` или None, если пары нет в снимке"""
+    if asset == via:
+        return 1.0, 1.0, 1.0
+    state = states.get(f"{asset}{via}")
+    if state is None or 'price' not in state:
+        return None
+    price = float(state['price'])
+    return price, float(state.get('bid') or price), float(state.get('ask') or price)
+
+
+def derive_cross(base, quote, states, via=None):
+    """
+    Синтетический курс base/quote через пары к общей валюте, например ETH/BTC
+    из ETHUSDT и BTCUSDT. Bid кросса — по bid базы и ask котировки, ask — наоборот.
+    """
+    via = via or settings.MARKET_STATE_CROSS_VIA
+    base_leg, quote_leg = leg(base, states, via), leg(quote, states, via)
+    if base_leg is None or quote_leg is None:
+        return None
+    return {
+        'price': base_leg[0] / quote_leg[0],
+        'bid': base_leg[1] / quote_leg[2],
+        'ask': base_leg[2] / quote_leg[1],
+        'legs': [symbol for symbol in (f"{base}{via}", f"{quote}{via}") if symbol in states],
+    }
+
+
+def cross_matrix(assets, states, via=None):
+    """Матрица курсов между активами по последним ценам: matrix[a][b] — цена a в b"""
+    via = via or settings.MARKET_STATE_CROSS_VIA
+    prices = {}
+    for asset in assets:
+        asset_leg = leg(asset, states, via)
+        if asset_leg is not None:
+            prices[asset] = asset_leg[0]
+    return {
+        base: {quote: (prices[base] / prices[quote] if base in prices and quote in prices else None) for quote in assets}
+        for base in assets
+    }
+
+
+class MarketSnapshot:
+    """Чтение снимка состояния рынка в веб-процессе"""
+
+    def __init__(self, url=None):
+        self.redis = redis.Redis.from_url(url or settings.REDIS_URL)
+
+    def read(self, symbols=None):
+        """Состояние пар по символам (все пары, если symbols не задан)"""
+        if symbols is None:
+            raw = {symbol.decode(): value for symbol, value in self.redis.hgetall(SNAPSHOT_KEY).items()}
+        else:
+            symbols = list(symbols)
+            raw = dict(zip(symbols, self.redis.hmget(SNAPSHOT_KEY, symbols))) if symbols else {}
+        return {symbol: json.loads(value) for symbol, value in raw.items() if value is not None}
+
+    def read_book(self, symbol, depth):
+        """Верхние `depth` уровней опубликованного стакана пары или None"""
+        value = self.redis.hget(BOOKS_KEY, symbol)
+        if value is None:
+            return None
+        book = json.loads(value)
+        book['bids'] = book['bids'][:depth]
+        book['asks'] = book['asks'][:depth]
+        return book
+
+
+_market_snapshot = None
+
+
+def get_market_snapshot():
+    """Общий экземпляр для запросов процесса"""
+    global _market_snapshot
+    if _market_snapshot is None:
+        _market_snapshot = MarketSnapshot()
+    return _market_snapshot
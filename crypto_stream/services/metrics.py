@@ -0,0 +1,240 @@
+"""
+Метрики конвейера приема данных в текстовом формате Prometheus.
+
+Реестр реализован без внешних зависимостей: счетчики, gauge и гистограммы
+с метками, безопасные для использования из потока инжестора и веб-потоков.
+"""
+import abc
+import bisect
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ROWS_BUCKETS = (1, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+
+
+def _format_labels(labelnames, values, extra=()):
+    """Форматирование меток в виде {name="value",...}"""
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    """Форматирование числа для экспозиции"""
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(abc.ABC):
+    """Базовый класс метрики с необязательными метками"""
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.children = {}
+        (registry or REGISTRY).register(self)
+
+    def labels(self, *values, **kwargs):
+        """Дочерняя метрика для конкретного набора значений меток"""
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        key = tuple(str(value) for value in values)
+        child = self.children.get(key)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(key, self.new_child())
+        return child
+
+    @abc.abstractmethod
+    def new_child(self):
+        """Значение метрики для одного набора меток"""
+
+    def _default(self):
+        """Метрика без меток хранится под пустым ключом"""
+        return self.labels()
+
+    def collect(self):
+        """Строки экспозиции метрики"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self.children.items()):
+            lines.extend(child.expose(self.name, self.labelnames, key))
+        return lines
+
+
+class _Value:
+    """Числовое значение счетчика или gauge"""
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value):
+        with self.lock:
+            self.value = value
+
+    def expose(self, name, labelnames, key):
+        return [f"{name}{_format_labels(labelnames, key)} {_format_value(self.value)}"]
+
+
+class Counter(Metric):
+    """Монотонно возрастающий счетчик"""
+    kind = 'counter'
+
+    def new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+
+class Gauge(Metric):
+    """Произвольно изменяющееся значение"""
+    kind = 'gauge'
+
+    def new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def dec(self, amount=1):
+        self._default().dec(amount)
+
+    def set(self, value):
+        self._default().set(value)
+
+
+class _HistogramValue:
+    """Распределение наблюдений по корзинам"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def expose(self, name, labelnames, key):
+        with self.lock:
+            counts = list(self.counts)
+            total_sum = self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            labels = _format_labels(labelnames, key, [('le', _format_value(bound))])
+            lines.append(f"{name}_bucket{labels} {cumulative}")
+        labels = _format_labels(labelnames, key)
+        lines.append(f"{name}_sum{labels} {_format_value(total_sum)}")
+        lines.append(f"{name}_count{labels} {cumulative}")
+        return lines
+
+
+class Histogram(Metric):
+    """Гистограмма с фиксированными границами корзин"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(float(bound) for bound in buckets)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+
+class Registry:
+    """Реестр метрик процесса"""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# Метрики конвейера приема данных Binance
+FRAMES_RECEIVED = Counter('binance_frames_received_total', 'Frames received from Binance WebSocket')
+MESSAGES_PARSED = Counter(
+    'binance_messages_parsed_total', 'Messages parsed per symbol and event type', ['symbol', 'event']
+)
+PARSE_ERRORS = Counter('binance_parse_errors_total', 'Frames that could not be decoded as JSON')
+PROCESSING_ERRORS = Counter('binance_processing_errors_total', 'Messages that failed in a stream handler')
+BUFFER_ROWS = Gauge('ingest_buffer_rows', 'Price updates buffered in memory awaiting flush')
+FLUSH_DURATION = Histogram('ingest_flush_duration_seconds', 'Duration of a database flush')
+FLUSH_ROWS = Histogram('ingest_flush_rows', 'Rows written per database flush', buckets=ROWS_BUCKETS)
+GROUP_SEND_DURATION = Histogram('ingest_group_send_seconds', 'Duration of channel layer group_send')
+RECONNECTS = Counter('binance_reconnects_total', 'Reconnects to Binance WebSocket', ['connection'])
+SPOOL_BYTES = Gauge('ingest_spool_bytes', 'Bytes of spooled trades awaiting database write')
+SPOOL_LAG = Gauge('ingest_spool_lag_seconds', 'Age of the oldest spooled segment awaiting database write')
+SPOOL_DROPPED_ROWS = Counter('ingest_spool_dropped_rows_total', 'Spooled trades dropped over SPOOL_MAX_BYTES')
+FLUSH_BATCH_ROWS = Gauge('ingest_flush_batch_rows', 'Target rows per database flush chosen by the flush controller')
+FLUSH_INTERVAL = Gauge('ingest_flush_interval_seconds', 'Expected interval between flushes at the current trade rate')
+FLUSH_RATE = Gauge('ingest_flush_rate_rows', 'Smoothed rate of rows arriving for the database, rows per second')
+RATE_LIMITED = Counter('api_rate_limited_total', 'Client requests rejected by the rate limiter', ['endpoint'])
+QUERY_DURATION = Histogram('api_query_duration_seconds', 'Database time spent serving a client request', ['endpoint'])
+HOT_PATH_DURATION = Histogram('hot_path_duration_seconds', 'Duration of a hot path while profiling is active', ['path'])
+PROFILER_SAMPLE_DURATION = Histogram('profiler_sample_duration_seconds', 'Time spent taking one stack sample of all threads')
+PIPELINE_FRAMES = Counter('ingest_pipeline_frames_total', 'Frames handed to pipeline workers', ['worker'])
+
+
+def render_metrics():
+    """Текст экспозиции метрик процесса"""
+    return REGISTRY.render()
+
+
+async def start_metrics_server(port, host='0.0.0.0'):
+    """Минимальный HTTP-сервер метрик для отдельного процесса инжестора"""
+
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b'\r\n\r\n')
+            body = render_metrics().encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: text/plain; version=0.0.4\r\n"
+                + f"Content-Length: {len(body)}\r\n".encode()
+                + b"Connection: close\r\n\r\n"
+                + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"Metrics server listening on {host}:{port}")
+    return server
@@ -0,0 +1,264 @@
+import json
+import asyncio
+import logging
+import threading
+from pathlib import Path
+from decimal import Decimal
+
+from django.conf import settings
+from sortedcontainers import SortedDict
+
+logger = logging.getLogger(__name__)
+
+
+class OrderBookOutOfSync(Exception):
+    """Нарушена последовательность обновлений стакана, требуется новый снимок"""
+
+
+class OrderBook:
+    """
+    Локальная копия стакана заявок для одной пары.
+
+    Уровни хранятся в SortedDict, поэтому обновление уровня и получение
+    лучшей цены выполняются за O(log n).
+    """
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.bids = SortedDict()  # Цена -> объем, лучшая заявка на покупку в конце
+        self.asks = SortedDict()  # Цена -> объем, лучшая заявка на продажу в начале
+        self.last_update_id = None
+        self.is_synced = False
+        self.awaiting_first_diff = False
+        self.lock = threading.Lock()  # Стакан читается из REST-представлений в другом потоке
+
+    def reset(self):
+        """Сброс состояния стакана перед повторной синхронизацией"""
+        with self.lock:
+            self.bids.clear()
+            self.asks.clear()
+            self.last_update_id = None
+            self.is_synced = False
+
+    def apply_snapshot(self, snapshot):
+        """Загрузка снимка стакана, полученного из REST API"""
+        with self.lock:
+            self.bids.clear()
+            self.asks.clear()
+            for price, quantity in snapshot['bids']:
+                self._set_level(self.bids, price, quantity)
+            for price, quantity in snapshot['asks']:
+                self._set_level(self.asks, price, quantity)
+            self.last_update_id = snapshot['lastUpdateId']
+            self.awaiting_first_diff = True
+            self.is_synced = True
+
+    def apply_diff(self, event):
+        """
+        Применение инкрементального обновления из потока @depth.
+
+        Возвращает False для устаревших событий, которые уже учтены в снимке.
+        При разрыве последовательности выбрасывает OrderBookOutOfSync.
+        """
+        first_update_id = event['U']
+        final_update_id = event['u']
+
+        with self.lock:
+            if final_update_id <= self.last_update_id:
+                return False
+
+            if self.awaiting_first_diff:
+                # Первое событие после снимка должно перекрывать lastUpdateId + 1
+                if not first_update_id <= self.last_update_id + 1 <= final_update_id:
+                    raise OrderBookOutOfSync(
+                        f"{self.symbol}: first diff {first_update_id}-{final_update_id} "
+                        f"does not follow snapshot {self.last_update_id}"
+                    )
+            elif first_update_id != self.last_update_id + 1:
+                raise OrderBookOutOfSync(
+                    f"{self.symbol}: expected update {self.last_update_id + 1}, got {first_update_id}"
+                )
+
+            for price, quantity in event['b']:
+                self._set_level(self.bids, price, quantity)
+            for price, quantity in event['a']:
+                self._set_level(self.asks, price, quantity)
+
+            self.last_update_id = final_update_id
+            self.awaiting_first_diff = False
+            return True
+
+    @staticmethod
+    def _set_level(levels, price, quantity):
+        """Установка объема уровня, нулевой объем удаляет уровень"""
+        price = Decimal(price)
+        quantity = Decimal(quantity)
+        if quantity:
+            levels[price] = quantity
+        else:
+            levels.pop(price, None)
+
+    def best_bid(self):
+        """Лучшая цена покупки в виде (цена, объем)"""
+        with self.lock:
+            return self.bids.peekitem(-1) if self.bids else None
+
+    def best_ask(self):
+        """Лучшая цена продажи в виде (цена, объем)"""
+        with self.lock:
+            return self.asks.peekitem(0) if self.asks else None
+
+    def top(self, depth=10):
+        """Верхние уровни стакана для отправки клиентам"""
+        with self.lock:
+            bids = list(reversed(self.bids.items()[-depth:])) if depth else []
+            asks = list(self.asks.items()[:depth]) if depth else []
+            best_bid = self.bids.peekitem(-1) if self.bids else None
+            best_ask = self.asks.peekitem(0) if self.asks else None
+            last_update_id = self.last_update_id
+
+        return {
+            'symbol': self.symbol,
+            'last_update_id': last_update_id,
+            'best_bid': [str(best_bid[0]), str(best_bid[1])] if best_bid else None,
+            'best_ask': [str(best_ask[0]), str(best_ask[1])] if best_ask else None,
+            'bids': [[str(price), str(quantity)] for price, quantity in bids],
+            'asks': [[str(price), str(quantity)] for price, quantity in asks],
+        }
+
+
+class BinanceRestSnapshotSource:
+    """Получение снимков стакана через REST API Binance"""
+
+    def __init__(self, base_url=None):
+        self.base_url = base_url or settings.BINANCE_REST_URI
+
+    async def fetch(self, symbol, limit):
+        """Запрос снимка стакана для пары"""
+        # aiohttp нужен только инжестору, веб-процессы его не загружают
+        import aiohttp
+
+        async with aiohttp.ClientSession() as session:
+            async with session.get(
+                f"{self.base_url}/api/v3/depth",
+                params={'symbol': symbol.upper(), 'limit': limit}
+            ) as response:
+                response.raise_for_status()
+                return await response.json()
+
+
+class FixtureSnapshotSource:
+    """
+    Снимки стакана из локальных фикстур для тестов и отладки.
+
+    Принимает словарь {symbol: snapshot} или каталог с файлами <symbol>.json.
+    """
+
+    def __init__(self, source):
+        self.source = source
+
+    async def fetch(self, symbol, limit):
+        """Загрузка снимка стакана из фикстуры"""
+        if isinstance(self.source, dict):
+            return self.source[symbol]
+        with open(Path(self.source) / f"{symbol}.json") as f:
+            return json.load(f)
+
+
+def default_snapshot_source():
+    """Источник снимков согласно настройкам проекта"""
+    if settings.ORDER_BOOK_SNAPSHOT_FIXTURES:
+        return FixtureSnapshotSource(settings.ORDER_BOOK_SNAPSHOT_FIXTURES)
+    return BinanceRestSnapshotSource()
+
+
+class OrderBookManager:
+    """Синхронизация локальных стаканов по схеме «снимок + поток изменений»"""
+
+    sync_attempts = 3
+    retry_delay = 1  # Пауза в секундах между неудачными запросами снимка
+
+    def __init__(self, snapshot_source=None, depth_limit=None):
+        self.snapshot_source = snapshot_source or default_snapshot_source()
+        self.depth_limit = depth_limit or settings.ORDER_BOOK_SNAPSHOT_LIMIT
+        self.books = {}
+        self.pending = {}  # События, полученные во время загрузки снимка
+        self.sync_tasks = {}
+        self.on_update = None  # Асинхронный обработчик, вызываемый после изменения стакана
+
+    def get(self, symbol):
+        """Синхронизированный стакан пары или None"""
+        book = self.books.get(symbol)
+        if book and book.is_synced:
+            return book
+        return None
+
+    async def handle_diff(self, event):
+        """Обработка события depthUpdate"""
+        symbol = event['s'].lower()
+        book = self.books.get(symbol)
+
+        if book is None or not book.is_synced:
+            self._buffer(symbol, event)
+            return
+
+        try:
+            applied = book.apply_diff(event)
+        except OrderBookOutOfSync as e:
+            logger.warning(f"Order book out of sync, resynchronizing: {e}")
+            book.reset()
+            self._buffer(symbol, event)
+            return
+
+        if applied and self.on_update:
+            await self.on_update(book)
+
+    def _buffer(self, symbol, event):
+        """Буферизация события до загрузки снимка и запуск синхронизации"""
+        self.pending.setdefault(symbol, []).append(event)
+        if symbol not in self.sync_tasks:
+            self.sync_tasks[symbol] = asyncio.ensure_future(self.sync(symbol))
+
+    async def sync(self, symbol):
+        """Загрузка снимка и применение накопленных событий"""
+        book = self.books.setdefault(symbol, OrderBook(symbol))
+        try:
+            for attempt in range(1, self.sync_attempts + 1):
+                try:
+                    snapshot = await self.snapshot_source.fetch(symbol, self.depth_limit)
+                except Exception as e:
+                    logger.error(f"Failed to fetch order book snapshot for {symbol}: {e}")
+                    await asyncio.sleep(self.retry_delay)
+                    continue
+
+                book.apply_snapshot(snapshot)
+                try:
+                    for event in self.pending.get(symbol, []):
+                        book.apply_diff(event)
+                except OrderBookOutOfSync as e:
+                    # Снимок старше буферизованных событий, запрашиваем новый
+                    logger.warning(f"Snapshot attempt {attempt} for {symbol} is stale: {e}")
+                    book.reset()
+                    continue
+
+                self.pending.pop(symbol, None)
+                logger.info(f"Order book for {symbol} synchronized at {book.last_update_id}")
+                if self.on_update:
+                    await self.on_update(book)
+                return True
+
+            self.pending.pop(symbol, None)
+            return False
+        finally:
+            self.sync_tasks.pop(symbol, None)
+
+
+_order_book_manager = None
+
+
+def get_order_book_manager():
+    """Общий для процесса инжестора менеджер стаканов"""
+    global _order_book_manager
+    if _order_book_manager is None:
+        _order_book_manager = OrderBookManager()
+    return _order_book_manager
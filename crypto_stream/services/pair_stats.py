@@ -0,0 +1,122 @@
+"""
+Статистика сделок пар в таблице PairStats.
+
+Инжестор учитывает каждую пачку сделок в той же транзакции, в которой пишет
+ее в PriceUpdate, поэтому количество строк, первая и последняя сделка и объем
+пары читаются одной строкой вместо COUNT(*)/MIN/MAX/SUM по всей таблице.
+Повторно полученные сделки (догрузка в кластере, повтор спула) не записываются
+и не учитываются.
+"""
+from decimal import Decimal
+
+from django.db.models import Case, Count, DateTimeField, DecimalField, F, Max, Min, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest, Least
+
+from crypto_stream.models import ArchiveSegment, CryptoPair, PairStats, PriceUpdate
+
+
+def summarize(rows):
+    """Сводка пачки строк буфера цен пары"""
+    last = max(rows, key=lambda row: row['timestamp'])
+    trade_ids = [row['trade_id'] for row in rows if row.get('trade_id') is not None]
+    return {
+        'trade_count': len(rows),
+        'first_trade_at': min(row['timestamp'] for row in rows),
+        'last_trade_at': last['timestamp'],
+        'last_price': last['price'],
+        'last_trade_id': max(trade_ids) if trade_ids else None,
+        'volume': sum((row.get('quantity') or Decimal(0) for row in rows), Decimal(0)),
+    }
+
+
+def new_trades(pair, rows):
+    """
+    Строки пачки, сделок которых еще нет в PriceUpdate (повторы внутри пачки отбрасываются).
+
+    Идентификаторы сделок пары растут, поэтому уже записанные ищутся одним
+    запросом по диапазону идентификаторов пачки в уникальном индексе.
+    """
+    trade_ids = [row['trade_id'] for row in rows if row.get('trade_id') is not None]
+    if not trade_ids:
+        return rows
+    seen = set(PriceUpdate.objects.filter(
+        pair=pair, trade_id__gte=min(trade_ids), trade_id__lte=max(trade_ids)
+    ).values_list('trade_id', flat=True))
+    result = []
+    for row in rows:
+        trade_id = row.get('trade_id')
+        if trade_id is not None:
+            if trade_id in seen:
+                continue
+            seen.add(trade_id)
+        result.append(row)
+    return result
+
+
+def update_pair_stats(pair, rows):
+    """Учет записанных сделок пары (вызывается в транзакции записи строк)"""
+    if not rows:
+        return
+    summary = summarize(rows)
+    first = Value(summary['first_trade_at'], output_field=DateTimeField())
+    last = Value(summary['last_trade_at'], output_field=DateTimeField())
+    changes = {
+        'trade_count': F('trade_count') + summary['trade_count'],
+        'volume': F('volume') + Value(summary['volume'], output_field=DecimalField()),
+        # Least/Greatest с NULL в SQLite возвращают NULL, в PostgreSQL — другой аргумент
+        'first_trade_at': Coalesce(Least('first_trade_at', first), first),
+        'last_trade_at': Coalesce(Greatest('last_trade_at', last), last),
+        # Правые части UPDATE вычисляются по прежним значениям строки
+        'last_price': Case(
+            When(Q(last_trade_at__isnull=True) | Q(last_trade_at__lte=summary['last_trade_at']),
+                 then=Value(summary['last_price'], output_field=DecimalField())),
+            default=F('last_price'),
+        ),
+    }
+    if summary['last_trade_id'] is not None:
+        last_trade_id = Value(summary['last_trade_id'])
+        changes['last_trade_id'] = Coalesce(Greatest('last_trade_id', last_trade_id), last_trade_id)
+
+    # Сделки пары могут писать одновременно основной процесс (догрузка в кластере) и
+    # обработчик конвейера: пустая строка создается без ошибки при конфликте
+    if not PairStats.objects.filter(pair=pair).update(**changes):
+        PairStats.objects.bulk_create([PairStats(pair=pair)], ignore_conflicts=True)
+        PairStats.objects.filter(pair=pair).update(**changes)
+
+
+def archive_pair_stats(pair, count):
+    """Учет строк, перенесенных в холодное хранилище (вызывается в транзакции удаления)"""
+    PairStats.objects.filter(pair=pair).update(
+        trade_count=F('trade_count') - count,
+        archived_count=F('archived_count') + count,
+    )
+
+
+def rebuild_pair_stats(pairs=None):
+    """
+    Полный пересчет статистики по таблицам PriceUpdate и ArchiveSegment.
+
+    Нужен один раз для сделок, записанных до появления PairStats. Объем
+    перенесенных в архив сделок не восстанавливается, сегменты его не хранят.
+    """
+    pairs = pairs if pairs is not None else CryptoPair.objects.all()
+    for pair in pairs:
+        trades = PriceUpdate.objects.filter(pair=pair)
+        totals = trades.aggregate(
+            trade_count=Count('id'), first_trade_at=Min('timestamp'), last_trade_at=Max('timestamp'),
+            last_trade_id=Max('trade_id'), volume=Sum('quantity'),
+        )
+        archived = ArchiveSegment.objects.filter(pair=pair).aggregate(
+            archived_count=Sum('row_count'), first_trade_at=Min('start_time'),
+        )
+        last_price = trades.order_by('-timestamp', '-id').values_list('price', flat=True).first()
+        firsts = [value for value in (totals['first_trade_at'], archived['first_trade_at']) if value is not None]
+        PairStats.objects.update_or_create(pair=pair, defaults={
+            'trade_count': totals['trade_count'],
+            'archived_count': archived['archived_count'] or 0,
+            'first_trade_at': min(firsts) if firsts else None,
+            'last_trade_at': totals['last_trade_at'],
+            'last_price': last_price,
+            'last_trade_id': totals['last_trade_id'],
+            'volume': totals['volume'] or 0,
+        })
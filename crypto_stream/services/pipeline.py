@@ -0,0 +1,274 @@
+"""
+Конвейерный режим инжестора: использование нескольких ядер для приема данных.
+
+Основной процесс только читает кадры из соединений с Binance и передает их
+процессам-обработчикам пачками через multiprocessing.Queue. Обработчики разбирают
+события, транслируют обновления, проверяют оповещения и пишут в БД параллельно.
+Кадры распределяются по паре (crc32 символа), поэтому порядок событий каждой
+пары сохраняется.
+
+Модуль не импортирует модели при загрузке: процессы-обработчики запускаются
+методом spawn и настраивают Django сами.
+"""
+import os
+import re
+import json
+import time
+import zlib
+import queue
+import asyncio
+import logging
+import itertools
+import multiprocessing
+
+from django.conf import settings
+
+from crypto_stream.services.metrics import PIPELINE_FRAMES
+
+logger = logging.getLogger(__name__)
+
+SYMBOL_PATTERN = re.compile(r'"s"\s*:\s*"([^"]*)"')  # Допускает пробелы, как в json.dumps по умолчанию
+
+
+def frame_symbol(frame):
+    """Символ пары из кадра Binance без полного разбора JSON"""
+    match = SYMBOL_PATTERN.search(frame)
+    return match.group(1).lower() if match else None
+
+
+class IngestPipeline:
+    """Распределение кадров между процессами-обработчиками"""
+
+    def __init__(self, client, workers=None, options=None):
+        self.client = client
+        self.workers = workers or settings.PIPELINE_WORKERS
+        self.options = options or {}
+        self.context = multiprocessing.get_context('spawn')
+        self.queues = [self.context.Queue(settings.PIPELINE_QUEUE_SIZE) for _ in range(self.workers)]
+        self.acks = self.context.Queue()
+        self.processes = []
+        self.batches = [[] for _ in range(self.workers)]
+        self.partitions = {}
+        self.flush_ids = itertools.count(1)
+        self.task = None
+
+    def partition(self, symbol):
+        index = self.partitions.get(symbol)
+        if index is None:
+            index = self.partitions[symbol] = zlib.crc32(symbol.encode()) % self.workers
+        return index
+
+    async def start(self):
+        """Запуск процессов-обработчиков и периодической отправки пачек"""
+        for index, frames in enumerate(self.queues):
+            process = self.context.Process(
+                target=run_worker, args=(index, frames, self.acks, self.options),
+                name=f"ingest-worker-{index}", daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+        self.task = asyncio.ensure_future(self.run_sender())
+        logger.info(f"Started {self.workers} ingest pipeline workers")
+
+    async def dispatch(self, message, received_at):
+        """Передача кадра обработчику его пары; False, если кадр не относится к паре"""
+        if isinstance(message, bytes):
+            message = message.decode()
+        symbol = frame_symbol(message)
+        if symbol is None:
+            return False
+
+        # Первая сделка из потока ограничивает дозагрузку пары после смены владельца в кластере
+        cluster = self.client.cluster
+        if cluster and symbol in cluster.resume_tasks and symbol not in cluster.first_live:
+            data = json.loads(message)
+            if data.get('e') == 'trade':
+                cluster.observe_trade(symbol, data['t'])
+            elif data.get('e') == 'aggTrade':
+                cluster.observe_trade(symbol, data['l'])
+
+        index = self.partition(symbol)
+        batch = self.batches[index]
+        batch.append((received_at, message))
+        if len(batch) >= settings.PIPELINE_BATCH_SIZE:
+            await self.send(index)
+        return True
+
+    async def put(self, index, item, deadline=None):
+        """Помещение в очередь обработчика без блокировки цикла событий; False по истечении `deadline`"""
+        while True:
+            try:
+                self.queues[index].put_nowait(item)
+                return True
+            except queue.Full:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+                # Обработчик не успевает: чтение сокета приостанавливается
+                await asyncio.sleep(settings.PIPELINE_BATCH_INTERVAL)
+
+    async def send(self, index, deadline=None):
+        """Отправка накопленной пачки обработчику с ожиданием места в очереди"""
+        batch, self.batches[index] = self.batches[index], []
+        if not await self.put(index, batch, deadline):
+            self.batches[index] = batch + self.batches[index]
+            return False
+        PIPELINE_FRAMES.labels(str(index)).inc(len(batch))
+        return True
+
+    async def send_all(self, deadline=None):
+        sent = True
+        for index, batch in enumerate(self.batches):
+            if batch:
+                sent = await self.send(index, deadline) and sent
+        return sent
+
+    async def run_sender(self):
+        """Отправка неполных пачек, чтобы задержка не зависела от частоты сделок"""
+        while True:
+            await asyncio.sleep(settings.PIPELINE_BATCH_INTERVAL)
+            await self.send_all()
+            # Собственный буфер основного процесса (сделки, дозагруженные кластером);
+            # со спулом его записывает фоновая задача клиента
+            if self.client.spool is None and self.client.has_pending_data() and self.client.flush_due():
+                await self.client.save_price_updates()
+
+    async def flush(self, timeout=None):
+        """Запись в БД всех переданных обработчикам данных"""
+        deadline = time.monotonic() + (timeout or settings.PIPELINE_FLUSH_TIMEOUT)
+        flush_id = next(self.flush_ids)
+        sent = await self.send_all(deadline)
+        for index in range(self.workers):
+            sent = sent and await self.put(index, ('flush', flush_id), deadline)
+        if not sent:
+            logger.error(f"Pipeline worker queues are full, flush {flush_id} not requested")
+            return False
+        loop = asyncio.get_running_loop()
+        pending = self.workers
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.error(f"Pipeline workers did not confirm flush {flush_id}")
+                return False
+            try:
+                ack = await loop.run_in_executor(None, self.acks.get, True, remaining)
+            except queue.Empty:
+                continue
+            if ack == flush_id:
+                pending -= 1
+        return True
+
+    async def stop(self):
+        """Остановка обработчиков: каждый записывает остаток своих буферов"""
+        if self.task:
+            self.task.cancel()
+        deadline = time.monotonic() + settings.PIPELINE_FLUSH_TIMEOUT
+        await self.send_all(deadline)
+        loop = asyncio.get_running_loop()
+        stopping = []
+        for index, process in enumerate(self.processes):
+            if process.is_alive() and await self.put(index, None, deadline):
+                stopping.append(process)
+            else:
+                logger.error(f"Pipeline worker {process.name} is not accepting frames, terminating")
+                process.terminate()
+        for process in stopping:
+            await loop.run_in_executor(None, process.join, settings.PIPELINE_FLUSH_TIMEOUT)
+            if process.is_alive():
+                logger.error(f"Pipeline worker {process.name} did not stop, terminating")
+                process.terminate()
+        self.processes = []
+
+
+class PipelineWorker:
+    """Процесс-обработчик: разбор, трансляция и запись в БД кадров своих пар"""
+
+    def __init__(self, index, frames, acks, options):
+        self.index = index
+        self.frames = frames
+        self.acks = acks
+        self.options = options
+
+    async def discard(self, *args):
+        pass
+
+    def next_item(self):
+        """Следующая пачка кадров или команда; None — остановка или завершение основного процесса"""
+        parent = multiprocessing.parent_process()
+        while True:
+            try:
+                return self.frames.get(timeout=1)
+            except queue.Empty:
+                if parent is not None and not parent.is_alive():
+                    return None
+
+    async def handle_control(self, message):
+        """Из управляющих сообщений обработчику нужны только изменения оповещений"""
+        if message['type'] == 'alerts.changed' and self.client.alerts:
+            await self.client.alerts.refresh(message['alert_id'])
+
+    async def run(self):
+        from crypto_stream.services.binance_client import BinanceWebsocketClient
+        from crypto_stream.services.profiling import get_profiler
+        from crypto_stream.services.spool import TradeSpool
+
+        client = self.client = BinanceWebsocketClient(record_frames=False, pipeline=False)
+        client.cluster = None
+        client.is_running = True
+        if client.spool:
+            # У каждого обработчика свой каталог спула, основной процесс восстанавливает их при запуске
+            client.spool = TradeSpool(os.path.join(settings.SPOOL_DIR, f"worker-{self.index}"))
+        client.handle_control = self.handle_control
+        if not self.options.get('broadcast', True):
+            client.broadcast = self.discard
+            client.order_books.on_update = self.discard
+        if not self.options.get('persist', True):
+            client.save_price_updates = self.discard_buffers
+        if client.alerts:
+            await client.alerts.load()
+        tasks = [
+            asyncio.ensure_future(client.listen_control()),
+            asyncio.ensure_future(client.market_state.run_publisher(lambda: client.is_running)),
+        ]
+        if client.spool:
+            tasks.append(asyncio.ensure_future(client.run_spooler()))
+            tasks.append(asyncio.ensure_future(client.run_spool_writer()))
+
+        loop = asyncio.get_running_loop()
+        # SIGUSR2 запускает профилирование или записывает собранные стеки в PROFILING_DIR
+        get_profiler().install_signal_handler(f"worker-{self.index}", loop)
+        try:
+            while True:
+                item = await loop.run_in_executor(None, self.next_item)
+                if item is None:
+                    break
+                if isinstance(item, tuple):
+                    # Запрос записи буферов от основного процесса
+                    await client.flush()
+                    self.acks.put(item[1])
+                    continue
+                for received_at, message in item:
+                    await client.process_message(message, received_at)
+        finally:
+            client.is_running = False
+            for task in tasks:
+                task.cancel()
+            await client.flush()
+            await client.market_state.close()
+
+    async def discard_buffers(self):
+        self.client.price_buffer = {}
+        for handler in self.client.handlers.values():
+            if handler.has_pending():
+                handler.buffer = {}
+        if self.client.alerts:
+            self.client.alerts.fired = []
+
+
+def run_worker(index, frames, acks, options):
+    """Точка входа процесса-обработчика"""
+    import django
+    django.setup()
+    from crypto_stream.services.profiling import get_profiler
+    if settings.PROFILING_ENABLED:
+        get_profiler().start()
+    asyncio.run(PipelineWorker(index, frames, acks, options).run())
@@ -0,0 +1,212 @@
+"""
+Выборочное профилирование процессов инжестора и веб-сервера.
+
+Фоновый поток каждые PROFILING_INTERVAL секунд снимает стеки всех потоков
+процесса (sys._current_frames) и считает одинаковые стеки. Выборка идет по
+реальному времени: ожидание в select цикла событий, в сокете Redis или БД видно
+так же, как работа разбора JSON или ORM. Результат — свернутые стеки
+(`поток;функция;функция N`), которые читают flamegraph.pl, speedscope и inferno.
+
+Кроме стеков, во время профилирования замеряется длительность горячих участков
+(process_message, save_price_updates, group_send, send_price_update) — метрика
+hot_path_duration_seconds. Без запущенного профилировщика декоратор hot_path
+стоит одну проверку счетчика.
+"""
+import os
+import sys
+import time
+import signal
+import asyncio
+import logging
+import functools
+import threading
+from collections import Counter
+
+from django.conf import settings
+
+from crypto_stream.services.metrics import HOT_PATH_DURATION, PROFILER_SAMPLE_DURATION
+
+logger = logging.getLogger(__name__)
+
+TRUNCATED = '[truncated]'  # Стек, не поместившийся в PROFILING_MAX_STACKS
+
+
+class SamplingProfiler:
+    """Периодический снимок стеков всех потоков процесса"""
+    active = 0  # Запущенных профилировщиков в процессе (включает замеры hot_path)
+
+    def __init__(self, interval=None, max_depth=None, max_stacks=None):
+        self.interval = interval or settings.PROFILING_INTERVAL
+        self.max_depth = max_depth or settings.PROFILING_MAX_DEPTH
+        self.max_stacks = max_stacks or settings.PROFILING_MAX_STACKS
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = None
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.labels = {}  # Кэш подписей кадров по объектам кода
+        self.prefixes = sorted({os.path.abspath(path) + os.sep for path in sys.path if path}, key=len, reverse=True)
+
+    @property
+    def running(self):
+        return self.thread is not None
+
+    def start(self):
+        """Запуск потока выборки"""
+        if self.running:
+            return
+        self.stop_event.clear()
+        self.started_at = time.time()
+        self.thread = threading.Thread(target=self.run, name='sampling-profiler', daemon=True)
+        SamplingProfiler.active += 1
+        self.thread.start()
+
+    def stop(self):
+        """Остановка потока выборки, собранные стеки сохраняются"""
+        if not self.running:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        SamplingProfiler.active -= 1
+
+    def run(self):
+        own = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            started = time.perf_counter()
+            self.sample(skip=own)
+            PROFILER_SAMPLE_DURATION.observe(time.perf_counter() - started)
+
+    def sample(self, skip=None):
+        """Одна выборка стеков всех потоков, кроме `skip`"""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        frames = sys._current_frames()
+        stacks = [
+            self.collapse(names.get(ident, str(ident)), frame)
+            for ident, frame in frames.items() if ident != skip
+        ]
+        del frames
+        with self.lock:
+            for stack in stacks:
+                if stack not in self.stacks and len(self.stacks) >= self.max_stacks:
+                    stack = TRUNCATED
+                self.stacks[stack] += 1
+            self.samples += 1
+
+    def collapse(self, thread_name, frame):
+        """Стек потока в свернутом виде: от корня к текущему кадру через ';'"""
+        labels = []
+        while frame is not None and len(labels) < self.max_depth:
+            labels.append(self.label(frame.f_code))
+            frame = frame.f_back
+        labels.append(thread_name)
+        return ';'.join(reversed(labels))
+
+    def label(self, code):
+        """Подпись кадра: функция и файл относительно sys.path"""
+        label = self.labels.get(code)
+        if label is None:
+            path = code.co_filename
+            for prefix in self.prefixes:
+                if path.startswith(prefix):
+                    path = path[len(prefix):]
+                    break
+            name = getattr(code, 'co_qualname', code.co_name)
+            label = self.labels[code] = f"{name} ({path}:{code.co_firstlineno})".replace(';', ':')
+        return label
+
+    def collapsed(self, reset=False):
+        """Свернутые стеки по убыванию числа выборок"""
+        with self.lock:
+            stacks = self.stacks
+            if reset:
+                self.stacks = Counter()
+                self.samples = 0
+                self.started_at = time.time()
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    def dump(self, prefix, directory=None, reset=True):
+        """Запись свернутых стеков в файл PROFILING_DIR/<prefix>-<pid>-<время>.folded"""
+        directory = directory or settings.PROFILING_DIR
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{prefix}-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+        with open(path, 'w') as output:
+            output.write(self.collapsed(reset=reset))
+        return path
+
+    def handle_signal(self, prefix):
+        """SIGUSR2: запуск профилирования, а если оно идет — запись стеков в файл"""
+        if not self.running:
+            self.start()
+            logger.info(f"Sampling profiler started in {prefix} (pid {os.getpid()})")
+            return
+        path = self.dump(prefix)
+        logger.info(f"Profile written to {path}")
+        # Профилирование по сигналу останавливается после записи, непрерывное продолжается
+        if not settings.PROFILING_ENABLED:
+            self.stop()
+
+    def install_signal_handler(self, prefix, loop=None):
+        """
+        Обработка SIGUSR2: в цикле событий `loop`, если он передан, иначе в главном потоке.
+
+        Обработчик signal.signal выполняется между байт-кодами главного потока, то есть
+        посреди произвольной корутины; loop.add_signal_handler вызывает его из цикла событий.
+        """
+        if not hasattr(signal, 'SIGUSR2'):
+            return
+        if loop is not None:
+            loop.add_signal_handler(signal.SIGUSR2, self.handle_signal, prefix)
+        else:
+            signal.signal(signal.SIGUSR2, lambda signum, frame: self.handle_signal(prefix))
+
+
+def hot_path(name):
+    """Замер длительности функции (синхронной или корутины) во время профилирования"""
+    def decorator(func):
+        histogram = HOT_PATH_DURATION.labels(name)
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if not SamplingProfiler.active:
+                    return await func(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - started)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not SamplingProfiler.active:
+                    return func(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def profile_for(seconds, interval=None):
+    """Свернутые стеки за `seconds` секунд отдельным профилировщиком"""
+    profiler = SamplingProfiler(interval=interval)
+    profiler.start()
+    try:
+        time.sleep(seconds)
+    finally:
+        profiler.stop()
+    return profiler.collapsed()
+
+
+_profiler = None
+
+
+def get_profiler():
+    """Общий профилировщик процесса (непрерывный или запускаемый по сигналу)"""
+    global _profiler
+    if _profiler is None:
+        _profiler = SamplingProfiler()
+    return _profiler
@@ -0,0 +1,246 @@
+"""
+Ограничение запросов истории цен маркерными корзинами.
+
+У каждого клиента несколько корзин: соединение WebSocket, IP-адрес и ключ API
+(заголовок X-API-Key). Запрос выполняется, только если токенов хватает во всех
+его корзинах. Стоимость запроса растет с числом запрошенных строк и длиной
+интервала, после выполнения дополнительно списывается время запросов к БД
+(корзина может уйти в долг). Корзины хранятся в Redis и проверяются одним
+Lua-скриптом, поэтому ограничение общее для всех веб-процессов и узлов; при
+недоступности Redis используются корзины в памяти процесса.
+"""
+import time
+import hashlib
+import logging
+import threading
+
+import redis
+import redis.asyncio as async_redis
+from django.conf import settings
+from redis.exceptions import RedisError
+from rest_framework.throttling import BaseThrottle
+
+from crypto_stream.services.metrics import RATE_LIMITED, QUERY_DURATION
+
+logger = logging.getLogger(__name__)
+
+BUCKET_KEY = 'ratelimit:{}:{}'
+
+# KEYS — корзины; ARGV — стоимость, флаг списания в долг, затем емкость и пополнение в секунду каждой корзины.
+# Возвращает 0, если токены списаны, иначе время ожидания в секундах.
+TOKEN_BUCKET_SCRIPT = """
+local now_time = redis.call('TIME')
+local now = now_time[1] * 1000 + math.floor(now_time[2] / 1000)
+local cost = tonumber(ARGV[1])
+local force = ARGV[2] == '1'
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[1 + i * 2])
+    local rate = tonumber(ARGV[2 + i * 2])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(now - ts, 0) / 1000 * rate)
+    levels[i] = tokens
+    local need = math.min(cost, capacity)
+    if tokens < need then
+        wait = math.max(wait, (need - tokens) / rate)
+    end
+end
+if wait > 0 and not force then
+    return tostring(wait)
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[1 + i * 2])
+    local rate = tonumber(ARGV[2 + i * 2])
+    local tokens = levels[i] - cost
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil((capacity - tokens) / rate * 1000) + 1000)
+end
+return '0'
+"""
+
+
+def history_cost(rows, span_seconds=0):
+    """Стоимость запроса истории в токенах: строки ответа и длина интервала"""
+    return (
+        1
+        + rows / settings.RATE_LIMIT_ROWS_PER_TOKEN
+        + max(span_seconds, 0) / settings.RATE_LIMIT_RANGE_PER_TOKEN
+    )
+
+
+def duration_cost(seconds):
+    """Стоимость времени запросов к БД в токенах"""
+    return seconds * settings.RATE_LIMIT_TOKENS_PER_DB_SECOND
+
+
+def api_key_identity(api_key):
+    """Ключ API хранится в Redis только в виде хэша"""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:32] if api_key else None
+
+
+def request_identities(request):
+    """Корзины HTTP-запроса: IP-адрес (с учетом NUM_PROXIES) и ключ API"""
+    return {
+        'ip': BaseThrottle().get_ident(request),
+        'api_key': api_key_identity(request.headers.get('X-API-Key')),
+    }
+
+
+def scope_identities(scope, channel_name):
+    """Корзины соединения WebSocket: само соединение, IP-адрес и ключ API"""
+    headers = dict(scope.get('headers') or [])
+    client = scope.get('client') or [None]
+    api_key = headers.get(b'x-api-key')
+    return {
+        'connection': channel_name,
+        'ip': client[0],
+        'api_key': api_key_identity(api_key.decode('latin-1')) if api_key else None,
+    }
+
+
+class LocalBuckets:
+    """Корзины в памяти процесса (та же логика, что и в Lua-скрипте)"""
+
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, buckets, cost, force=False):
+        now = time.monotonic()
+        with self.lock:
+            levels = []
+            wait = 0.0
+            for key, capacity, rate in buckets:
+                tokens, updated = self.buckets.get(key, (capacity, now))
+                tokens = min(capacity, tokens + (now - updated) * rate)
+                levels.append(tokens)
+                need = min(cost, capacity)
+                if tokens < need:
+                    wait = max(wait, (need - tokens) / rate)
+            if wait > 0 and not force:
+                return wait
+            for (key, _, _), tokens in zip(buckets, levels):
+                self.buckets[key] = (tokens - cost, now)
+        return 0.0
+
+
+class RateLimiter:
+    """Проверка и списание токенов в корзинах клиента"""
+
+    def __init__(self, url=None, limits=None, local=False):
+        self.limits = limits or settings.RATE_LIMITS
+        self.local = LocalBuckets()
+        self.redis = None if local else self.connect(url or settings.REDIS_URL)
+        self.script = self.redis.register_script(TOKEN_BUCKET_SCRIPT) if self.redis else None
+
+    def connect(self, url):
+        return redis.Redis.from_url(url)
+
+    def buckets(self, identities):
+        """(ключ, емкость, пополнение в секунду) для каждой известной корзины клиента"""
+        return [
+            (BUCKET_KEY.format(scope, value), *self.limits[scope])
+            for scope, value in identities.items()
+            if value and scope in self.limits
+        ]
+
+    @staticmethod
+    def script_args(buckets, cost, force):
+        args = [cost, int(force)]
+        for _, capacity, rate in buckets:
+            args.extend((capacity, rate))
+        return args
+
+    def acquire(self, identities, cost, force=False):
+        """Списание `cost` токенов; возвращает 0 или время ожидания в секундах, если токенов не хватает"""
+        buckets = self.buckets(identities)
+        if not buckets:
+            return 0.0
+        if self.script:
+            try:
+                return float(self.script(
+                    keys=[key for key, _, _ in buckets], args=self.script_args(buckets, cost, force)
+                ))
+            except RedisError as e:
+                logger.warning(f"Rate limiter falls back to local buckets: {e}")
+        return self.local.acquire(buckets, cost, force)
+
+    def charge(self, identities, cost):
+        """Списание токенов без проверки (время запросов к БД, известное после выполнения)"""
+        if cost > 0:
+            self.acquire(identities, cost, force=True)
+
+    def check(self, identities, cost, endpoint):
+        """Время ожидания для отклоненного запроса или 0; при RATE_LIMIT_ENABLED=False всегда 0"""
+        if not settings.RATE_LIMIT_ENABLED:
+            return 0.0
+        wait = self.acquire(identities, cost)
+        if wait:
+            RATE_LIMITED.labels(endpoint).inc()
+        return wait
+
+    def account(self, identities, seconds, endpoint):
+        """Учет длительности запросов к БД, выполненных для запроса клиента"""
+        QUERY_DURATION.labels(endpoint).observe(seconds)
+        if settings.RATE_LIMIT_ENABLED:
+            self.charge(identities, duration_cost(seconds))
+
+
+class AsyncRateLimiter(RateLimiter):
+    """Ограничитель для WebSocket-потребителей (асинхронный клиент Redis)"""
+
+    def connect(self, url):
+        return async_redis.Redis.from_url(url)
+
+    async def acquire(self, identities, cost, force=False):
+        buckets = self.buckets(identities)
+        if not buckets:
+            return 0.0
+        if self.script:
+            try:
+                return float(await self.script(
+                    keys=[key for key, _, _ in buckets], args=self.script_args(buckets, cost, force)
+                ))
+            except RedisError as e:
+                logger.warning(f"Rate limiter falls back to local buckets: {e}")
+        return self.local.acquire(buckets, cost, force)
+
+    async def charge(self, identities, cost):
+        if cost > 0:
+            await self.acquire(identities, cost, force=True)
+
+    async def check(self, identities, cost, endpoint):
+        if not settings.RATE_LIMIT_ENABLED:
+            return 0.0
+        wait = await self.acquire(identities, cost)
+        if wait:
+            RATE_LIMITED.labels(endpoint).inc()
+        return wait
+
+    async def account(self, identities, seconds, endpoint):
+        QUERY_DURATION.labels(endpoint).observe(seconds)
+        if settings.RATE_LIMIT_ENABLED:
+            await self.charge(identities, duration_cost(seconds))
+
+
+_rate_limiter = None
+_async_rate_limiter = None
+
+
+def get_rate_limiter():
+    """Общий экземпляр для HTTP-запросов процесса"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter()
+    return _rate_limiter
+
+
+def get_async_rate_limiter():
+    """Общий экземпляр для WebSocket-потребителей процесса"""
+    global _async_rate_limiter
+    if _async_rate_limiter is None:
+        _async_rate_limiter = AsyncRateLimiter()
+    return _async_rate_limiter
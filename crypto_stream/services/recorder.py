@@ -0,0 +1,151 @@
+import os
+import glob
+import gzip
+import time
+import queue
+import asyncio
+import logging
+import threading
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Сегмент, в который еще идет запись, имеет суффикс .part
+SEGMENT_SUFFIX = '.frames.gz'
+PART_SUFFIX = '.part'
+
+
+class FrameRecorder:
+    """
+    Запись необработанных кадров Binance во вращаемые сжатые сегменты.
+
+    Каждая строка сегмента: время получения (секунды Unix), табуляция, кадр.
+    Цикл событий только кладет кадр в очередь, сжатие и запись выполняются
+    в отдельном потоке. Сегмент закрывается по длительности или объему.
+    """
+
+    def __init__(self, directory=None, segment_seconds=None, segment_bytes=None):
+        self.directory = directory or settings.FRAME_RECORDER_DIR
+        self.segment_seconds = segment_seconds or settings.FRAME_RECORDER_SEGMENT_SECONDS
+        self.segment_bytes = segment_bytes or settings.FRAME_RECORDER_SEGMENT_BYTES
+        self.queue = queue.SimpleQueue()
+        self.file = None
+        self.path = None
+        self.opened_at = 0
+        self.written = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self.thread = threading.Thread(target=self.run, name='frame-recorder', daemon=True)
+        self.thread.start()
+
+    def record(self, frame, received_at=None):
+        """Постановка кадра в очередь записи"""
+        self.queue.put((received_at or time.time(), frame))
+
+    def run(self):
+        """Поток записи: сжатие кадров и вращение сегментов"""
+        while True:
+            try:
+                item = self.queue.get(timeout=1)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            if self.file and time.time() - self.opened_at >= self.segment_seconds:
+                self.rotate()
+            if not item:
+                continue
+            received_at, frame = item
+            if isinstance(frame, bytes):
+                frame = frame.decode()
+            if self.file is None:
+                self.open_segment(received_at)
+            line = f"{received_at:.6f}\t{frame}\n".encode()
+            self.file.write(line)
+            self.written += len(line)
+            if self.written >= self.segment_bytes:
+                self.rotate()
+        self.rotate()
+
+    def open_segment(self, started_at):
+        """Открытие нового сегмента"""
+        name = datetime.fromtimestamp(started_at, tz=timezone.utc).strftime('%Y%m%dT%H%M%S.%f')
+        self.path = os.path.join(self.directory, name + SEGMENT_SUFFIX)
+        self.file = gzip.open(self.path + PART_SUFFIX, 'wb', compresslevel=5)
+        self.opened_at = time.time()
+        self.written = 0
+
+    def rotate(self):
+        """Закрытие текущего сегмента; после закрытия он доступен для воспроизведения"""
+        if self.file is None:
+            return
+        self.file.close()
+        os.replace(self.path + PART_SUFFIX, self.path)
+        logger.info(f"Closed frame segment {self.path} ({self.written} bytes)")
+        self.file = None
+
+    def close(self):
+        """Запись оставшихся кадров и остановка потока"""
+        self.queue.put(None)
+        self.thread.join()
+
+
+def segment_paths(paths):
+    """Закрытые сегменты из списка файлов и каталогов в порядке записи"""
+    segments = []
+    for path in paths:
+        if os.path.isdir(path):
+            segments.extend(glob.glob(os.path.join(path, '*' + SEGMENT_SUFFIX)))
+        else:
+            segments.append(path)
+    return sorted(segments, key=os.path.basename)
+
+
+def read_frames(paths):
+    """Кадры сегментов: пары (время получения, кадр)"""
+    for path in segment_paths(paths):
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt') as f:
+            for line in f:
+                received_at, _, frame = line.rstrip('\n').partition('\t')
+                yield float(received_at), frame
+
+
+class FrameReplayer:
+    """
+    Воспроизведение записанных кадров через `process_message` клиента.
+
+    `speed` — множитель скорости относительно записи (1 — реальное время),
+    None — без пауз, с максимальной скоростью. `flush_every` — запись буфера
+    в БД каждые N кадров, так как при ускоренном воспроизведении интервал
+    DATA_SAVE_INTERVAL вмещает слишком много данных. Задержки доставки при
+    воспроизведении не учитываются: время событий записанных кадров в прошлом.
+    """
+
+    def __init__(self, paths, speed=None, flush_every=None):
+        self.paths = paths
+        self.speed = speed
+        self.flush_every = flush_every
+        self.replayed = 0
+
+    async def replay(self, client):
+        """Передача кадров клиенту с исходными интервалами между ними"""
+        started = time.perf_counter()
+        first_received_at = None
+        client.latency_tracing = False
+        for received_at, frame in read_frames(self.paths):
+            if self.speed:
+                if first_received_at is None:
+                    first_received_at = received_at
+                delay = (received_at - first_received_at) / self.speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await client.process_message(frame)
+            self.replayed += 1
+            # flush() переносит буфер в спул (если он включен) перед записью в БД
+            if self.flush_every and self.replayed % self.flush_every == 0 and client.has_pending_data():
+                await client.flush()
+
+        await client.flush()
+        return self.replayed
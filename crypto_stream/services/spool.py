@@ -0,0 +1,205 @@
+"""
+Журнал упреждающей записи сделок на локальном диске.
+
+Буфер цен каждые SPOOL_FSYNC_INTERVAL секунд дописывается в текущий сегмент
+(одна запись и один fsync на пачку), в БД строки передаются из сегментов.
+Позиция последней записанной в БД строки хранится в файле checkpoint, полностью
+переданные сегменты удаляются. Поэтому недоступность БД не увеличивает память
+процесса, а после сбоя или перезапуска передача продолжается с checkpoint.
+
+Доставка «хотя бы один раз»: если процесс упал между записью пачки в БД
+и обновлением checkpoint, пачка будет записана повторно.
+"""
+import os
+import glob
+import json
+import time
+import logging
+import itertools
+import threading
+from decimal import Decimal
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+
+from crypto_stream.services.metrics import SPOOL_BYTES, SPOOL_LAG, SPOOL_DROPPED_ROWS
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = '.spool'
+CHECKPOINT = 'checkpoint'
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def encode_row(symbol, row):
+    """Строка буфера цен в запись сегмента"""
+    quantity = row.get('quantity')
+    return json.dumps([
+        symbol,
+        str(row['price']),
+        (row['timestamp'] - EPOCH) // timedelta(microseconds=1),
+        row.get('trade_id'),
+        str(quantity) if quantity is not None else None,
+        row.get('buyer_order_id'),
+        row.get('seller_order_id'),
+        row.get('is_buyer_maker', False),
+    ], separators=(',', ':')) + '\n'
+
+
+def decode_rows(lines):
+    """Записи сегмента в буфер цен {symbol: [строки]}"""
+    buffer = {}
+    for line in lines:
+        symbol, price, timestamp, trade_id, quantity, buyer_order_id, seller_order_id, is_buyer_maker = json.loads(line)
+        buffer.setdefault(symbol, []).append({
+            'price': Decimal(price),
+            'timestamp': EPOCH + timedelta(microseconds=timestamp),
+            'trade_id': trade_id,
+            'quantity': Decimal(quantity) if quantity is not None else None,
+            'buyer_order_id': buyer_order_id,
+            'seller_order_id': seller_order_id,
+            'is_buyer_maker': is_buyer_maker,
+        })
+    return buffer
+
+
+class TradeSpool:
+    """Сегменты сделок, ожидающих записи в БД"""
+
+    def __init__(self, directory=None, segment_bytes=None, max_bytes=None):
+        self.directory = directory or settings.SPOOL_DIR
+        self.segment_bytes = segment_bytes or settings.SPOOL_SEGMENT_BYTES
+        self.max_bytes = max_bytes or settings.SPOOL_MAX_BYTES
+        self.lock = threading.Lock()
+        self.file = None
+        self.path = None
+        self.written = 0
+        self.draining = None  # Сегмент, который сейчас передается в БД
+        os.makedirs(self.directory, exist_ok=True)
+
+    def segment_paths(self):
+        """Сегменты в порядке записи (имя — время создания в миллисекундах)"""
+        return sorted(glob.glob(os.path.join(self.directory, '*' + SEGMENT_SUFFIX)))
+
+    def has_pending(self):
+        return bool(self.segment_paths())
+
+    def size(self):
+        return sum(os.path.getsize(path) for path in self.segment_paths())
+
+    def lag(self):
+        """Возраст самого старого сегмента, ожидающего записи в БД, в секундах"""
+        paths = self.segment_paths()
+        if not paths:
+            return 0.0
+        created = int(os.path.basename(paths[0])[:-len(SEGMENT_SUFFIX)])
+        return max(0.0, time.time() - created / 1000)
+
+    def append(self, buffer):
+        """Дописывание строк буфера цен в текущий сегмент, возвращает количество строк"""
+        data = ''.join(encode_row(symbol, row) for symbol, rows in buffer.items() for row in rows).encode()
+        if not data:
+            return 0
+        with self.lock:
+            if self.file is None:
+                self.open_segment()
+            self.file.write(data)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.written += len(data)
+            if self.written >= self.segment_bytes:
+                self.close_segment()
+            self.enforce_limit()
+        SPOOL_BYTES.set(self.size())
+        return data.count(b'\n')
+
+    def open_segment(self):
+        created = int(time.time() * 1000)
+        while os.path.exists(os.path.join(self.directory, f"{created:013d}{SEGMENT_SUFFIX}")):
+            created += 1
+        self.path = os.path.join(self.directory, f"{created:013d}{SEGMENT_SUFFIX}")
+        self.file = open(self.path, 'ab')
+        self.written = 0
+
+    def close_segment(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self.path = None
+
+    def enforce_limit(self):
+        """Удаление самых старых сегментов сверх SPOOL_MAX_BYTES (вызывается под блокировкой)"""
+        paths = self.segment_paths()
+        total = sum(os.path.getsize(path) for path in paths)
+        for path in paths:
+            if total <= self.max_bytes:
+                break
+            if path in (self.path, self.draining):
+                continue
+            with open(path, 'rb') as f:
+                dropped = sum(1 for _ in f)
+            total -= os.path.getsize(path)
+            os.remove(path)
+            SPOOL_DROPPED_ROWS.inc(dropped)
+            logger.error(f"Spool is over {self.max_bytes} bytes, dropped {dropped} trades from {path}")
+
+    def read_checkpoint(self):
+        try:
+            with open(os.path.join(self.directory, CHECKPOINT)) as f:
+                name, offset = f.read().split()
+            return name, int(offset)
+        except (FileNotFoundError, ValueError):
+            return None, 0
+
+    def write_checkpoint(self, name, offset):
+        path = os.path.join(self.directory, CHECKPOINT)
+        with open(path + '.tmp', 'w') as f:
+            f.write(f"{name} {offset}")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+    def drain(self, write, batch_rows=None):
+        """
+        Передача записей в БД функцией `write(buffer)` пачками по `batch_rows` строк.
+
+        Текущий сегмент закрывается, новые строки пишутся в следующий. При ошибке
+        `write` исключение передается вызывающему, позиция остается на начале пачки.
+        """
+        batch_rows = batch_rows or settings.SPOOL_DRAIN_BATCH
+        with self.lock:
+            self.close_segment()
+            paths = self.segment_paths()
+        checkpoint_name, checkpoint_offset = self.read_checkpoint()
+
+        total = 0
+        for path in paths:
+            name = os.path.basename(path)
+            offset = checkpoint_offset if name == checkpoint_name else 0
+            self.draining = path
+            try:
+                try:
+                    f = open(path, 'rb')
+                except FileNotFoundError:
+                    # Сегмент удален при превышении SPOOL_MAX_BYTES
+                    continue
+                with f:
+                    f.seek(offset)
+                    while True:
+                        lines = list(itertools.islice(f, batch_rows))
+                        # Незавершенная последняя строка (сбой во время записи) пропускается
+                        complete = [line for line in lines if line.endswith(b'\n')]
+                        if not complete:
+                            break
+                        write(decode_rows(complete))
+                        offset += sum(len(line) for line in complete)
+                        self.write_checkpoint(name, offset)
+                        total += len(complete)
+                with self.lock:
+                    os.remove(path)
+            finally:
+                self.draining = None
+
+        SPOOL_BYTES.set(self.size())
+        SPOOL_LAG.set(self.lag())
+        return total
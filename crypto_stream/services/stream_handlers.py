@@ -0,0 +1,255 @@
+import abc
+import time
+import logging
+from decimal import Decimal
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+from crypto_stream.models import CryptoPair, Kline
+from crypto_stream.services.encoding import (
+    build_price_update, encode_price_update, encode_stream_event, encode_alert, encode_binary, price_tick
+)
+from crypto_stream.services.metrics import BUFFER_ROWS
+from crypto_stream.services.latency import LATENCY
+
+logger = logging.getLogger(__name__)
+
+# Реестр обработчиков потоков: тип события Binance -> класс обработчика
+STREAM_HANDLERS = {}
+
+
+def register_handler(cls):
+    """Регистрация обработчика для типа события, указанного в `event_type`"""
+    STREAM_HANDLERS[cls.event_type] = cls
+    return cls
+
+
+def detect_event_type(data):
+    """Определение типа события Binance по содержимому сообщения"""
+    if 'e' in data:
+        return data['e']
+    # Сообщения потока bookTicker не содержат поля 'e'
+    if 'u' in data and 'b' in data and 'B' in data:
+        return 'bookTicker'
+    return None
+
+
+def from_millis(value):
+    """Преобразование времени Binance в миллисекундах в datetime"""
+    return datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+
+
+class StreamHandler(abc.ABC):
+    """
+    Базовый обработчик событий одного типа потока Binance.
+
+    Обработчик разбирает событие, буферизует данные для записи в БД,
+    сохраняет их в `persist` и транслирует обновления клиентам.
+    """
+    event_type = None
+
+    def __init__(self, client):
+        self.client = client
+
+    @abc.abstractmethod
+    async def handle(self, data):
+        """Обработка события, полученного из потока"""
+
+    def has_pending(self):
+        """Есть ли буферизованные данные, ожидающие записи в БД"""
+        return False
+
+    def persist(self):
+        """Синхронная запись буферизованных данных в БД"""
+
+
+@register_handler
+class TradeHandler(StreamHandler):
+    """Обработчик потока сделок <symbol>@trade"""
+    event_type = 'trade'
+
+    def parse(self, data):
+        """Разбор сделки в запись для буфера цен"""
+        return {
+            'price': Decimal(data['p']),
+            'timestamp': from_millis(data['T']),
+            'trade_id': data['t'],
+            'quantity': Decimal(data['q']),
+            'buyer_order_id': data['b'],
+            'seller_order_id': data['a'],
+            'is_buyer_maker': data['m']
+        }
+
+    async def handle(self, data):
+        symbol = data['s'].lower()
+        update = self.parse(data)
+
+        # Сделки записываются в БД через общий буфер цен клиента
+        self.client.price_buffer.setdefault(symbol, []).append(update)
+        BUFFER_ROWS.inc()
+        self.client.market_state.update_trade(symbol, data['p'], data['T'])
+        if self.client.cluster:
+            self.client.cluster.observe_trade(symbol, update['trade_id'])
+
+        # Отправляем обновление клиентам через WebSocket.
+        # Сообщение сериализуется один раз, а не для каждого подписчика
+        message = build_price_update(
+            symbol, update['price'], update['timestamp'], update['trade_id'], update['quantity']
+        )
+        if self.client.event_log:
+            message['stream_id'] = await self.client.event_log.publish(symbol, message)
+
+        # Отметки времени для трассировки задержки от биржи до клиента
+        if self.client.latency_tracing:
+            broadcast_at = time.time()
+            received_at = self.client.received_at or broadcast_at
+            message['event_time'] = data.get('E', data['T'])
+            message['received_at'] = int(received_at * 1000)
+            message['broadcast_at'] = int(broadcast_at * 1000)
+            LATENCY.record('receive_to_broadcast', broadcast_at - received_at)
+
+        event = encode_price_update(message)
+        if settings.WS_BINARY_PROTOCOLS:
+            encode_binary(event, price_tick(update['price'], update['timestamp'], update['trade_id'], update['quantity']))
+        await self.client.broadcast(symbol, event)
+
+        # Проверка правил оповещений: O(log n + k) на сделку, отправка только при срабатывании
+        if self.client.alerts:
+            for owner, alert in self.client.alerts.evaluate(
+                symbol, data['T'] / 1000, float(data['p']), float(data['q'])
+            ):
+                if owner is not None:
+                    await self.client.broadcast_alert(owner, symbol, encode_alert(alert))
+
+
+@register_handler
+class AggTradeHandler(TradeHandler):
+    """
+    Обработчик потока агрегированных сделок <symbol>@aggTrade.
+
+    Агрегированная сделка сохраняется как обновление цены с идентификатором
+    последней вошедшей в нее сделки.
+    """
+    event_type = 'aggTrade'
+
+    def parse(self, data):
+        return {
+            'price': Decimal(data['p']),
+            'timestamp': from_millis(data['T']),
+            'trade_id': data['l'],
+            'quantity': Decimal(data['q']),
+            'buyer_order_id': None,
+            'seller_order_id': None,
+            'is_buyer_maker': data['m']
+        }
+
+
+@register_handler
+class KlineHandler(StreamHandler):
+    """Обработчик потока свечей <symbol>@kline_<interval>, сохраняет закрытые свечи"""
+    event_type = 'kline'
+
+    def __init__(self, client):
+        super().__init__(client)
+        self.buffer = {}
+
+    async def handle(self, data):
+        symbol = data['s'].lower()
+        kline = data['k']
+
+        if kline['x']:
+            self.buffer.setdefault(symbol, []).append({
+                'interval': kline['i'],
+                'open_time': from_millis(kline['t']),
+                'close_time': from_millis(kline['T']),
+                'open': Decimal(kline['o']),
+                'high': Decimal(kline['h']),
+                'low': Decimal(kline['l']),
+                'close': Decimal(kline['c']),
+                'volume': Decimal(kline['v']),
+                'quote_volume': Decimal(kline['q']),
+                'trade_count': kline['n'],
+            })
+
+        await self.client.broadcast(symbol, encode_stream_event({
+            'type': 'kline',
+            'symbol': symbol,
+            'interval': kline['i'],
+            'open_time': kline['t'],
+            'open': kline['o'],
+            'high': kline['h'],
+            'low': kline['l'],
+            'close': kline['c'],
+            'volume': kline['v'],
+            'is_closed': kline['x']
+        }))
+
+    def has_pending(self):
+        return bool(self.buffer)
+
+    def persist(self):
+        klines_to_create = []
+
+        for symbol, rows in self.buffer.items():
+            try:
+                pair = CryptoPair.objects.get(symbol=symbol)
+            except CryptoPair.DoesNotExist:
+                logger.error(f"Crypto pair {symbol} does not exist")
+                continue
+            klines_to_create.extend(Kline(pair=pair, **row) for row in rows)
+
+        if klines_to_create:
+            Kline.objects.bulk_create(klines_to_create, ignore_conflicts=True)
+            logger.info(f"Saved {len(klines_to_create)} klines to database")
+
+        self.buffer = {}
+
+
+@register_handler
+class BookTickerHandler(StreamHandler):
+    """Обработчик потока лучших цен <symbol>@bookTicker"""
+    event_type = 'bookTicker'
+
+    async def handle(self, data):
+        symbol = data['s'].lower()
+        self.client.market_state.update_quote(symbol, data['b'], data['B'], data['a'], data['A'])
+        await self.client.broadcast(symbol, encode_stream_event({
+            'type': 'book_ticker',
+            'symbol': symbol,
+            'update_id': data['u'],
+            'bid': data['b'],
+            'bid_qty': data['B'],
+            'ask': data['a'],
+            'ask_qty': data['A']
+        }))
+
+
+@register_handler
+class MiniTickerHandler(StreamHandler):
+    """Обработчик потока 24-часовой статистики <symbol>@miniTicker"""
+    event_type = '24hrMiniTicker'
+
+    async def handle(self, data):
+        symbol = data['s'].lower()
+        self.client.market_state.update_stats(symbol, data)
+        await self.client.broadcast(symbol, encode_stream_event({
+            'type': 'mini_ticker',
+            'symbol': symbol,
+            'event_time': data['E'],
+            'open': data['o'],
+            'high': data['h'],
+            'low': data['l'],
+            'close': data['c'],
+            'volume': data['v'],
+            'quote_volume': data['q']
+        }))
+
+
+@register_handler
+class DepthHandler(StreamHandler):
+    """Обработчик потока изменений стакана <symbol>@depth@100ms"""
+    event_type = 'depthUpdate'
+
+    async def handle(self, data):
+        await self.client.order_books.handle_diff(data)
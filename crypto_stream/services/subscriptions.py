@@ -0,0 +1,218 @@
+import json
+import asyncio
+import logging
+import redis.asyncio as redis
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from crypto_stream.services.metrics import RECONNECTS
+
+logger = logging.getLogger(__name__)
+
+# Хэш Redis с количеством WebSocket-клиентов каждой пары (для подписки по требованию)
+INTEREST_KEY = 'ingestor:interest'
+
+
+class Shard:
+    """Одно соединение с Binance и закрепленные за ним потоки"""
+
+    def __init__(self):
+        self.streams = {}  # Упорядоченное множество потоков соединения
+        self.websocket = None
+        self.task = None
+
+
+class SubscriptionManager:
+    """
+    Управление подписками на потоки Binance без перезапуска инжестора.
+
+    Потоки распределяются по соединениям (не более `max_streams` на соединение),
+    изменения применяются методами SUBSCRIBE/UNSUBSCRIBE протокола Binance.
+    Первое соединение — основное соединение клиента (`client.websocket`).
+    """
+
+    # Binance принимает не более 5 управляющих сообщений в секунду на соединение
+    method_interval = 0.25
+
+    def __init__(self, client, max_streams=None):
+        self.client = client
+        self.max_streams = max_streams or settings.BINANCE_MAX_STREAMS_PER_CONNECTION
+        self.shards = []
+        self.request_id = 0
+
+    @property
+    def streams(self):
+        """Все потоки, на которые подписан инжестор"""
+        return [stream for shard in self.shards for stream in shard.streams]
+
+    def assign(self, streams):
+        """Первичное распределение потоков по соединениям"""
+        self.shards = [Shard()]
+        for stream in streams:
+            self._place(stream)
+
+    def _place(self, stream):
+        """Размещение потока в наименее загруженном соединении со свободным местом"""
+        candidates = [shard for shard in self.shards if len(shard.streams) < self.max_streams]
+        if candidates:
+            shard = min(candidates, key=lambda candidate: len(candidate.streams))
+        else:
+            shard = Shard()
+            self.shards.append(shard)
+        shard.streams[stream] = None
+        return shard
+
+    def shard_of(self, stream):
+        """Соединение, к которому относится поток"""
+        for shard in self.shards:
+            if stream in shard.streams:
+                return shard
+        return None
+
+    async def sync(self, desired):
+        """Приведение подписок к требуемому списку потоков"""
+        desired = list(dict.fromkeys(desired))
+        current = self.streams
+        removed = [stream for stream in current if stream not in desired]
+        added = [stream for stream in desired if stream not in current]
+
+        # Отписываемся от потоков, которые больше не нужны
+        unsubscribe = {}
+        for stream in removed:
+            shard = self.shard_of(stream)
+            del shard.streams[stream]
+            unsubscribe.setdefault(shard, []).append(stream)
+        for shard, streams in unsubscribe.items():
+            if shard is not self.shards[0] and not shard.streams:
+                # Дополнительное соединение осталось без потоков, закрываем его
+                await self.close_shard(shard)
+            else:
+                await self.send_method(shard, 'UNSUBSCRIBE', streams)
+
+        # Новые потоки размещаем в наименее загруженных соединениях
+        subscribe = {}
+        for stream in added:
+            shard = self._place(stream)
+            subscribe.setdefault(shard, []).append(stream)
+        for shard, streams in subscribe.items():
+            if shard is not self.shards[0] and shard.websocket is None:
+                await self.open_shard(shard)
+            else:
+                await self.send_method(shard, 'SUBSCRIBE', streams)
+
+        if added or removed:
+            logger.info(
+                f"Subscriptions updated: +{len(added)} -{len(removed)} streams "
+                f"across {len(self.shards)} connections"
+            )
+        return added, removed
+
+    async def send_method(self, shard, method, streams):
+        """Отправка управляющего сообщения Binance через соединение"""
+        if shard.websocket is None:
+            # Соединение еще не открыто, потоки войдут в URL при подключении
+            return
+        self.request_id += 1
+        await shard.websocket.send(json.dumps({
+            'method': method,
+            'params': streams,
+            'id': self.request_id
+        }))
+        await asyncio.sleep(self.method_interval)
+
+    def handle_response(self, data):
+        """Обработка ответа Binance на управляющее сообщение"""
+        if data.get('error'):
+            logger.error(f"Binance rejected subscription request {data.get('id')}: {data['error']}")
+
+    async def open_extra_shards(self):
+        """Подключение дополнительных соединений, распределенных при старте"""
+        for shard in self.shards[1:]:
+            if shard.websocket is None:
+                await self.open_shard(shard)
+
+    async def open_shard(self, shard):
+        """Открытие дополнительного соединения и запуск чтения из него"""
+        import websockets
+
+        shard.websocket = await websockets.connect(self.client.stream_url(shard.streams))
+        shard.task = asyncio.ensure_future(self.read_shard(shard))
+
+    async def read_shard(self, shard):
+        """Чтение сообщений дополнительного соединения с переподключением"""
+        import websockets
+
+        while self.client.is_running and shard in self.shards:
+            try:
+                message = await shard.websocket.recv()
+                if self.client.recorder:
+                    self.client.recorder.record(message)
+                await self.client.process_message(message)
+            except websockets.exceptions.ConnectionClosed:
+                if shard not in self.shards:
+                    break
+                RECONNECTS.labels('extra').inc()
+                logger.warning("Extra WebSocket connection closed, reconnecting...")
+                await asyncio.sleep(5)
+                try:
+                    shard.websocket = await websockets.connect(self.client.stream_url(shard.streams))
+                except Exception as e:
+                    logger.error(f"Failed to reconnect extra WebSocket connection: {e}")
+
+    async def close_shard(self, shard):
+        """Закрытие дополнительного соединения"""
+        self.shards.remove(shard)
+        if shard.task:
+            shard.task.cancel()
+        if shard.websocket:
+            await shard.websocket.close()
+
+    async def close(self):
+        """Закрытие всех дополнительных соединений"""
+        for shard in self.shards[1:]:
+            await self.close_shard(shard)
+
+
+class InterestRegistry:
+    """Учет WebSocket-клиентов каждой пары в Redis для подписки по требованию"""
+
+    def __init__(self, url=None):
+        self.redis = redis.Redis.from_url(url or settings.REDIS_URL)
+
+    async def change(self, symbol, delta):
+        """Изменение количества клиентов пары"""
+        await self.redis.hincrby(INTEREST_KEY, symbol, delta)
+
+    async def watched(self):
+        """Пары, у которых есть хотя бы один подключенный клиент"""
+        counts = await self.redis.hgetall(INTEREST_KEY)
+        return {symbol.decode() for symbol, count in counts.items() if int(count) > 0}
+
+
+_interest_registry = None
+
+
+def get_interest_registry():
+    """Общий экземпляр реестра клиентов для WebSocket-потребителей процесса"""
+    global _interest_registry
+    if _interest_registry is None:
+        _interest_registry = InterestRegistry()
+    return _interest_registry
+
+
+async def notify_interest(symbol, delta):
+    """Учет подключения или отключения клиента и уведомление инжестора"""
+    await get_interest_registry().change(symbol, delta)
+    await get_channel_layer().group_send(settings.INGESTOR_CONTROL_GROUP, {
+        'type': 'subscriptions.interest',
+        'symbol': symbol,
+        'delta': delta
+    })
+
+
+def request_subscription_sync():
+    """Запрос немедленной синхронизации подписок инжестора (из синхронного кода)"""
+    async_to_sync(get_channel_layer().group_send)(settings.INGESTOR_CONTROL_GROUP, {
+        'type': 'subscriptions.sync'
+    })
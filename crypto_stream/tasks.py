@@ -4,8 +4,16 @@ Tasks module for background processing.
 This module can be used for defining Celery tasks or other asynchronous jobs,
 particularly for data aggregation, cleanup, or notifications.
 
-Currently empty as asynchronous processing is handled by BinanceWebsocketClient.
+Asynchronous processing is handled by BinanceWebsocketClient; periodic jobs
+are plain functions run by management commands (e.g. from cron).
 """
+from crypto_stream.services.archive import TradeArchiver
+
+
+def archive_old_trades(now=None):
+    """Перенос сделок старше горячего окна в холодное хранилище"""
+    return TradeArchiver().archive(now)
+
 
 # Future implementation could include tasks like:
 #
@@ -14,7 +22,6 @@ Currently empty as asynchronous processing is handled by BinanceWebsocketClient.
 #    - Generate statistics reports
 #
 # 2. Database maintenance:
-#    - Cleanup old price data beyond retention period
 #    - Optimize database tables
 #
 # 3. User notifications:
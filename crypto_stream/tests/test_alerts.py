@@ -0,0 +1,115 @@
+import json
+import pytest
+from decimal import Decimal
+from unittest.mock import AsyncMock, patch
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from crypto_stream.models import CryptoPair, PriceAlert
+from crypto_stream.services.alerts import AlertEngine, Rule
+from crypto_stream.services.binance_client import BinanceWebsocketClient
+
+
+def test_alert_engine_price_cross():
+    """Тест срабатывания правил пересечения цены между соседними сделками"""
+    engine = AlertEngine()
+    engine.add(Rule(1, 'btcusdt', 'price_cross', 'above', 50000.0, 60, False))
+    engine.add(Rule(2, 'btcusdt', 'price_cross', 'above', 50100.0, 60, True))
+    engine.add(Rule(3, 'btcusdt', 'price_cross', 'below', 49900.0, 60, False))
+
+    assert engine.evaluate('btcusdt', 1, 49950.0, 0.1) == []
+    # Рост через оба порога срабатывает за одну сделку
+    fired = engine.evaluate('btcusdt', 2, 50100.0, 0.1)
+    assert [alert['alert_id'] for _, alert in fired] == [1, 2]
+
+    # Одноразовое правило удалено, повторяемое сработает при новом пересечении
+    assert engine.evaluate('btcusdt', 3, 49900.0, 0.1)[0][1]['alert_id'] == 3
+    assert [alert['alert_id'] for _, alert in engine.evaluate('btcusdt', 4, 50200.0, 0.1)] == [2]
+    assert engine.evaluate('ethusdt', 5, 50200.0, 0.1) == []
+    assert [alert_id for alert_id, _, _ in engine.fired] == [1, 2, 3, 2]
+
+
+def test_alert_engine_window_rules():
+    """Тест правил изменения цены и объема за скользящее окно"""
+    engine = AlertEngine()
+    engine.add(Rule(1, 'btcusdt', 'percent_move', 'above', 1.0, 10, True))
+    engine.add(Rule(2, 'btcusdt', 'percent_move', 'below', 2.0, 10, False))
+    engine.add(Rule(3, 'btcusdt', 'volume_spike', 'above', 5.0, 10, False))
+
+    engine.evaluate('btcusdt', 0, 100.0, 1.0)
+    assert engine.evaluate('btcusdt', 5, 100.5, 1.0) == []
+    fired = engine.evaluate('btcusdt', 6, 101.5, 1.0)
+    assert [alert['alert_id'] for _, alert in fired] == [1]
+    assert fired[0][1]['observed'] == 1.5
+
+    # Повторяемое правило не срабатывает до окончания окна
+    assert engine.evaluate('btcusdt', 7, 102.0, 1.0) == []
+
+    # Первая сделка вытеснена из окна, объем за окно — 1 + 1 + 1 + 2
+    fired = engine.evaluate('btcusdt', 12, 99.0, 2.0)
+    assert sorted(alert['alert_id'] for _, alert in fired) == [2, 3]
+
+
+@pytest.mark.django_db
+def test_alert_api_notifies_ingestor():
+    """Тест создания правила через API с уведомлением инжестора"""
+    CryptoPair.objects.create(symbol='btcusdt')
+    owner = get_user_model().objects.create_user('owner', password='secret')
+    client = APIClient()
+    assert client.get(reverse('alert-list')).status_code == status.HTTP_403_FORBIDDEN
+    client.force_authenticate(owner)
+
+    with patch('crypto_stream.views.notify_alert_changed') as mock_notify:
+        response = client.post(reverse('alert-list'), {
+            'symbol': 'btcusdt', 'kind': 'price_cross', 'direction': 'above', 'value': '60000'
+        }, format='json')
+        invalid = client.post(reverse('alert-list'), {
+            'symbol': 'btcusdt', 'kind': 'price_cross', 'value': '-1'
+        }, format='json')
+
+    assert response.status_code == status.HTTP_201_CREATED
+    assert invalid.status_code == status.HTTP_400_BAD_REQUEST
+    mock_notify.assert_called_once_with(response.data['id'])
+    assert client.get(reverse('alert-list'), {'symbol': 'btcusdt'}).data[0]['kind'] == 'price_cross'
+    assert PriceAlert.objects.get(id=response.data['id']).owner == owner
+
+    # Правила других пользователей не видны и не изменяются
+    other = APIClient()
+    other.force_authenticate(get_user_model().objects.create_user('other', password='secret'))
+    assert other.get(reverse('alert-list')).data == []
+    assert other.delete(reverse('alert-detail', args=[response.data['id']])).status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_trade_triggers_alert():
+    """Тест отправки оповещения через channel layer и записи срабатывания"""
+    pair = await CryptoPair.objects.acreate(symbol='btcusdt')
+    owner = await get_user_model().objects.acreate(username='owner')
+    alert = await PriceAlert.objects.acreate(
+        pair=pair, owner=owner, kind='price_cross', direction='above', value=Decimal('50000')
+    )
+
+    client = BinanceWebsocketClient()
+    await client.alerts.load()
+    client.alerts.symbols['btcusdt'].last_price = 49000.0
+    message = json.dumps({
+        "e": "trade", "E": 1672515782136, "s": "BTCUSDT", "t": 1, "p": "50001.00", "q": "0.01",
+        "b": 2, "a": 3, "T": 1672515782136, "m": True
+    })
+
+    with patch.object(client.channel_layer, 'group_send', new=AsyncMock()) as mock_group_send:
+        await client.process_message(message)
+        await client.save_price_updates()
+
+    # Оповещение отправлено только в группу владельца правила
+    group, event = mock_group_send.call_args_list[-1].args
+    assert group == f"alerts_{owner.id}_btcusdt"
+    assert event['type'] == 'send_alert'
+    assert json.loads(event['text'])['alert_id'] == alert.id
+
+    await alert.arefresh_from_db()
+    assert alert.is_active is False
+    assert alert.trigger_count == 1
@@ -0,0 +1,120 @@
+import pytest
+from unittest.mock import patch
+from decimal import Decimal
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from crypto_stream.models import ArchiveSegment, CryptoPair, PriceUpdate
+from crypto_stream.services.archive import (
+    SegmentReader, TradeArchiver, write_segment, archive_cutoff, read_archived
+)
+
+
+def test_segment_roundtrip(tmp_path):
+    """Тест записи сегмента и чтения интервала с пропуском групп"""
+    start = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+    rows = [
+        (start + timedelta(seconds=i), Decimal('42000.12345678') + i, Decimal('0.5') if i % 2 else None,
+         1000 + i, None, 7, bool(i % 3))
+        for i in range(100)
+    ]
+    path = str(tmp_path / 'btcusdt.trades')
+    footer = write_segment(path, 'btcusdt', rows, row_group_size=30)
+    assert footer['rows'] == 100
+    assert len(footer['groups']) == 4
+
+    with SegmentReader(path) as reader:
+        found = list(reader.rows(start + timedelta(seconds=40), start + timedelta(seconds=45)))
+
+    assert [row['trade_id'] for row in found] == list(range(1040, 1046))
+    assert found[1]['price'] == Decimal('42041.12345678')
+    assert found[0]['quantity'] is None
+    assert found[1]['quantity'] == Decimal('0.5')
+    assert found[1]['buyer_order_id'] is None
+    assert found[1]['is_buyer_maker'] is True
+    assert found[0]['timestamp'] == start + timedelta(seconds=40)
+
+
+def test_segment_text_column_for_large_values(tmp_path):
+    """Тест колонки, не помещающейся в int64: группа хранит ее текстом без потери значений"""
+    start = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+    prices = [Decimal('1.5'), Decimal('123456789012.12345678'), Decimal('2.25')]
+    rows = [(start + timedelta(seconds=i), price, None, i, None, None, False) for i, price in enumerate(prices)]
+    path = str(tmp_path / 'shibusdt.trades')
+    footer = write_segment(path, 'shibusdt', rows, row_group_size=2)
+
+    assert footer['groups'][0]['text_columns'] == [1]
+    assert 'text_columns' not in footer['groups'][1]
+    with SegmentReader(path) as reader:
+        assert [row['price'] for row in reader.rows()] == prices
+        assert [row['trade_id'] for row in reader.rows(reverse=True)] == [2, 1, 0]
+
+
+@pytest.mark.django_db
+def test_read_archived_stops_at_limit(tmp_path, settings):
+    """Тест чтения архива от новых групп к старым: старые группы не распаковываются"""
+    settings.ARCHIVE_DIR = str(tmp_path)
+    settings.ARCHIVE_S3_BUCKET = None
+    pair = CryptoPair.objects.create(symbol='btcusdt')
+    start = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+    rows = [(start + timedelta(seconds=i), Decimal('40000') + i, None, i, None, None, False) for i in range(100)]
+    footer = write_segment(str(tmp_path / 'btcusdt' / 'day.trades'), 'btcusdt', rows, row_group_size=10)
+    ArchiveSegment.objects.create(
+        pair=pair, start_time=start, end_time=start + timedelta(seconds=99),
+        row_count=100, size=1, name='btcusdt/day.trades', storage='local'
+    )
+
+    with patch.object(SegmentReader, 'read_column', autospec=True, side_effect=SegmentReader.read_column) as read:
+        updates = read_archived(pair, start, start + timedelta(days=1), 15)
+
+    assert [update.trade_id for update in updates] == list(range(99, 84, -1))
+    assert len(footer['groups']) == 10 and read.call_count == 2 * len(footer['columns'])
+
+
+@pytest.mark.django_db
+def test_archiver_moves_old_trades(tmp_path, settings):
+    """Тест переноса сделок старше горячего окна в архив и чтения истории из него"""
+    settings.ARCHIVE_HOT_WINDOW_DAYS = 2
+    settings.ARCHIVE_DIR = str(tmp_path)
+    pair = CryptoPair.objects.create(symbol='btcusdt')
+    old_day = archive_cutoff() - timedelta(days=1)
+    for i in range(5):
+        PriceUpdate.objects.create(
+            pair=pair, price=Decimal('40000') + i, timestamp=old_day + timedelta(hours=i), trade_id=i
+        )
+    recent = PriceUpdate.objects.create(pair=pair, price=Decimal('50000'), timestamp=timezone.now(), trade_id=99)
+
+    assert TradeArchiver().archive() == 5
+
+    # В горячей таблице осталась только свежая сделка
+    assert list(PriceUpdate.objects.values_list('id', flat=True)) == [recent.id]
+    segment = ArchiveSegment.objects.get()
+    assert segment.row_count == 5
+    assert segment.end_time == old_day + timedelta(hours=4)
+
+    # История за интервал, захватывающий архив, объединяет оба хранилища
+    client = APIClient()
+    response = client.get(reverse('price-history-detail', args=['btcusdt']), {
+        'start_time': (old_day - timedelta(days=1)).isoformat(),
+        'limit': 3,
+    })
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [row['trade_id'] for row in response.data] == [99, 4, 3]
+    assert response.data[1]['price'] == '40004.00000000'
+
+    # Прореженная история за тот же интервал включает архивные сделки
+    response = client.get(reverse('price-history-detail', args=['btcusdt']), {
+        'start_time': old_day.isoformat(),
+        'end_time': (old_day + timedelta(hours=6)).isoformat(),
+        'resolution': 7200,
+    })
+
+    assert response.status_code == status.HTTP_200_OK
+    points = response.data['points']
+    assert [point['count'] for point in points] == [2, 2, 1]
+    assert Decimal(points[0]['open']) == Decimal('40000') and Decimal(points[0]['close']) == Decimal('40001')
+    assert Decimal(points[1]['high']) == Decimal('40003') and Decimal(points[2]['low']) == Decimal('40004')
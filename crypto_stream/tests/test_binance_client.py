@@ -9,7 +9,8 @@ from channels.layers import get_channel_layer
 from asgiref.sync import sync_to_async
 
 from crypto_stream.services.binance_client import BinanceWebsocketClient
-from crypto_stream.models import CryptoPair, PriceUpdate
+from crypto_stream.services.subscriptions import SubscriptionManager
+from crypto_stream.models import CryptoPair, PriceUpdate, Kline
 
 
 @pytest.mark.asyncio
@@ -62,6 +63,15 @@ async def test_process_message():
         args, kwargs = mock_group_send.call_args
         assert args[0] == 'crypto_btcusdt'
 
+        # Проверяем, что сообщение сериализовано заранее
+        event = args[1]
+        assert event['type'] == 'send_price_update'
+        payload = json.loads(event['text'])
+        assert payload['type'] == 'price_update'
+        assert payload['symbol'] == 'btcusdt'
+        assert payload['price'] == '50000.00'
+        assert payload['trade_id'] == 12345
+
         # Проверяем, что данные были добавлены в буфер
         assert 'btcusdt' in client.price_buffer
         assert len(client.price_buffer['btcusdt']) == 1
@@ -136,4 +146,126 @@ async def test_connect():
         # Проверяем, что websockets.connect был вызван с правильным URL
         mock_connect.assert_called_once()
         args, kwargs = mock_connect.call_args
-        assert args[0] == 'wss://stream.binance.com:9443/ws/btcusdt@trade'
\ No newline at end of file
+        assert args[0] == 'wss://stream.binance.com:9443/ws/btcusdt@trade'
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_stream_handlers():
+    """Тест обработки агрегированных сделок и свечей зарегистрированными обработчиками"""
+    client = BinanceWebsocketClient()
+    await sync_to_async(CryptoPair.objects.create)(symbol='ethusdt')
+    now_ms = int(timezone.now().timestamp() * 1000)
+
+    agg_trade = json.dumps({
+        "e": "aggTrade", "s": "ETHUSDT", "a": 777, "p": "3000.50", "q": "1.5",
+        "f": 100, "l": 105, "T": now_ms, "m": False
+    })
+    kline = json.dumps({
+        "e": "kline", "s": "ETHUSDT",
+        "k": {
+            "t": now_ms - 60000, "T": now_ms - 1, "i": "1m", "o": "2990.00", "c": "3000.50",
+            "h": "3001.00", "l": "2989.00", "v": "12.5", "q": "37500.00", "n": 42, "x": True
+        }
+    })
+    unknown = json.dumps({"result": None, "id": 1})
+
+    with patch.object(client.channel_layer, 'group_send', new=AsyncMock()) as mock_group_send:
+        await client.process_message(agg_trade)
+        await client.process_message(kline)
+        await client.process_message(unknown)
+
+        # Обе записи транслированы подписчикам пары, служебный ответ пропущен
+        assert mock_group_send.await_count == 2
+        kline_event = mock_group_send.call_args_list[1].args[1]
+        assert kline_event['type'] == 'send_stream_event'
+        assert json.loads(kline_event['text'])['type'] == 'kline'
+
+    # Агрегированная сделка попадает в буфер цен с идентификатором последней сделки
+    assert client.price_buffer['ethusdt'][0]['trade_id'] == 105
+    assert client.price_buffer['ethusdt'][0]['price'] == Decimal('3000.50')
+
+    await client.save_price_updates()
+    klines = await sync_to_async(list)(Kline.objects.all())
+    assert len(klines) == 1
+    assert klines[0].close == Decimal('3000.50')
+    assert klines[0].trade_count == 42
+    assert not client.has_pending_data()
+
+
+def test_build_streams(settings):
+    """Тест формирования списка потоков с подписками для отдельных пар"""
+    settings.CRYPTO_PAIR_STREAMS = {'ethusdt': ['aggTrade', 'kline_1m']}
+    settings.ORDER_BOOK_PAIRS = ['btcusdt']
+    client = BinanceWebsocketClient()
+    client.pairs = ['btcusdt', 'ethusdt']
+
+    assert client.build_streams() == [
+        'btcusdt@trade', 'ethusdt@aggTrade', 'ethusdt@kline_1m', 'btcusdt@depth@100ms'
+    ]
+
+
+@pytest.mark.asyncio
+async def test_subscription_manager_sync():
+    """Тест подписки и отписки на лету с распределением потоков по соединениям"""
+    client = BinanceWebsocketClient()
+    manager = SubscriptionManager(client, max_streams=2)
+    manager.method_interval = 0
+    manager.assign(['btcusdt@trade', 'ethusdt@trade'])
+    primary = AsyncMock()
+    manager.shards[0].websocket = primary
+
+    with patch('websockets.connect', new=AsyncMock()) as mock_connect:
+        extra = AsyncMock()
+        extra.recv.side_effect = asyncio.CancelledError
+        mock_connect.return_value = extra
+
+        # Основное соединение заполнено, новая пара уходит в дополнительное соединение
+        added, removed = await manager.sync(['btcusdt@trade', 'ethusdt@trade', 'solusdt@trade'])
+        assert added == ['solusdt@trade'] and removed == []
+        assert len(manager.shards) == 2
+        mock_connect.assert_called_once_with('wss://stream.binance.com:9443/ws/solusdt@trade')
+
+        # Отписка освобождает место в основном соединении, пустое дополнительное закрывается
+        await manager.sync(['btcusdt@trade', 'solusdt@trade', 'xrpusdt@trade'])
+        request = json.loads(primary.send.call_args_list[0].args[0])
+        assert request['method'] == 'UNSUBSCRIBE'
+        assert request['params'] == ['ethusdt@trade']
+
+        # Новый поток размещается в наименее загруженном соединении со свободным местом
+        assert manager.shard_of('xrpusdt@trade') is manager.shards[0]
+        request = json.loads(primary.send.call_args_list[1].args[0])
+        assert request == {'method': 'SUBSCRIBE', 'params': ['xrpusdt@trade'], 'id': 2}
+
+        await manager.sync(['btcusdt@trade'])
+        assert len(manager.shards) == 1
+        extra.close.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_client_against_fake_binance_server():
+    """Тест приема сделок и управления подписками через локальный фейковый сервер Binance"""
+    from benchmarks.fake_binance import FakeBinanceServer
+
+    server = FakeBinanceServer(rate=500)
+    client = BinanceWebsocketClient()
+    client.base_url = await server.start()
+    client.pairs = ['btcusdt']
+    client.pair_streams = {}
+    client.default_streams = ['trade']
+    client.order_book_pairs = []
+
+    try:
+        assert await client.connect()
+        await client.subscriptions.sync(['btcusdt@trade', 'ethusdt@trade'])
+
+        with patch.object(client.channel_layer, 'group_send', new=AsyncMock()):
+            for _ in range(50):
+                await client.process_message(await client.websocket.recv())
+    finally:
+        await client.disconnect()
+        await server.stop()
+
+    # Сделки приходят по обоим потокам, включая подписанный после подключения
+    assert set(client.price_buffer) == {'btcusdt', 'ethusdt'}
+    assert server.sent >= 48
@@ -0,0 +1,125 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from benchmarks.fake_binance import FakeBinanceServer
+from crypto_stream.services.cluster import BinanceRestTradeSource, ClusterCoordinator, HashRing
+
+
+class MemoryLeaseStore:
+    """Регистрация узлов и аренды в памяти с управляемым временем"""
+
+    def __init__(self):
+        self.now = 0
+        self.nodes = {}
+        self.leases = {}
+
+    async def heartbeat(self, node_id, ttl):
+        self.nodes[node_id] = self.now + ttl
+
+    async def members(self):
+        return sorted(node for node, expires in self.nodes.items() if expires > self.now)
+
+    async def leave(self, node_id):
+        self.nodes.pop(node_id, None)
+
+    def holder(self, symbol):
+        node_id, expires = self.leases.get(symbol, (None, 0))
+        return node_id if expires > self.now else None
+
+    async def acquire(self, symbol, node_id, ttl):
+        if self.holder(symbol) is not None:
+            return False
+        self.leases[symbol] = (node_id, self.now + ttl)
+        return True
+
+    async def renew(self, symbols, node_id, ttl):
+        held = {symbol for symbol in symbols if self.holder(symbol) == node_id}
+        for symbol in held:
+            self.leases[symbol] = (node_id, self.now + ttl)
+        return held
+
+    async def release(self, symbol, node_id):
+        if self.holder(symbol) == node_id:
+            del self.leases[symbol]
+
+    async def close(self):
+        pass
+
+
+def make_node(store, node_id):
+    client = MagicMock(price_buffer={}, flush=AsyncMock())
+    coordinator = ClusterCoordinator(client, store=store, trade_source=AsyncMock(), node_id=node_id)
+    coordinator.last_persisted_trade_id = AsyncMock(return_value=None)
+    return coordinator
+
+
+def test_hash_ring_moves_only_to_new_node():
+    """Тест согласованного хэширования: при добавлении узла пары переходят только к нему"""
+    symbols = [f"pair{i}usdt" for i in range(1000)]
+    before = HashRing(['a', 'b', 'c'], replicas=64)
+    after = HashRing(['a', 'b', 'c', 'd'], replicas=64)
+
+    moved = [symbol for symbol in symbols if before.owner(symbol) != after.owner(symbol)]
+    assert all(after.owner(symbol) == 'd' for symbol in moved)
+    assert 150 < len(moved) < 350
+    assert HashRing([]).owner('btcusdt') is None
+
+
+@pytest.mark.asyncio
+async def test_cluster_rebalance_and_failover(settings):
+    """Тест перебалансировки при подключении узла и перехода пар упавшего узла к оставшимся"""
+    settings.CLUSTER_LEASE_SECONDS = 5
+    symbols = [f"pair{i}usdt" for i in range(20)]
+    store = MemoryLeaseStore()
+    a, b = make_node(store, 'a'), make_node(store, 'b')
+
+    await a.heartbeat()
+    assert await a.claim(symbols) == symbols
+
+    # Подключился узел b: его пары заняты, пока a не освободит их после отписки
+    await b.heartbeat()
+    assert await b.claim(symbols) == []
+    assert b.waiting
+    assert await a.heartbeat() is True
+    kept = await a.claim(symbols)
+    assert set(kept) == {symbol for symbol in symbols if a.ring.owner(symbol) == 'a'}
+    await a.release()
+    assert a.owned == set(kept)
+
+    assert await b.heartbeat() is True
+    taken = await b.claim(symbols)
+    assert set(taken) | set(kept) == set(symbols) and not set(taken) & set(kept)
+    assert not b.waiting
+
+    # Узел b перестал продлевать регистрацию и аренды: после их истечения пары переходят к a
+    store.now += 3
+    await a.heartbeat()
+    store.now += 3
+    assert await a.heartbeat() is True
+    assert a.members == ['a']
+    assert await a.claim(symbols) == symbols
+
+    # Узел, вернувшийся после истечения аренды, не продлевает чужие аренды
+    assert await b.heartbeat() is True
+    assert b.owned == set()
+
+
+@pytest.mark.asyncio
+async def test_resume_backfills_gap_from_rest():
+    """Тест дозагрузки сделок между последней записанной и первой полученной из потока"""
+    fake = FakeBinanceServer()
+    await fake.start()
+    for _ in range(30):
+        fake.history['btcusdt'].append(fake.synthetic_trade('btcusdt'))
+
+    coordinator = make_node(MemoryLeaseStore(), 'a')
+    coordinator.trade_source = BinanceRestTradeSource(fake.rest_uri)
+    coordinator.last_persisted_trade_id = AsyncMock(return_value=10)
+    coordinator.start_resume('btcusdt')
+    coordinator.observe_trade('btcusdt', 25)
+    await coordinator.resume_tasks['btcusdt']
+    await fake.stop()
+
+    buffered = [row['trade_id'] for row in coordinator.client.price_buffer['btcusdt']]
+    assert buffered == list(range(11, 25))
+    assert coordinator.resume_tasks == {}
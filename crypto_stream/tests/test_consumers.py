@@ -1,6 +1,7 @@
 import json
 import pytest
 from decimal import Decimal
+from unittest.mock import AsyncMock, MagicMock, patch
 from channels.testing import WebsocketCommunicator
 from channels.routing import URLRouter
 from django.test import TestCase
@@ -152,4 +153,206 @@ async def test_crypto_consumer_send_price_update():
     assert response['quantity'] == '0.02'
 
     # Отключаемся
-    await communicator.disconnect()
\ No newline at end of file
+    await communicator.disconnect()
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_crypto_consumer_send_pre_encoded_update():
+    """Тест пересылки заранее сериализованного обновления цены"""
+    # Создаем тестовую пару
+    await CryptoPair.objects.acreate(symbol='btcusdt')
+
+    # Создаем тестовый коммуникатор
+    application = URLRouter([
+        re_path(r'ws/crypto/(?P<symbol>\w+)/$', CryptoConsumer.as_asgi()),
+    ])
+    communicator = WebsocketCommunicator(application, "/ws/crypto/btcusdt/")
+
+    # Подключаемся
+    connected, _ = await communicator.connect()
+    assert connected
+
+    # Отправляем в группу уже сериализованное сообщение
+    from channels.layers import get_channel_layer
+    channel_layer = get_channel_layer()
+    text = '{"type":"price_update","symbol":"btcusdt","price":"51000.00"}'
+    await channel_layer.group_send(
+        'crypto_btcusdt',
+        {
+            'type': 'send_price_update',
+            'text': text
+        }
+    )
+
+    # Клиент получает строку без изменений
+    response = await communicator.receive_from()
+    assert response == text
+
+    # Отключаемся
+    await communicator.disconnect()
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_crypto_consumer_replay_since(settings):
+    """Тест восстановления пропущенных сделок из журнала при переподключении"""
+    settings.TRADE_STREAM_ENABLED = True
+    await CryptoPair.objects.acreate(symbol='btcusdt')
+
+    # Журнал возвращает две пропущенные клиентом записи
+    event_log = MagicMock()
+    event_log.first_id = AsyncMock(return_value='100-0')
+    event_log.read_since = AsyncMock(return_value=[
+        ('101-0', {'type': 'price_update', 'symbol': 'btcusdt', 'price': '50001.00', 'trade_id': 1}),
+        ('102-0', {'type': 'price_update', 'symbol': 'btcusdt', 'price': '50002.00', 'trade_id': 2}),
+    ])
+
+    application = URLRouter([
+        re_path(r'ws/crypto/(?P<symbol>\w+)/$', CryptoConsumer.as_asgi()),
+    ])
+    communicator = WebsocketCommunicator(application, "/ws/crypto/btcusdt/?since=100-0")
+
+    with patch('crypto_stream.consumers.get_event_log', return_value=event_log):
+        connected, _ = await communicator.connect()
+        assert connected
+
+        # Сначала приходят пропущенные сделки, затем маркер завершения
+        first = await communicator.receive_json_from()
+        second = await communicator.receive_json_from()
+        assert [first['stream_id'], second['stream_id']] == ['101-0', '102-0']
+        complete = await communicator.receive_json_from()
+        assert complete == {'type': 'replay_complete', 'count': 2, 'truncated': False}
+        event_log.read_since.assert_called_once_with('btcusdt', '100-0', settings.TRADE_STREAM_REPLAY_BATCH)
+
+    # Живое обновление, уже отправленное из журнала, пропускается
+    from channels.layers import get_channel_layer
+    channel_layer = get_channel_layer()
+    await channel_layer.group_send('crypto_btcusdt', {
+        'type': 'send_price_update', 'stream_id': '102-0', 'text': '{"trade_id":2}'
+    })
+    await channel_layer.group_send('crypto_btcusdt', {
+        'type': 'send_price_update', 'stream_id': '103-0', 'text': '{"trade_id":3}'
+    })
+    response = await communicator.receive_json_from()
+    assert response == {'trade_id': 3}
+
+    await communicator.disconnect()
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_crypto_consumer_latency_tracing(settings):
+    """Тест учета задержки доставки и эхо-сообщений клиента"""
+    from crypto_stream.services.latency import LatencyTracker
+    settings.LATENCY_SAMPLE_RATE = 1
+    tracker = LatencyTracker(local=True)
+    await CryptoPair.objects.acreate(symbol='btcusdt')
+
+    application = URLRouter([
+        re_path(r'ws/crypto/(?P<symbol>\w+)/$', CryptoConsumer.as_asgi()),
+    ])
+    communicator = WebsocketCommunicator(application, "/ws/crypto/btcusdt/")
+    connected, _ = await communicator.connect()
+    assert connected
+
+    with patch('crypto_stream.consumers.LATENCY', tracker):
+        # Обновление с отметками времени учитывается при отправке клиенту
+        now_ms = int(timezone.now().timestamp() * 1000)
+        from channels.layers import get_channel_layer
+        channel_layer = get_channel_layer()
+        await channel_layer.group_send('crypto_btcusdt', {
+            'type': 'send_price_update',
+            'text': '{"type":"price_update"}',
+            'event_time': now_ms - 50,
+            'broadcast_at': now_ms
+        })
+        await communicator.receive_from()
+
+        # Клиент возвращает отметку времени отправки для учета полного пути
+        await communicator.send_json_to({
+            'type': 'latency_echo',
+            'broadcast_at': now_ms,
+            'client_received_at': now_ms + 5
+        })
+        await communicator.disconnect()
+
+    stats = tracker.percentiles()
+    assert stats['broadcast_to_deliver']['count'] == 1
+    assert stats['exchange_to_deliver']['p50_ms'] >= 50
+    assert stats['broadcast_to_client']['p50_ms'] == pytest.approx(5.0, rel=0.1)
+    assert stats['broadcast_to_echo']['count'] == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_crypto_consumer_binary_subprotocols():
+    """Тест бинарных подпротоколов: полная запись, разность с предыдущей сделкой и сжатый JSON"""
+    from channels.layers import get_channel_layer
+    from crypto_stream.services.encoding import (
+        TICK, TICK_DELTA, build_price_update, encode_binary, encode_price_update, inflate, price_tick
+    )
+    await CryptoPair.objects.acreate(symbol='btcusdt')
+    application = URLRouter([
+        re_path(r'ws/crypto/(?P<symbol>\w+)/$', CryptoConsumer.as_asgi()),
+    ])
+    delta_client = WebsocketCommunicator(application, "/ws/crypto/btcusdt/", subprotocols=['crypto.struct.delta'])
+    deflate_client = WebsocketCommunicator(application, "/ws/crypto/btcusdt/", subprotocols=['crypto.json.deflate'])
+    connected, subprotocol = await delta_client.connect()
+    assert connected and subprotocol == 'crypto.struct.delta'
+    assert (await delta_client.receive_json_from())['price_scale'] == 10 ** 8
+    await deflate_client.connect()
+    assert 'dictionary' in await deflate_client.receive_json_from()
+
+    # Инжестор добавляет к сделке только полную запись, остальные кадры строят потребители
+    now = timezone.now()
+    events = []
+    for trade_id, price in ((100, Decimal('50000.10')), (101, Decimal('49999.95'))):
+        message = build_price_update('btcusdt', price, now, trade_id, Decimal('0.25'))
+        tick = price_tick(price, now, trade_id, Decimal('0.25'))
+        events.append(encode_binary(encode_price_update(message), tick))
+    assert set(events[0]) == {'type', 'text', 'tick'}
+    for event in events:
+        await get_channel_layer().group_send('crypto_btcusdt', event)
+
+    # Первая сделка — полная запись, вторая — разность относительно сделки, полученной клиентом
+    first = await delta_client.receive_from()
+    assert TICK.unpack(first) == (1, 100, round(now.timestamp() * 1000), 5000010000000, 25000000)
+    second = await delta_client.receive_from()
+    assert len(second) == TICK_DELTA.size
+    assert TICK_DELTA.unpack(second) == (2, 1, 0, -15000000, 25000000)
+
+    assert json.loads(inflate(await deflate_client.receive_from()))['price'] == '50000.10'
+
+    await delta_client.disconnect()
+    await deflate_client.disconnect()
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_crypto_consumer_alerts_only_to_owner():
+    """Тест доставки оповещения только соединениям владельца правила"""
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.models import AnonymousUser
+    from channels.layers import get_channel_layer
+    from crypto_stream.services.alerts import alert_group
+    from crypto_stream.services.encoding import encode_alert
+
+    await CryptoPair.objects.acreate(symbol='btcusdt')
+    owner = await get_user_model().objects.acreate(username='owner')
+    application = URLRouter([
+        re_path(r'ws/crypto/(?P<symbol>\w+)/$', CryptoConsumer.as_asgi()),
+    ])
+    owner_client = WebsocketCommunicator(application, "/ws/crypto/btcusdt/")
+    owner_client.scope['user'] = owner
+    anonymous_client = WebsocketCommunicator(application, "/ws/crypto/btcusdt/")
+    anonymous_client.scope['user'] = AnonymousUser()
+    assert (await owner_client.connect())[0] and (await anonymous_client.connect())[0]
+
+    await get_channel_layer().group_send(alert_group(owner.id, 'btcusdt'), encode_alert({'type': 'alert', 'alert_id': 1}))
+
+    assert (await owner_client.receive_json_from())['alert_id'] == 1
+    assert await anonymous_client.receive_nothing()
+
+    await owner_client.disconnect()
+    await anonymous_client.disconnect()
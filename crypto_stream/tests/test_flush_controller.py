@@ -0,0 +1,65 @@
+from crypto_stream.services.flush_controller import FlushController
+
+
+def make_controller(**kwargs):
+    options = dict(
+        target_latency=0.25, min_rows=500, max_rows=50000, min_interval=0.05,
+        max_interval=1.0, max_buffer_rows=200000, window=64, adaptive=True,
+    )
+    options.update(kwargs)
+    return FlushController(**options)
+
+
+def test_batch_rows_converge_to_target_latency():
+    """Тест подбора пачки: рост на прогреве и сходимость к целевой длительности записи"""
+    controller = make_controller()
+    # Синтетическая БД: 20 мс на транзакцию и 10 мкс на строку
+    duration = lambda rows: 0.02 + 0.00001 * rows  # noqa: E731
+
+    sizes = []
+    for _ in range(20):
+        rows = controller.batch_rows
+        controller.observe(rows, duration(rows))
+        sizes.append(controller.batch_rows)
+
+    assert sizes[:3] == [1000, 2000, 4000]
+    # (0.25 - 0.02) / 0.00001 = 23000 строк
+    assert abs(controller.batch_rows - 23000) <= 100
+    assert duration(controller.batch_rows) <= 0.25
+
+    # Медленная БД: пачка не меньше FLUSH_MIN_ROWS
+    slow = make_controller()
+    for rows in (500, 500, 600, 700, 800):
+        slow.observe(rows, 0.5 + rows * 0.001)
+    assert slow.batch_rows == 500
+
+    # Быстрая БД: пачка не больше FLUSH_MAX_ROWS
+    fast = make_controller()
+    for rows in (1000, 2000, 4000, 8000, 16000):
+        fast.observe(rows, rows * 1e-7)
+    assert fast.batch_rows == 50000
+
+
+def test_flush_due_and_interval():
+    """Тест момента записи: размер пачки, максимальный интервал и ограничение буфера"""
+    controller = make_controller()
+    controller.batch_rows = 1000
+
+    assert not controller.due(0.5, 999)
+    assert controller.due(0.5, 1000)
+    assert controller.due(1.0, 1)
+    assert controller.due(0.01, 200000)
+    assert not controller.due(0.01, 199999)
+
+    # Интервал ожидания фоновой записи: batch_rows / частота, в пределах min/max
+    controller.record_rate(4000, 1.0)
+    assert controller.interval == 0.25
+    quiet = make_controller()
+    quiet.record_rate(10, 10.0)
+    assert quiet.interval == 1.0
+
+    # Без адаптации запись только по DATA_SAVE_INTERVAL и ограничению буфера
+    fixed = make_controller(adaptive=False)
+    assert not fixed.due(0.5, 100000)
+    assert fixed.due(1.0, 1)
+    assert fixed.due(0.5, 200000)
@@ -0,0 +1,125 @@
+import json
+import pytest
+import numpy as np
+from decimal import Decimal
+from datetime import timedelta
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.urls import re_path
+
+from crypto_stream.consumers import IndicatorConsumer
+from crypto_stream.models import CryptoPair, PriceUpdate
+from crypto_stream.services.indicators import PriceSeries, IndicatorCache, ema, rsi, sma, bollinger
+
+
+def test_indicator_functions():
+    """Тест векторных индикаторов против пошагового расчета"""
+    values = np.random.default_rng(1).uniform(90, 110, 300)
+
+    assert np.isnan(sma(values, 20)[18])
+    assert sma(values, 20)[-1] == pytest.approx(values[-20:].mean())
+
+    # EMA с начальным значением SMA
+    expected = values[:20].mean()
+    for value in values[20:]:
+        expected += 2 / 21 * (value - expected)
+    assert ema(values, 20)[-1] == pytest.approx(expected)
+
+    # RSI по Уайлдеру
+    changes = np.diff(values)
+    gain, loss = np.clip(changes[:14], 0, None).mean(), np.clip(-changes[:14], 0, None).mean()
+    for change in changes[14:]:
+        gain = (gain * 13 + max(change, 0)) / 14
+        loss = (loss * 13 + max(-change, 0)) / 14
+    assert rsi(values, 14)[-1] == pytest.approx(100 - 100 / (1 + gain / loss))
+
+    bands = bollinger(values, 20)
+    assert bands['upper'][-1] - bands['middle'][-1] == pytest.approx(2 * values[-20:].std())
+
+
+def test_price_series_appends_trades():
+    """Тест агрегирования сделок в свечи и сдвига ряда при заполнении"""
+    series = PriceSeries('btcusdt', '1m', max_points=3)
+    series.add_trades(np.array([0.0, 30.0, 61.0]), np.array([10.0, 12.0, 11.0]), np.array([1.0, 1.0, 2.0]), 3)
+
+    assert series.size == 2
+    assert series.columns['close'][0] == 12.0
+    assert series.columns['high'][0] == 12.0
+    assert series.columns['turnover'][1] == 22.0
+
+    # Уже учтенная сделка пропускается, новая дописывается в последнюю свечу
+    series.add_trade(62.0, 99.0, 1.0, trade_id=3)
+    series.add_trade(62.0, 13.0, 1.0, trade_id=4)
+    assert series.columns['close'][1] == 13.0
+
+    for minute in range(2, 8):
+        series.add_trade(minute * 60.0, 14.0 + minute, 1.0, trade_id=10 + minute)
+    result = series.compute(['sma'], period=2)
+    assert result['times'] == [300000, 360000, 420000]
+    assert result['close'] == [19.0, 20.0, 21.0]
+    assert result['sma'] == [18.5, 19.5, 20.5]
+
+
+@pytest.mark.django_db
+def test_indicator_view(settings):
+    """Тест получения индикаторов через REST API с кэшированием ряда"""
+    pair = CryptoPair.objects.create(symbol='btcusdt')
+    start = timezone.now().replace(second=0, microsecond=0) - timedelta(minutes=30)
+    for minute in range(30):
+        PriceUpdate.objects.create(
+            pair=pair, price=Decimal(100 + minute), quantity=Decimal('1'),
+            timestamp=start + timedelta(minutes=minute), trade_id=minute
+        )
+
+    client = APIClient()
+    cache = IndicatorCache()
+    url = reverse('indicators-detail', args=['btcusdt'])
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr('crypto_stream.services.indicators.get_indicator_cache', lambda: cache)
+        response = client.get(url, {'indicators': 'sma,vwap', 'period': 5, 'points': 3})
+        invalid = client.get(url, {'indicators': 'macd'})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['close'] == [127.0, 128.0, 129.0]
+    assert response.data['sma'] == [125.0, 126.0, 127.0]
+    assert 'rsi' not in response.data
+    assert invalid.status_code == status.HTTP_400_BAD_REQUEST
+    assert cache.series[('btcusdt', '1m')].last_trade_id == 29
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_indicator_consumer_streams_updates(settings):
+    """Тест отправки обновленных индикаторов по новым сделкам"""
+    settings.INDICATOR_STREAM_INTERVAL = 0
+    await CryptoPair.objects.acreate(symbol='ethusdt')
+
+    application = URLRouter([
+        re_path(r'ws/indicators/(?P<symbol>\w+)/$', IndicatorConsumer.as_asgi()),
+    ])
+    communicator = WebsocketCommunicator(application, "/ws/indicators/ethusdt/?indicators=sma&period=2")
+    connected, _ = await communicator.connect()
+    assert connected
+    initial = await communicator.receive_json_from()
+    assert initial['type'] == 'indicators'
+
+    now = timezone.now()
+    for trade_id, price in enumerate(['3000.00', '3010.00']):
+        await get_channel_layer().group_send('crypto_ethusdt', {
+            'type': 'send_price_update',
+            'text': json.dumps({
+                'type': 'price_update', 'symbol': 'ethusdt', 'price': price,
+                'timestamp': (now + timedelta(minutes=trade_id)).isoformat(),
+                'trade_id': trade_id, 'quantity': '0.5'
+            })
+        })
+
+    updates = [await communicator.receive_json_from() for _ in range(2)]
+    assert updates[-1]['close'] == [3010.0]
+    assert updates[-1]['sma'] == [3005.0]
+    await communicator.disconnect()
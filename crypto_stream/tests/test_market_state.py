@@ -0,0 +1,90 @@
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from crypto_stream.services import BinanceWebsocketClient
+from crypto_stream.services.market_state import derive_cross, cross_matrix
+
+
+@pytest.mark.asyncio
+async def test_handlers_update_market_state():
+    """Тест обновления состояния рынка сделками, лучшими ценами и 24-часовой статистикой"""
+    client = BinanceWebsocketClient(record_frames=False)
+    client.alerts = None
+    messages = [
+        {"e": "trade", "E": 1000, "s": "BTCUSDT", "t": 1, "p": "50000.00", "q": "0.1",
+         "b": 1, "a": 2, "T": 1000, "m": True},
+        {"u": 10, "s": "BTCUSDT", "b": "49999.00", "B": "1.5", "a": "50001.00", "A": "2.0"},
+        {"e": "24hrMiniTicker", "E": 1000, "s": "BTCUSDT", "c": "50000.00", "o": "40000.00",
+         "h": "51000.00", "l": "39000.00", "v": "100", "q": "4500000"},
+    ]
+
+    with patch.object(client.channel_layer, 'group_send', new=AsyncMock()):
+        for message in messages:
+            await client.process_message(json.dumps(message))
+
+    state = client.market_state.symbols['btcusdt']
+    assert state['price'] == '50000.00' and state['trade_time'] == 1000
+    assert state['bid'] == '49999.00' and state['ask'] == '50001.00'
+    assert state['stats_24h']['change_percent'] == 25.0
+    assert client.market_state.dirty == {'btcusdt'}
+
+    # Изменившиеся пары записываются в Redis одним конвейером
+    pipe = MagicMock()
+    pipe.__aenter__.return_value = pipe
+    pipe.execute = AsyncMock()
+    client.market_state.redis = MagicMock(pipeline=MagicMock(return_value=pipe))
+    assert await client.market_state.publish() == 1
+    mapping = pipe.hset.call_args.kwargs['mapping']
+    assert json.loads(mapping['btcusdt'])['bid_qty'] == '1.5'
+    assert not client.market_state.dirty
+
+
+def test_derive_cross(settings):
+    """Тест синтетических кросс-курсов через пары к USDT"""
+    settings.MARKET_STATE_CROSS_VIA = 'usdt'
+    states = {
+        'ethusdt': {'price': '3000', 'bid': '2999', 'ask': '3001'},
+        'btcusdt': {'price': '60000', 'bid': '59990', 'ask': '60010'},
+    }
+
+    cross = derive_cross('eth', 'btc', states)
+    assert cross['price'] == pytest.approx(0.05)
+    assert cross['bid'] == pytest.approx(2999 / 60010)
+    assert cross['ask'] == pytest.approx(3001 / 59990)
+    assert cross['legs'] == ['ethusdt', 'btcusdt']
+    assert derive_cross('sol', 'btc', states) is None
+
+    matrix = cross_matrix(['btc', 'eth', 'usdt'], states)
+    assert matrix['btc']['eth'] == pytest.approx(20)
+    assert matrix['usdt']['btc'] == pytest.approx(1 / 60000)
+
+
+def test_snapshot_view(settings):
+    """Тест получения снимка нескольких пар и кросс-курса одним запросом"""
+    settings.MARKET_STATE_CROSS_VIA = 'usdt'
+    states = {
+        'ethusdt': {'symbol': 'ethusdt', 'price': '3000', 'updated_at': 1},
+        'btcusdt': {'symbol': 'btcusdt', 'price': '60000', 'updated_at': 1},
+    }
+    snapshot = MagicMock()
+    snapshot.read.side_effect = lambda symbols=None: {
+        symbol: dict(states[symbol]) for symbol in (symbols or states) if symbol in states
+    }
+
+    client = APIClient()
+    with patch('crypto_stream.views.get_market_snapshot', return_value=snapshot):
+        response = client.get(reverse('snapshot-list'), {'symbols': 'ethusdt,xrpusdt', 'cross': 'eth/btc'})
+        invalid = client.get(reverse('snapshot-list'), {'cross': 'ethbtc'})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['pairs']['ethusdt']['price'] == '3000'
+    assert response.data['pairs']['xrpusdt'] is None
+    assert 'btcusdt' not in response.data['pairs']
+    assert response.data['crosses']['eth/btc']['price'] == pytest.approx(0.05)
+    # Пары запрошенных символов и ноги кросс-курса читаются одной командой
+    snapshot.read.assert_called_once()
+    assert invalid.status_code == status.HTTP_400_BAD_REQUEST
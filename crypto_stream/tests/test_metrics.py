@@ -0,0 +1,120 @@
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from crypto_stream.services.binance_client import BinanceWebsocketClient
+from crypto_stream.services.metrics import Counter, Gauge, Histogram, Registry
+from crypto_stream.services.latency import LatencyTracker
+
+
+def test_metrics_exposition_format():
+    """Тест текстового представления метрик в формате Prometheus"""
+    registry = Registry()
+    frames = Counter('frames_total', 'Frames received', ['symbol'], registry=registry)
+    depth = Gauge('buffer_rows', 'Buffered rows', registry=registry)
+    latency = Histogram('latency_seconds', 'Latency', buckets=(0.1, 1), registry=registry)
+
+    frames.labels('btcusdt').inc()
+    frames.labels(symbol='btcusdt').inc(2)
+    depth.set(5)
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(3)
+
+    text = registry.render()
+    assert '# TYPE frames_total counter' in text
+    assert 'frames_total{symbol="btcusdt"} 3' in text
+    assert 'buffer_rows 5' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert 'latency_seconds_count 3' in text
+
+
+@pytest.mark.asyncio
+async def test_process_message_metrics():
+    """Тест учета принятых кадров и ошибок разбора"""
+    client = BinanceWebsocketClient()
+    message = json.dumps({
+        "e": "trade", "E": int(timezone.now().timestamp() * 1000), "s": "BTCUSDT",
+        "p": "50000.00", "q": "0.01", "T": int(timezone.now().timestamp() * 1000),
+        "t": 1, "b": 2, "a": 3, "m": True
+    })
+
+    with patch.object(client.channel_layer, 'group_send', new=AsyncMock()):
+        await client.process_message(message)
+        await client.process_message('not json')
+
+    # Метрики доступны на эндпоинте /metrics
+    response = Client().get(reverse('metrics'))
+    assert response.status_code == 200
+    text = response.content.decode()
+    assert 'binance_messages_parsed_total{symbol="btcusdt",event="trade"}' in text
+    assert 'binance_parse_errors_total' in text
+    assert 'ingest_group_send_seconds_count' in text
+
+
+def test_latency_tracker_percentiles():
+    """Тест расчета перцентилей задержки по этапам"""
+    tracker = LatencyTracker(local=True)
+    for ms in range(1, 101):
+        tracker.record('broadcast_to_deliver', ms / 1000)
+    tracker.record('exchange_to_receive', -0.5)  # Расхождение часов не дает отрицательных значений
+
+    stats = tracker.percentiles()
+    assert stats['broadcast_to_deliver']['count'] == 100
+    # Значения — верхние границы корзин с шагом 10%
+    assert stats['broadcast_to_deliver']['p50_ms'] == pytest.approx(51.0, rel=0.1)
+    assert stats['broadcast_to_deliver']['p99_ms'] == pytest.approx(100.0, rel=0.1)
+    assert stats['exchange_to_receive']['max_ms'] == 0.1
+    assert 'broadcast_to_echo' not in stats
+
+
+@pytest.mark.asyncio
+async def test_latency_counters_aggregated_in_redis():
+    """Тест отправки счетчиков процесса в Redis и сложения счетчиков разных процессов"""
+    tracker = LatencyTracker()
+    tracker.record('receive_to_broadcast', 0.002)
+    tracker.record('receive_to_broadcast', 0.002)
+    pipe = MagicMock()
+    pipe.__aenter__.return_value = pipe
+    pipe.execute = AsyncMock()
+    tracker.redis = MagicMock(pipeline=MagicMock(return_value=pipe))
+
+    assert await tracker.publish() == 1
+    key, field, count = pipe.hincrby.call_args.args
+    assert key.startswith('latency:') and field.startswith('receive_to_broadcast:') and count == 2
+    assert tracker.counts == {}
+
+    # Счетчики двух процессов за разные минуты окна складываются
+    reader = MagicMock()
+    reader.__enter__.return_value = reader
+    reader.execute.return_value = [{field.encode(): b'2'}, {field.encode(): b'3'}, {}, {}, {}]
+    tracker.reader = MagicMock(pipeline=MagicMock(return_value=reader))
+    stats = tracker.percentiles()
+    assert stats['receive_to_broadcast']['count'] == 5
+    assert stats['receive_to_broadcast']['p50_ms'] == pytest.approx(2.0, rel=0.1)
+
+
+@pytest.mark.asyncio
+async def test_trade_latency_stamps(settings):
+    """Тест отметок времени события, получения и отправки в обновлении цены"""
+    settings.LATENCY_TRACING = True
+    client = BinanceWebsocketClient()
+    event_time = int(timezone.now().timestamp() * 1000)
+    message = json.dumps({
+        "e": "trade", "E": event_time, "s": "BTCUSDT", "p": "50000.00", "q": "0.01",
+        "T": event_time, "t": 1, "b": 2, "a": 3, "m": True
+    })
+
+    with patch.object(client.channel_layer, 'group_send', new=AsyncMock()) as mock_group_send:
+        await client.process_message(message)
+
+    event = mock_group_send.call_args.args[1]
+    payload = json.loads(event['text'])
+    assert payload['event_time'] == event_time
+    assert payload['received_at'] <= payload['broadcast_at']
+    assert event['broadcast_at'] == payload['broadcast_at']
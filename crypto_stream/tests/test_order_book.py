@@ -0,0 +1,155 @@
+import json
+import pytest
+from decimal import Decimal
+from unittest.mock import AsyncMock, MagicMock, patch
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.urls import re_path, reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from crypto_stream.consumers import OrderBookConsumer
+from crypto_stream.services.market_state import BOOKS_KEY, MarketSnapshot, MarketState
+from crypto_stream.services.order_book import (
+    OrderBook, OrderBookManager, OrderBookOutOfSync, FixtureSnapshotSource
+)
+
+
+SNAPSHOT = {
+    'lastUpdateId': 100,
+    'bids': [['49999.00', '1.0'], ['49998.00', '2.0'], ['49990.00', '5.0']],
+    'asks': [['50001.00', '1.5'], ['50002.00', '0.5']],
+}
+
+
+def depth_event(first_id, final_id, bids=(), asks=()):
+    """Формирование события depthUpdate"""
+    return {
+        'e': 'depthUpdate',
+        's': 'BTCUSDT',
+        'U': first_id,
+        'u': final_id,
+        'b': [list(level) for level in bids],
+        'a': [list(level) for level in asks],
+    }
+
+
+def test_order_book_snapshot_and_diff():
+    """Тест применения снимка и инкрементальных обновлений стакана"""
+    book = OrderBook('btcusdt')
+    book.apply_snapshot(SNAPSHOT)
+
+    # Событие, полностью учтенное в снимке, пропускается
+    assert book.apply_diff(depth_event(90, 100, bids=[('1.00', '1.0')])) is False
+
+    # Первое событие перекрывает lastUpdateId + 1
+    assert book.apply_diff(depth_event(95, 105, bids=[('50000.00', '0.3'), ('49999.00', '0')])) is True
+    assert book.best_bid() == (Decimal('50000.00'), Decimal('0.3'))
+
+    # Последующие события должны идти без разрывов
+    book.apply_diff(depth_event(106, 110, asks=[('50001.00', '0')]))
+    assert book.best_ask() == (Decimal('50002.00'), Decimal('0.5'))
+
+    top = book.top(2)
+    assert top['last_update_id'] == 110
+    assert top['bids'] == [['50000.00', '0.3'], ['49998.00', '2.0']]
+    assert top['asks'] == [['50002.00', '0.5']]
+
+    # Разрыв последовательности требует повторной синхронизации
+    with pytest.raises(OrderBookOutOfSync):
+        book.apply_diff(depth_event(115, 120))
+
+
+@pytest.mark.asyncio
+async def test_order_book_manager_sync_from_fixture():
+    """Тест синхронизации стакана по снимку из фикстуры и буферизованным событиям"""
+    manager = OrderBookManager(snapshot_source=FixtureSnapshotSource({'btcusdt': SNAPSHOT}), depth_limit=100)
+    manager.on_update = AsyncMock()
+
+    # События до загрузки снимка буферизуются и применяются после него
+    await manager.handle_diff(depth_event(95, 101, bids=[('50000.00', '1.0')]))
+    await manager.sync_tasks['btcusdt']
+
+    book = manager.get('btcusdt')
+    assert book is not None
+    assert book.last_update_id == 101
+    assert book.best_bid() == (Decimal('50000.00'), Decimal('1.0'))
+
+    # Разрыв сбрасывает стакан и запускает новую синхронизацию
+    await manager.handle_diff(depth_event(150, 160))
+    assert manager.get('btcusdt') is None
+    assert manager.on_update.await_count == 1
+
+    # Снимок из фикстуры старше буферизованного события, синхронизация не удается
+    assert await manager.sync_tasks['btcusdt'] is False
+    assert manager.get('btcusdt') is None
+
+
+@pytest.mark.asyncio
+async def test_order_book_published_with_market_state():
+    """Тест публикации верхних уровней стакана в Redis и снятия рассинхронизированного стакана"""
+    book = OrderBook('btcusdt')
+    book.apply_snapshot(SNAPSHOT)
+    state = MarketState()
+    pipe = MagicMock()
+    pipe.__aenter__.return_value = pipe
+    pipe.execute = AsyncMock()
+    state.redis = MagicMock(pipeline=MagicMock(return_value=pipe))
+
+    state.update_book(book)
+    assert await state.publish() == 1
+    published = json.loads(pipe.hset.call_args.kwargs['mapping']['btcusdt'])
+    assert published['last_update_id'] == 100 and published['bids'][0] == ['49999.00', '1.0']
+
+    # Неизменившийся стакан повторно не публикуется
+    pipe.reset_mock()
+    assert await state.publish() == 0
+    pipe.hset.assert_not_called()
+
+    # Рассинхронизированный стакан удаляется из хэша
+    book.reset()
+    await state.publish()
+    pipe.hdel.assert_called_once_with(BOOKS_KEY, 'btcusdt')
+
+
+def test_order_book_view():
+    """Тест получения верхних уровней стакана, опубликованного инжестором, через REST API"""
+    book = OrderBook('btcusdt')
+    book.apply_snapshot(SNAPSHOT)
+    books = {'btcusdt': json.dumps(book.top(100))}
+    snapshot = MarketSnapshot.__new__(MarketSnapshot)
+    snapshot.redis = MagicMock(hget=MagicMock(side_effect=lambda key, symbol: books.get(symbol)))
+
+    client = APIClient()
+    url = reverse('order-book-detail', args=['btcusdt'])
+    with patch('crypto_stream.views.get_market_snapshot', return_value=snapshot):
+        response = client.get(url, {'depth': 1})
+        missing = client.get(reverse('order-book-detail', args=['ethusdt']))
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data['best_bid'] == ['49999.00', '1.0']
+    assert response.data['bids'] == [['49999.00', '1.0']]
+    assert response.data['asks'] == [['50001.00', '1.5']]
+    assert missing.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+
+
+@pytest.mark.asyncio
+async def test_order_book_consumer_sends_published_book(settings):
+    """Тест отправки опубликованного стакана при подключении в процессе без инжестора"""
+    settings.ORDER_BOOK_PAIRS = ['btcusdt']
+    settings.ORDER_BOOK_BROADCAST_LEVELS = 1
+    book = OrderBook('btcusdt')
+    book.apply_snapshot(SNAPSHOT)
+    snapshot = MarketSnapshot.__new__(MarketSnapshot)
+    snapshot.redis = MagicMock(hget=MagicMock(return_value=json.dumps({**book.top(100), 'updated_at': 1})))
+    application = URLRouter([re_path(r'ws/depth/(?P<symbol>\w+)/$', OrderBookConsumer.as_asgi())])
+
+    with patch('crypto_stream.consumers.get_market_snapshot', return_value=snapshot):
+        communicator = WebsocketCommunicator(application, '/ws/depth/btcusdt/')
+        connected, _ = await communicator.connect()
+        assert connected
+        message = await communicator.receive_json_from()
+        await communicator.disconnect()
+
+    assert message['type'] == 'depth_update' and message['last_update_id'] == 100
+    assert message['bids'] == [['49999.00', '1.0']] and 'updated_at' not in message
@@ -0,0 +1,100 @@
+import pytest
+from unittest.mock import patch
+from decimal import Decimal
+from datetime import datetime, timedelta, timezone
+from django.db.models.query import QuerySet
+from django.urls import reverse
+from django.utils import timezone as django_timezone
+
+from crypto_stream.models import CryptoPair, PairStats, PriceUpdate
+from crypto_stream.services.binance_client import BinanceWebsocketClient
+from crypto_stream.services.pair_stats import archive_pair_stats, rebuild_pair_stats, update_pair_stats
+
+
+def trade(trade_id, price, timestamp, quantity='0.5'):
+    return {
+        'price': Decimal(price), 'timestamp': timestamp, 'trade_id': trade_id, 'quantity': Decimal(quantity),
+        'buyer_order_id': 1, 'seller_order_id': 2, 'is_buyer_maker': False,
+    }
+
+
+@pytest.mark.django_db
+def test_flush_updates_pair_stats():
+    """Тест обновления статистики пары при каждой записи сделок и при архивации"""
+    pair = CryptoPair.objects.create(symbol='btcusdt')
+    client = BinanceWebsocketClient(record_frames=False, pipeline=False)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    client.write_price_updates({'btcusdt': [trade(1, '100', start), trade(2, '101', start + timedelta(seconds=5))]})
+    # Поздняя сделка не меняет последнюю цену
+    client.write_price_updates({'btcusdt': [
+        trade(4, '103', start + timedelta(seconds=10)), trade(3, '99', start - timedelta(seconds=5), '1.5'),
+    ]})
+
+    # Повторно полученные сделки (догрузка, повтор спула) не записываются и не учитываются
+    assert client.write_price_updates({'btcusdt': [
+        trade(2, '101', start + timedelta(seconds=5)), trade(4, '103', start + timedelta(seconds=10), '9'),
+        trade(4, '103', start + timedelta(seconds=10), '9'),
+    ]}) == 0
+    assert PriceUpdate.objects.filter(pair=pair).count() == 4
+
+    stats = PairStats.objects.get(pair=pair)
+    assert stats.trade_count == 4
+    assert stats.first_trade_at == start - timedelta(seconds=5)
+    assert stats.last_trade_at == start + timedelta(seconds=10)
+    assert stats.last_price == Decimal('103')
+    assert stats.last_trade_id == 4
+    assert stats.volume == Decimal('3.0')
+
+    archive_pair_stats(pair, 3)
+    stats.refresh_from_db()
+    assert (stats.trade_count, stats.archived_count) == (1, 3)
+
+    # Пересчет по таблицам дает ту же статистику строк в PriceUpdate
+    PairStats.objects.all().delete()
+    rebuild_pair_stats()
+    stats = PairStats.objects.get(pair=pair)
+    assert (stats.trade_count, stats.last_trade_id, stats.last_price) == (4, 4, Decimal('103'))
+
+
+@pytest.mark.django_db
+def test_pair_stats_created_concurrently():
+    """Тест гонки создания: строку пары успел создать другой процесс после неудачного UPDATE"""
+    pair = CryptoPair.objects.create(symbol='btcusdt')
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    update = QuerySet.update
+    calls = []
+
+    def racing_update(queryset, **changes):
+        if not calls:
+            calls.append(PairStats.objects.create(pair=pair))
+            return 0
+        return update(queryset, **changes)
+
+    with patch.object(QuerySet, 'update', racing_update):
+        update_pair_stats(pair, [trade(1, '100', start), trade(2, '101', start + timedelta(seconds=5))])
+
+    stats = PairStats.objects.get(pair=pair)
+    assert (stats.trade_count, stats.last_trade_id, stats.last_price) == (2, 2, Decimal('101'))
+
+
+@pytest.mark.django_db
+def test_stats_api_and_health(client, settings):
+    """Тест API статистики и проверки поступления сделок"""
+    settings.HEALTH_MAX_TRADE_AGE = 60
+    fresh = CryptoPair.objects.create(symbol='btcusdt')
+    stale = CryptoPair.objects.create(symbol='ethusdt')
+    now = django_timezone.now()
+    PairStats.objects.create(pair=fresh, trade_count=10, last_trade_at=now, last_price=Decimal('50000'))
+    PairStats.objects.create(pair=stale, trade_count=5, last_trade_at=now - timedelta(minutes=5))
+
+    response = client.get(reverse('pair-stats-detail', args=['btcusdt']))
+    assert response.status_code == 200
+    assert response.json()['trade_count'] == 10
+
+    response = client.get(reverse('health'))
+    assert response.status_code == 503
+    assert response.json()['pairs']['ethusdt']['stale']
+
+    CryptoPair.objects.filter(symbol='ethusdt').update(is_active=False)
+    assert client.get(reverse('health')).status_code == 200
@@ -0,0 +1,75 @@
+import json
+import time
+import queue
+import pytest
+from unittest.mock import MagicMock
+from asgiref.sync import sync_to_async
+
+from crypto_stream.models import CryptoPair, PriceUpdate
+from crypto_stream.services.pipeline import IngestPipeline, PipelineWorker, frame_symbol
+
+
+def trade_frame(symbol, trade_id):
+    return json.dumps({
+        "e": "trade", "E": 1672515782136, "s": symbol.upper(), "t": trade_id, "p": "50000.00",
+        "q": "0.01", "b": 1, "a": 2, "T": 1672515782136, "m": True
+    }, separators=(',', ':'))
+
+
+@pytest.mark.asyncio
+async def test_pipeline_partitions_frames_by_symbol():
+    """Тест распределения кадров между обработчиками с сохранением порядка внутри пары"""
+    pipeline = IngestPipeline(MagicMock(cluster=None), workers=2)
+    frames = [trade_frame(symbol, trade_id) for trade_id in range(5) for symbol in ('btcusdt', 'ethusdt', 'solusdt')]
+
+    assert frame_symbol(frames[0]) == 'btcusdt'
+    assert frame_symbol(json.dumps({"e": "trade", "s": "ETHUSDT"})) == 'ethusdt'
+    for frame in frames:
+        assert await pipeline.dispatch(frame, 1.0)
+    # Ответы на управляющие сообщения обрабатывает основной процесс
+    assert not await pipeline.dispatch('{"result":null,"id":1}', 1.0)
+    await pipeline.send_all()
+
+    received = {}
+    for index in {pipeline.partition(symbol) for symbol in ('btcusdt', 'ethusdt', 'solusdt')}:
+        received[index] = [message for _, message in pipeline.queues[index].get(timeout=5)]
+    for symbol in ('btcusdt', 'ethusdt', 'solusdt'):
+        expected = [frame for frame in frames if frame_symbol(frame) == symbol]
+        assert [frame for frame in received[pipeline.partition(symbol)] if frame_symbol(frame) == symbol] == expected
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_pipeline_worker_persists_on_flush():
+    """Тест обработчика: разбор пачки, запись по запросу основного процесса и остановка"""
+    await sync_to_async(CryptoPair.objects.create)(symbol='btcusdt')
+    frames, acks = queue.Queue(), queue.Queue()
+    frames.put([(time.time(), trade_frame('btcusdt', 1)), (time.time(), trade_frame('btcusdt', 2))])
+    frames.put(('flush', 1))
+    frames.put(None)
+
+    await PipelineWorker(0, frames, acks, {'broadcast': False}).run()
+
+    assert acks.get_nowait() == 1
+    trade_ids = await sync_to_async(list)(PriceUpdate.objects.order_by('trade_id').values_list('trade_id', flat=True))
+    assert trade_ids == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_pipeline_flush_and_stop_with_stuck_worker():
+    """Тест обработчика, не читающего очередь: flush завершается по таймауту, stop не ждет его"""
+    pipeline = IngestPipeline(MagicMock(cluster=None), workers=1)
+    pipeline.queues = [queue.Queue(1)]
+    pipeline.queues[0].put_nowait([])
+
+    started = time.monotonic()
+    assert not await pipeline.flush(timeout=0.2)
+    assert time.monotonic() - started < 2
+
+    dead = MagicMock(is_alive=MagicMock(return_value=False))
+    dead.name = 'ingest-worker-0'
+    pipeline.processes = [dead]
+    await pipeline.stop()
+    dead.terminate.assert_called_once()
+    dead.join.assert_not_called()
+    assert pipeline.processes == []
@@ -0,0 +1,97 @@
+import os
+import time
+import signal
+import asyncio
+import threading
+
+import pytest
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from crypto_stream.services.metrics import HOT_PATH_DURATION
+from crypto_stream.services.profiling import SamplingProfiler, hot_path
+
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_sampling_profiler_collapsed_stacks(tmp_path):
+    """Тест выборки: стек нагруженного потока в свернутом виде и запись в файл"""
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_loop, args=(stop,), name='busy')
+    worker.start()
+    profiler = SamplingProfiler(interval=0.002, max_depth=64, max_stacks=1000)
+    profiler.start()
+    time.sleep(0.2)
+    profiler.stop()
+    stop.set()
+    worker.join()
+
+    assert not profiler.running and SamplingProfiler.active == 0
+    lines = profiler.collapsed().splitlines()
+    busy = [line for line in lines if line.startswith('busy;')]
+    assert busy and 'busy_loop (crypto_stream/tests/test_profiling.py:' in busy[0]
+    stack, count = busy[0].rsplit(' ', 1)
+    assert int(count) > 0 and stack.split(';')[-1].startswith('busy_loop')
+
+    path = profiler.dump('test', directory=str(tmp_path))
+    assert open(path).read().splitlines() == lines
+    assert profiler.collapsed() == ''
+
+
+def test_hot_path_measured_only_while_profiling():
+    """Тест замера горячего участка: метрика пишется только при запущенном профилировщике"""
+    @hot_path('test_path')
+    def handler(value):
+        return value * 2
+
+    histogram = HOT_PATH_DURATION.labels('test_path')
+    assert handler(2) == 4 and sum(histogram.counts) == 0
+
+    profiler = SamplingProfiler(interval=0.05, max_depth=8, max_stacks=10)
+    profiler.start()
+    try:
+        assert handler(3) == 6
+    finally:
+        profiler.stop()
+    assert sum(histogram.counts) == 1
+
+
+@pytest.mark.asyncio
+async def test_signal_handler_runs_in_event_loop():
+    """Тест SIGUSR2: обработчик вызывается циклом событий, а не посреди корутины"""
+    loop = asyncio.get_running_loop()
+    profiler = SamplingProfiler(interval=0.05, max_depth=8, max_stacks=10)
+    profiler.install_signal_handler('test', loop)
+    try:
+        os.kill(os.getpid(), signal.SIGUSR2)
+        assert not profiler.running  # Сигнал обрабатывается на следующей итерации цикла
+        await asyncio.sleep(0.01)
+        assert profiler.running
+    finally:
+        loop.remove_signal_handler(signal.SIGUSR2)
+        profiler.stop()
+
+
+class ProfileViewTests(APITestCase):
+    """Тесты /profile"""
+
+    def test_profile_requires_staff(self):
+        """Тест выборки по запросу администратора"""
+        url = reverse('profile')
+        response = self.client.get(url, {'seconds': 0.1})
+        self.assertEqual(response.status_code, 302)
+
+        admin = get_user_model().objects.create_user('admin', password='secret', is_staff=True)
+        self.client.force_login(admin)
+        response = self.client.get(url, {'seconds': 0.1})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('MainThread;', response.content.decode())
+
+        for seconds in ('nan', 'inf', '-inf', 'ten'):
+            response = self.client.get(url, {'seconds': seconds})
+            self.assertEqual(response.status_code, 400)
@@ -0,0 +1,85 @@
+import pytest
+from decimal import Decimal
+from unittest.mock import patch
+from channels.testing import WebsocketCommunicator
+from channels.routing import URLRouter
+from django.urls import re_path, reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from crypto_stream.consumers import CryptoConsumer
+from crypto_stream.models import CryptoPair, PriceUpdate
+from crypto_stream.services.rate_limit import AsyncRateLimiter, RateLimiter, history_cost
+
+
+def test_token_buckets_and_cost():
+    """Тест корзин: запрос проходит, только если токенов хватает во всех корзинах клиента"""
+    limiter = RateLimiter(limits={'connection': (10, 1), 'ip': (3, 1)}, local=True)
+    client = {'connection': 'conn-1', 'ip': '10.0.0.1', 'api_key': None}
+
+    assert [limiter.acquire(client, 1) for _ in range(3)] == [0, 0, 0]
+    # Более строгая корзина IP исчерпана, хотя в корзине соединения токены есть
+    assert limiter.acquire(client, 1) == pytest.approx(1, abs=0.01)
+    assert limiter.acquire({'ip': '10.0.0.2'}, 1) == 0
+
+    # Запрос дороже емкости корзины выполняется при полной корзине и оставляет долг
+    assert limiter.acquire({'ip': '10.0.0.3'}, 30) == 0
+    assert limiter.acquire({'ip': '10.0.0.3'}, 1) == pytest.approx(28, abs=0.01)
+
+    # Время запросов к БД списывается без проверки
+    limiter.charge({'ip': '10.0.0.2'}, 5)
+    assert limiter.acquire({'ip': '10.0.0.2'}, 1) == pytest.approx(4, abs=0.01)
+
+    assert history_cost(1000, 86400) == 3
+    assert history_cost(50) == pytest.approx(1.05)
+
+
+class HistoryRateLimitTests(APITestCase):
+    """Тесты ограничения запросов /api/history/"""
+
+    def setUp(self):
+        pair = CryptoPair.objects.create(symbol='btcusdt')
+        PriceUpdate.objects.create(
+            pair=pair, price=Decimal('50000.00'), timestamp=timezone.now(), trade_id=1, quantity=Decimal('0.01')
+        )
+
+    def test_history_returns_429(self):
+        """Тест ответа 429 с Retry-After после исчерпания корзины IP"""
+        limiter = RateLimiter(limits={'ip': (3, 0.5), 'api_key': (100, 1)}, local=True)
+        url = reverse('price-history-detail', args=['btcusdt'])
+        with patch('crypto_stream.views.get_rate_limiter', return_value=limiter):
+            # Стоимость: 1 + 1000 строк / 1000 + сутки интервала = 3 токена
+            response = self.client.get(url, {'limit': 1000}, HTTP_X_API_KEY='key')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+            response = self.client.get(url, {'limit': 1}, HTTP_X_API_KEY='key')
+            self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            self.assertGreater(int(response['Retry-After']), 0)
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_websocket_history_rate_limit():
+    """Тест сообщения об ошибке 429 на запрос истории через WebSocket"""
+    await CryptoPair.objects.acreate(symbol='btcusdt')
+    limiter = AsyncRateLimiter(limits={'connection': (2, 0.01)}, local=True)
+    application = URLRouter([
+        re_path(r'ws/crypto/(?P<symbol>\w+)/$', CryptoConsumer.as_asgi()),
+    ])
+
+    with patch('crypto_stream.consumers.get_async_rate_limiter', return_value=limiter):
+        communicator = WebsocketCommunicator(application, "/ws/crypto/btcusdt/")
+        connected, _ = await communicator.connect()
+        assert connected
+
+        await communicator.send_json_to({'type': 'history', 'limit': 5})
+        response = await communicator.receive_json_from()
+        assert response == {'type': 'history', 'data': []}
+
+        await communicator.send_json_to({'type': 'history', 'limit': 5})
+        response = await communicator.receive_json_from()
+        assert response['type'] == 'error' and response['code'] == 429
+        assert response['retry_after'] > 0
+
+        await communicator.disconnect()
@@ -0,0 +1,78 @@
+import json
+import pytest
+from unittest.mock import AsyncMock, patch
+from asgiref.sync import sync_to_async
+
+from crypto_stream.models import CryptoPair, PriceUpdate
+from crypto_stream.services.binance_client import BinanceWebsocketClient
+from crypto_stream.services.latency import LATENCY
+from crypto_stream.services.recorder import FrameRecorder, FrameReplayer, read_frames, segment_paths
+
+
+def trade_frame(trade_id):
+    """Кадр сделки в формате Binance"""
+    return json.dumps({
+        "e": "trade", "E": 1672515782136, "s": "BTCUSDT", "t": trade_id, "p": "50000.00", "q": "0.01",
+        "b": 88, "a": 50, "T": 1672515782136, "m": True
+    })
+
+
+def test_frame_recorder_rotates_segments(tmp_path):
+    """Тест записи кадров во вращаемые сегменты и их чтения в исходном порядке"""
+    recorder = FrameRecorder(str(tmp_path), segment_seconds=3600, segment_bytes=300)
+    for trade_id in range(10):
+        recorder.record(trade_frame(trade_id), received_at=1000 + trade_id)
+    recorder.close()
+
+    # Сегменты закрыты и не имеют суффикса .part
+    segments = segment_paths([str(tmp_path)])
+    assert len(segments) > 1
+    assert not list(tmp_path.glob('*.part'))
+
+    frames = list(read_frames([str(tmp_path)]))
+    assert [received_at for received_at, _ in frames] == [1000 + trade_id for trade_id in range(10)]
+    assert json.loads(frames[3][1])['t'] == 3
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db
+async def test_frame_replayer_feeds_client(tmp_path):
+    """Тест воспроизведения записанных кадров через обработчик инжестора"""
+    await sync_to_async(CryptoPair.objects.create)(symbol='btcusdt')
+    recorder = FrameRecorder(str(tmp_path))
+    for trade_id in range(5):
+        recorder.record(trade_frame(trade_id), received_at=1000 + trade_id * 0.01)
+    recorder.close()
+
+    LATENCY.reset()
+    client = BinanceWebsocketClient(record_frames=False)
+    replayer = FrameReplayer([str(tmp_path)], speed=10, flush_every=3)
+    with patch.object(client.channel_layer, 'group_send', new=AsyncMock()) as mock_group_send:
+        assert await replayer.replay(client) == 5
+
+    assert mock_group_send.await_count == 5
+    # Время событий записанных кадров в прошлом: задержки доставки не учитываются
+    assert LATENCY.counts == {}
+    assert 'event_time' not in mock_group_send.await_args.args[1]
+    trade_ids = await sync_to_async(list)(PriceUpdate.objects.order_by('trade_id').values_list('trade_id', flat=True))
+    assert trade_ids == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_frame_replayer_writes_through_spool(settings, tmp_path):
+    """Тест воспроизведения со спулом: буфер цен переносится в спул и записывается в БД"""
+    settings.SPOOL_DIR = str(tmp_path / 'spool')
+    await sync_to_async(CryptoPair.objects.create)(symbol='btcusdt')
+    recorder = FrameRecorder(str(tmp_path / 'frames'))
+    for trade_id in range(5):
+        recorder.record(trade_frame(trade_id), received_at=1000 + trade_id * 0.01)
+    recorder.close()
+
+    client = BinanceWebsocketClient(record_frames=False)
+    client.broadcast = AsyncMock()
+    assert await FrameReplayer([str(tmp_path / 'frames')], flush_every=3).replay(client) == 5
+
+    trade_ids = await sync_to_async(list)(PriceUpdate.objects.order_by('trade_id').values_list('trade_id', flat=True))
+    assert trade_ids == [0, 1, 2, 3, 4]
+    assert client.price_buffer == {} and not client.spool.has_pending()
@@ -0,0 +1,83 @@
+import json
+import pytest
+from decimal import Decimal
+from datetime import datetime, timezone
+from asgiref.sync import sync_to_async
+
+from crypto_stream.models import CryptoPair, PriceUpdate
+from crypto_stream.services.binance_client import BinanceWebsocketClient
+from crypto_stream.services.spool import TradeSpool
+
+
+def trade_rows(first, count):
+    return [{
+        'price': Decimal('50000.10'),
+        'timestamp': datetime(2024, 1, 1, tzinfo=timezone.utc),
+        'trade_id': trade_id,
+        'quantity': Decimal('0.5'),
+        'buyer_order_id': 1,
+        'seller_order_id': 2,
+        'is_buyer_maker': True,
+    } for trade_id in range(first, first + count)]
+
+
+def test_spool_drain_resumes_from_checkpoint(tmp_path):
+    """Тест передачи спула в БД: при ошибке записи позиция остается на начале пачки"""
+    spool = TradeSpool(str(tmp_path), segment_bytes=1024 * 1024, max_bytes=1024 * 1024)
+    assert spool.append({'btcusdt': trade_rows(1, 5)}) == 5
+    assert spool.append({'btcusdt': trade_rows(6, 5)}) == 5
+
+    written = []
+
+    def failing_write(buffer):
+        if written:
+            raise ConnectionError('database is down')
+        written.extend(row['trade_id'] for row in buffer['btcusdt'])
+
+    with pytest.raises(ConnectionError):
+        spool.drain(failing_write, batch_rows=4)
+    assert written == [1, 2, 3, 4]
+    assert spool.has_pending()
+
+    # Новый экземпляр (перезапуск процесса) продолжает с checkpoint
+    restarted = TradeSpool(str(tmp_path), segment_bytes=1024 * 1024, max_bytes=1024 * 1024)
+    rows = []
+    assert restarted.drain(lambda buffer: rows.extend(buffer['btcusdt']), batch_rows=4) == 6
+    assert [row['trade_id'] for row in rows] == list(range(5, 11))
+    assert rows[0]['price'] == Decimal('50000.10') and rows[0]['timestamp'] == datetime(2024, 1, 1, tzinfo=timezone.utc)
+    assert not restarted.has_pending()
+
+
+def test_spool_drops_oldest_segments_over_limit(tmp_path):
+    """Тест ограничения размера спула: удаляются самые старые сегменты"""
+    spool = TradeSpool(str(tmp_path), segment_bytes=1, max_bytes=600)
+    for first in range(0, 50, 5):
+        spool.append({'btcusdt': trade_rows(first, 5)})
+
+    assert spool.size() <= 600
+    rows = []
+    spool.drain(lambda buffer: rows.extend(buffer['btcusdt']))
+    trade_ids = [row['trade_id'] for row in rows]
+    assert trade_ids == list(range(50 - len(trade_ids), 50))
+
+
+@pytest.mark.asyncio
+@pytest.mark.django_db(transaction=True)
+async def test_client_writes_trades_through_spool(settings, tmp_path):
+    """Тест записи сделок клиентом через спул"""
+    settings.SPOOL_DIR = str(tmp_path)
+    await sync_to_async(CryptoPair.objects.create)(symbol='btcusdt')
+    client = BinanceWebsocketClient(record_frames=False)
+    client.broadcast = sync_to_async(lambda *args: None)
+    await client.process_message(json.dumps({
+        "e": "trade", "E": 1672515782136, "s": "BTCUSDT", "t": 7, "p": "50000.00",
+        "q": "0.01", "b": 1, "a": 2, "T": 1672515782136, "m": True
+    }))
+
+    await client.spool_buffer()
+    assert client.price_buffer == {} and client.spool.has_pending()
+
+    await client.flush()
+    trade_ids = await sync_to_async(list)(PriceUpdate.objects.values_list('trade_id', flat=True))
+    assert trade_ids == [7]
+    assert not client.has_pending_data()
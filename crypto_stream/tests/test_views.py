@@ -7,6 +7,7 @@ from rest_framework import status
 from rest_framework.test import APITestCase
 
 from crypto_stream.models import CryptoPair, PriceUpdate
+from crypto_stream.services.pair_stats import rebuild_pair_stats
 
 
 class CryptoPairViewSetTests(APITestCase):
@@ -35,6 +36,9 @@ class CryptoPairViewSetTests(APITestCase):
             quantity=Decimal('0.1')
         )
 
+        # Статистику пар ведет инжестор, для строк, созданных напрямую, она пересчитывается
+        rebuild_pair_stats()
+
     def test_list_pairs(self):
         """Тест получения списка пар"""
         url = reverse('cryptopair-list')
@@ -95,6 +99,27 @@ class PriceHistoryViewSetTests(APITestCase):
         timestamps = [item['timestamp'] for item in response.data]
         self.assertEqual(timestamps, sorted(timestamps, reverse=True))
 
+    def test_retrieve_downsampled_history(self):
+        """Тест прореженной истории: весь интервал в корзинах, а не последние limit сделок"""
+        url = reverse('price-history-detail', args=['btcusdt'])
+        now = timezone.now()
+        response = self.client.get(url, {
+            'start_time': (now - timezone.timedelta(minutes=9, seconds=30)).isoformat(),
+            'end_time': (now + timezone.timedelta(seconds=30)).isoformat(),
+            'max_points': 5,
+        })
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['resolution'], 120)
+        points = response.data['points']
+        self.assertEqual(len(points), 5)
+        self.assertEqual(sum(point['count'] for point in points), 10)
+        # Первая корзина: сделки 9 и 8 минут назад (цены 50009 и 50008)
+        self.assertEqual(Decimal(points[0]['open']), Decimal('50009'))
+        self.assertEqual(Decimal(points[0]['close']), Decimal('50008'))
+        self.assertEqual(Decimal(points[0]['high']), Decimal('50009'))
+        self.assertEqual(Decimal(points[-1]['close']), Decimal('50000'))
+
     def test_summary(self):
         """Тест получения сводки по всем парам"""
         # Создаем дополнительную пару с обновлениями цен
@@ -128,6 +153,9 @@ class PriceHistoryViewSetTests(APITestCase):
             quantity=Decimal('0.01')
         )
 
+        # Статистику пар ведет инжестор, для строк, созданных напрямую, она пересчитывается
+        rebuild_pair_stats()
+
         url = reverse('price-history-summary')
         response = self.client.get(url)
 
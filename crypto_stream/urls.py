@@ -6,6 +6,12 @@ from . import views
 router = DefaultRouter()
 router.register(r'pairs', views.CryptoPairViewSet)
 router.register(r'history', views.PriceHistoryViewSet, basename='price-history')
+router.register(r'indicators', views.IndicatorViewSet, basename='indicators')
+router.register(r'stats', views.PairStatsViewSet, basename='pair-stats')
+router.register(r'snapshot', views.SnapshotViewSet, basename='snapshot')
+router.register(r'orderbook', views.OrderBookViewSet, basename='order-book')
+router.register(r'alerts', views.PriceAlertViewSet, basename='alert')
+router.register(r'latency', views.LatencyViewSet, basename='latency')
 
 urlpatterns = [
     path('', include(router.urls)),
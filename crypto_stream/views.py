@@ -1,24 +1,53 @@
+import math
+import time
+import logging
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, JsonResponse
+from redis.exceptions import RedisError
 from rest_framework import viewsets, status
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
+from rest_framework.exceptions import Throttled
 from rest_framework.response import Response
 from django.utils import timezone
+from django.db.models import OuterRef, Subquery
 from django.shortcuts import get_object_or_404
 from datetime import timedelta
 
-from .models import CryptoPair, PriceUpdate
-from .serializers import CryptoPairSerializer, PriceUpdateSerializer, PriceHistorySerializer
+from .models import CryptoPair, PriceUpdate, PairStats, PriceAlert
+from .serializers import (
+    CryptoPairSerializer, PriceUpdateSerializer, PriceHistorySerializer, OrderBookRequestSerializer,
+    PriceAlertSerializer, IndicatorRequestSerializer, SnapshotRequestSerializer, PairStatsSerializer
+)
+from .services.archive import archive_cutoff, read_archived
+from .services.downsample import bucket_width, downsample_history
+from .services.alerts import notify_alert_changed
+from .services.market_state import get_market_snapshot, derive_cross, cross_matrix, parse_assets
+from .services.metrics import render_metrics
+from .services.latency import LATENCY
+from .services.profiling import get_profiler, profile_for
+from .services.rate_limit import get_rate_limiter, history_cost, request_identities
+
+logger = logging.getLogger(__name__)
 
 
 class CryptoPairViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet для просмотра информации о парах криптовалют"""
-    queryset = CryptoPair.objects.all()
+    queryset = CryptoPair.objects.select_related('stats')
     serializer_class = CryptoPairSerializer
 
     @action(detail=True, methods=['get'])
     def latest_price(self, request, pk=None):
         """Получение последней цены для пары криптовалют"""
         pair = self.get_object()
-        latest_price = PriceUpdate.objects.filter(pair=pair).order_by('-timestamp').first()
+        stats = getattr(pair, 'stats', None)
+        latest_price = None
+        if stats is not None and stats.last_trade_at is not None:
+            # Строка последней сделки ищется по индексу (pair, timestamp), без сортировки всех строк пары
+            latest_price = PriceUpdate.objects.filter(
+                pair=pair, timestamp=stats.last_trade_at
+            ).order_by('-id').first()
 
         if latest_price:
             serializer = PriceUpdateSerializer(latest_price)
@@ -44,7 +73,7 @@ class PriceHistoryViewSet(viewsets.ViewSet):
         # Валидация параметров запроса
         request_serializer = PriceHistorySerializer(data={
             'symbol': pk,
-            **request.query_params
+            **request.query_params.dict()
         })
 
         if not request_serializer.is_valid():
@@ -59,16 +88,65 @@ class PriceHistoryViewSet(viewsets.ViewSet):
         start_time = data.get('start_time', timezone.now() - timedelta(days=1))
         end_time = data.get('end_time', timezone.now())
         limit = data.get('limit', 100)
+        downsampled = 'max_points' in data or 'resolution' in data
+
+        # Стоимость запроса растет с числом строк ответа и длиной интервала
+        span = (end_time - start_time).total_seconds()
+        if downsampled:
+            width = bucket_width(start_time, end_time, data.get('max_points'), data.get('resolution'))
+            rows = math.ceil(max(span, 1) / width)
+        else:
+            rows = limit
+        limiter = get_rate_limiter()
+        identities = request_identities(request)
+        wait = limiter.check(identities, history_cost(rows, span), 'history')
+        if wait:
+            raise Throttled(wait=wait)
 
+        # Время запросов к БД списывается из корзин клиента после ответа
+        started = time.perf_counter()
+        try:
+            return self.history_response(symbol, data, start_time, end_time, limit, downsampled)
+        finally:
+            limiter.account(identities, time.perf_counter() - started, 'history')
+
+    def history_response(self, symbol, data, start_time, end_time, limit, downsampled):
+        """Ответ с историей цен пары (сделки или прореженные корзины)"""
         # Получение пары криптовалют
         pair = get_object_or_404(CryptoPair, symbol=symbol)
+        # Интервал старше горячего окна дополняется сделками из архива в обоих режимах
+        archived = start_time < archive_cutoff()
+
+        # Длинные интервалы отдаются прореженными по корзинам за весь интервал
+        if downsampled:
+            points, width = downsample_history(
+                pair, start_time, end_time, data.get('max_points'), data.get('resolution'), archived
+            )
+            return Response({
+                'symbol': symbol,
+                'start_time': start_time.isoformat(),
+                'end_time': end_time.isoformat(),
+                'resolution': width,
+                'points': [{
+                    **point,
+                    'time': point['time'].isoformat(),
+                    **{key: str(point[key]) for key in ('open', 'high', 'low', 'close', 'volume')},
+                } for point in points],
+            })
 
         # Получение истории цен
-        price_history = PriceUpdate.objects.filter(
+        price_history = list(PriceUpdate.objects.filter(
             pair=pair,
             timestamp__gte=start_time,
             timestamp__lte=end_time
-        ).order_by('-timestamp')[:limit]
+        ).order_by('-timestamp')[:limit])
+
+        if archived:
+            price_history = sorted(
+                price_history + read_archived(pair, start_time, end_time, limit),
+                key=lambda update: update.timestamp,
+                reverse=True
+            )[:limit]
 
         # Сериализация результатов
         serializer = PriceUpdateSerializer(price_history, many=True)
@@ -77,34 +155,246 @@ class PriceHistoryViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['get'])
     def summary(self, request):
         """Получение сводки по всем парам криптовалют"""
-        pairs = CryptoPair.objects.all()
+        # Текущая цена берется из PairStats, цена 24 часа назад — подзапросом в том же запросе
+        day_ago = timezone.now() - timedelta(days=1)
+        old_prices = PriceUpdate.objects.filter(
+            pair=OuterRef('pk'),
+            timestamp__lte=day_ago
+        ).order_by('-timestamp').values('price')[:1]
+        pairs = CryptoPair.objects.select_related('stats').annotate(old_price=Subquery(old_prices))
         result = []
 
         for pair in pairs:
-            latest = PriceUpdate.objects.filter(pair=pair).order_by('-timestamp').first()
-            if latest:
-                # Получение цены от 24 часов назад для расчета изменения
-                day_ago = timezone.now() - timedelta(days=1)
-                old_price = PriceUpdate.objects.filter(
-                    pair=pair,
-                    timestamp__lte=day_ago
-                ).order_by('-timestamp').first()
-
+            stats = getattr(pair, 'stats', None)
+            if stats is not None and stats.last_price is not None:
                 # Расчет изменения цены
                 price_change = None
                 price_change_percent = None
 
-                if old_price:
-                    price_change = latest.price - old_price.price
-                    price_change_percent = (price_change / old_price.price) * 100
+                if pair.old_price:
+                    price_change = stats.last_price - pair.old_price
+                    price_change_percent = (price_change / pair.old_price) * 100
 
                 result.append({
                     'symbol': pair.symbol,
-                    'current_price': str(latest.price),
-                    'last_update': latest.timestamp.isoformat(),
+                    'current_price': str(stats.last_price),
+                    'last_update': stats.last_trade_at.isoformat(),
                     'price_change_24h': str(price_change) if price_change is not None else None,
                     'price_change_percent_24h': round(price_change_percent,
                                                       2) if price_change_percent is not None else None
                 })
 
-        return Response(result)
\ No newline at end of file
+        return Response(result)
+
+
+class IndicatorViewSet(viewsets.ViewSet):
+    """ViewSet для расчета технических индикаторов по кэшированным рядам цен"""
+
+    def retrieve(self, request, pk=None):
+        """Получение SMA, EMA, RSI, полос Боллинджера и VWAP для пары"""
+        request_serializer = IndicatorRequestSerializer(data={
+            'symbol': pk,
+            **request.query_params.dict()
+        })
+
+        if not request_serializer.is_valid():
+            return Response(
+                request_serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # NumPy загружается при первом запросе индикаторов, а не при запуске веб-процесса
+        from .services.indicators import get_indicator_cache
+
+        data = request_serializer.validated_data
+        pair = get_object_or_404(CryptoPair, symbol=data['symbol'].lower())
+        series = get_indicator_cache().get(pair.symbol, data['interval'])
+
+        return Response(series.compute(
+            data['indicators'], data['period'], data['rsi_period'], data['width'], data['points']
+        ))
+
+
+class OrderBookViewSet(viewsets.ViewSet):
+    """ViewSet для получения стакана заявок, опубликованного инжестором в Redis"""
+
+    def retrieve(self, request, pk=None):
+        """Получение лучших цен и верхних уровней стакана для пары"""
+        request_serializer = OrderBookRequestSerializer(data={
+            'symbol': pk,
+            **request.query_params.dict()
+        })
+
+        if not request_serializer.is_valid():
+            return Response(
+                request_serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        data = request_serializer.validated_data
+        try:
+            book = get_market_snapshot().read_book(data['symbol'].lower(), data['depth'])
+        except RedisError as e:
+            logger.error(f"Failed to read order book: {e}")
+            book = None
+
+        if book is None:
+            return Response(
+                {"detail": "Order book is not available for this pair."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+
+        return Response(book)
+
+
+class PairStatsViewSet(viewsets.ReadOnlyModelViewSet):
+    """ViewSet для статистики сделок пар: одна строка на пару вместо агрегатов по PriceUpdate"""
+    queryset = PairStats.objects.select_related('pair').order_by('pair__symbol')
+    serializer_class = PairStatsSerializer
+    lookup_field = 'pair__symbol'
+    lookup_url_kwarg = 'symbol'
+
+
+class SnapshotViewSet(viewsets.ViewSet):
+    """ViewSet для снимка состояния рынка, поддерживаемого инжестором"""
+
+    def list(self, request):
+        """Последние цены, лучшие цены и 24-часовая статистика пар и синтетические кросс-курсы"""
+        request_serializer = SnapshotRequestSerializer(data=request.query_params.dict())
+
+        if not request_serializer.is_valid():
+            return Response(
+                request_serializer.errors,
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        data = request_serializer.validated_data
+        symbols = data.get('symbols')
+        crosses = data.get('cross', [])
+        assets = data.get('matrix', [])
+        via = settings.MARKET_STATE_CROSS_VIA
+
+        # Пары для кросс-курсов читаются тем же запросом, что и запрошенные пары
+        legs = {f"{asset}{via}" for pair in crosses for asset in parse_assets(pair)}
+        legs.update(f"{asset}{via}" for asset in assets)
+        try:
+            if symbols is None:
+                states = get_market_snapshot().read()
+            else:
+                states = get_market_snapshot().read(dict.fromkeys([*symbols, *sorted(legs)]))
+        except RedisError as e:
+            logger.error(f"Failed to read market snapshot: {e}")
+            return Response(
+                {"detail": "Market snapshot is not available."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+
+        now = int(timezone.now().timestamp() * 1000)
+        pairs = {}
+        for symbol in (symbols if symbols is not None else sorted(states)):
+            state = states.get(symbol)
+            if state is not None:
+                state['age_ms'] = now - state['updated_at']
+            pairs[symbol] = state
+
+        response = {'timestamp': now, 'pairs': pairs}
+        if crosses:
+            response['crosses'] = {pair: derive_cross(*parse_assets(pair), states, via) for pair in crosses}
+        if assets:
+            response['matrix'] = cross_matrix(assets, states, via)
+        return Response(response)
+
+
+class PriceAlertViewSet(viewsets.ModelViewSet):
+    """ViewSet для управления правилами оповещений о цене текущего пользователя"""
+    queryset = PriceAlert.objects.select_related('pair')
+    serializer_class = PriceAlertSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        """Правила пользователя с фильтрацией по паре и активности"""
+        queryset = super().get_queryset().filter(owner=self.request.user)
+        symbol = self.request.query_params.get('symbol')
+        if symbol:
+            queryset = queryset.filter(pair__symbol=symbol.lower())
+        is_active = self.request.query_params.get('is_active')
+        if is_active is not None:
+            queryset = queryset.filter(is_active=is_active.lower() == 'true')
+        return queryset
+
+    def perform_create(self, serializer):
+        serializer.save(owner=self.request.user)
+        self.notify_ingestor(serializer.instance.id)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.notify_ingestor(serializer.instance.id)
+
+    def perform_destroy(self, instance):
+        alert_id = instance.id
+        super().perform_destroy(instance)
+        self.notify_ingestor(alert_id)
+
+    def notify_ingestor(self, alert_id):
+        """Уведомление инжестора об изменении правила"""
+        try:
+            notify_alert_changed(alert_id)
+        except Exception as e:
+            # Изменение будет применено при перезапуске инжестора
+            logger.warning(f"Ingestor was not notified about alert {alert_id}: {e}")
+
+
+class LatencyViewSet(viewsets.ViewSet):
+    """ViewSet для просмотра перцентилей задержки доставки обновлений цен"""
+
+    def list(self, request):
+        """Перцентили задержек по этапам всех процессов за окно LATENCY_WINDOW"""
+        try:
+            return Response(LATENCY.percentiles())
+        except RedisError as e:
+            logger.error(f"Failed to read latency counters: {e}")
+            return Response(
+                {"detail": "Latency statistics are not available."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+
+
+def metrics(request):
+    """Метрики процесса в текстовом формате Prometheus"""
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4')
+
+
+def health(request):
+    """Проверка поступления сделок: возраст последней записанной сделки каждой активной пары"""
+    now = timezone.now()
+    pairs = {}
+    healthy = True
+    for symbol, last_trade_at in CryptoPair.objects.filter(is_active=True).values_list('symbol', 'stats__last_trade_at'):
+        age = (now - last_trade_at).total_seconds() if last_trade_at else None
+        stale = age is None or age > settings.HEALTH_MAX_TRADE_AGE
+        healthy = healthy and not stale
+        pairs[symbol] = {'last_trade_age': round(age, 3) if age is not None else None, 'stale': stale}
+    return JsonResponse({'status': 'ok' if healthy else 'stale', 'pairs': pairs}, status=200 if healthy else 503)
+
+
+@staff_member_required
+def profile(request):
+    """
+    Свернутые стеки веб-процесса для flamegraph.
+
+    При непрерывном профилировании возвращаются стеки, собранные с запуска или с
+    последнего запроса с reset=1; иначе выборка идет `seconds` секунд (по умолчанию 10).
+    """
+    profiler = get_profiler()
+    if profiler.running:
+        stacks = profiler.collapsed(reset=request.GET.get('reset') in ('1', 'true'))
+    else:
+        try:
+            seconds = float(request.GET.get('seconds', 10))
+        except ValueError:
+            seconds = math.nan
+        if not math.isfinite(seconds):
+            return HttpResponse('seconds must be a finite number', status=400, content_type='text/plain')
+        seconds = min(max(seconds, 0.01), settings.PROFILING_MAX_SECONDS)
+        stacks = profile_for(seconds)
+    return HttpResponse(stacks, content_type='text/plain; charset=utf-8')